@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the memoized CPE product extraction against the CpeParser-based one.
+
+Usage:
+    python3 scripts/bench_cpe.py [vulnerabilities.json ...]
+
+Defaults to src/data/vulnerabilities.json.
+
+Every record carrying a "vulnerabilityProduct" CPE list is used. Both
+implementations must return identical product lists; the script exits with a
+non-zero status otherwise.
+"""
+import json
+import pathlib
+import sys
+import timeit
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from cpeparser import CpeParser  # noqa: E402
+
+from data.cpe import cpe_product, extract_products  # noqa: E402
+
+DEFAULT_FILE = ROOT / "src" / "data" / "vulnerabilities.json"
+REPEAT = 5
+
+
+def products_found(product_cpes, cpe: CpeParser):
+    """ The previous implementation, kept here as the baseline """
+    products_found = []
+    for cpe_str in product_cpes:
+        result = cpe.parser(cpe_str)
+        prod = result['product']
+        if prod not in products_found:
+            products_found.append(prod)
+    return products_found
+
+
+def load_cpe_lists(paths):
+    cpe_lists = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as vuln_file:
+            records = json.load(vuln_file)
+        lists = [record["vulnerabilityProduct"] for record in records if record.get("vulnerabilityProduct")]
+        print(f"{path}: {len(records)} records, {len(lists)} with CPE lists")
+        cpe_lists.extend(lists)
+    return cpe_lists
+
+
+def bench(label, func):
+    best = min(timeit.repeat(func, number=1, repeat=REPEAT))
+    print(f"  {label:<32}{best * 1000:10.2f} ms")
+    return best
+
+
+def main(paths):
+    cpe_lists = load_cpe_lists(paths)
+    if not cpe_lists:
+        print("No CPE lists to benchmark")
+        return 1
+    parser = CpeParser()
+    total = sum(len(cpes) for cpes in cpe_lists)
+    print(f"{len(cpe_lists)} CPE lists, {total} CPE strings")
+
+    mismatches = [cpes for cpes in cpe_lists if products_found(cpes, parser) != extract_products(cpes)]
+    print(f"Result mismatches: {len(mismatches)}")
+
+    # All CPEs of the dataset as a single list, standing in for a CVE like the Linux kernel
+    merged = [cpe for cpes in cpe_lists for cpe in cpes]
+
+    def cold():
+        cpe_product.cache_clear()
+        for cpes in cpe_lists:
+            extract_products(cpes)
+
+    print("Per-CVE lists:")
+    baseline = bench("CpeParser + list dedup", lambda: [products_found(cpes, parser) for cpes in cpe_lists])
+    bench("fast path, cold cache", cold)
+    fast = bench("fast path, warm cache", lambda: [extract_products(cpes) for cpes in cpe_lists])
+    print(f"  speedup (warm): {baseline / fast:.1f}x")
+
+    print("Single merged list:")
+    baseline = bench("CpeParser + list dedup", lambda: products_found(merged, parser))
+    fast = bench("fast path, warm cache", lambda: extract_products(merged))
+    print(f"  speedup (warm): {baseline / fast:.1f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or [DEFAULT_FILE]))
@@ -0,0 +1,153 @@
+""" Versioned read-through cache of the GraphQL resolver results """
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """
+    A load in progress, shared by the concurrent lookups of the same key.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResolverCache:
+    """
+    Size-bounded LRU cache with a TTL, invalidated when the dataset version changes.
+
+    Values are keyed by resolver and arguments. The dataset version, bumped
+    by the ingestion job at the end of each load, is read at most every
+    version_interval seconds; when it changes every entry is dropped. Only
+    one load runs per key at a time: concurrent lookups of a key being
+    loaded wait for that load instead of issuing the same query. Cached
+    values are shared between requests and must not be mutated.
+    """
+
+    def __init__(self, read_version, max_entries: int = 256, ttl: float = 300, version_interval: float = 5):
+        """
+        Args:
+            read_version: Callable returning the current dataset version.
+            max_entries: Maximum number of cached results; the least recently used go first.
+            ttl: Seconds a result stays valid, whatever the dataset version.
+            version_interval: Seconds between two reads of the dataset version.
+        """
+        self.read_version = read_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_interval = version_interval
+        self.entries = OrderedDict()
+        self.version = None
+        self.version_checked_at = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._version_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, read_version):
+        """
+        Create the cache configured under "apiCache" in the general DynamoDB config.
+
+        Returns:
+            A ResolverCache, or None when the cache is disabled or not configured.
+        """
+        if not config or not config.get('enabled', True):
+            return None
+        return cls(read_version, config.get('maxEntries', 256), config.get('ttl', 300),
+                   config.get('versionInterval', 5))
+
+    def _version_fresh(self):
+        checked_at = self.version_checked_at
+        return checked_at is not None and time.monotonic() - checked_at < self.version_interval
+
+    def _check_version(self):
+        """
+        Re-read the dataset version when the last read is older than version_interval.
+        """
+        if self._version_fresh():
+            return self.version
+        with self._version_lock:
+            if self._version_fresh():
+                return self.version
+            version = self.read_version()
+            with self._lock:
+                if self.version_checked_at is not None and version != self.version:
+                    self.entries.clear()
+                    self.invalidations += 1
+                self.version = version
+                self.version_checked_at = time.monotonic()
+            return version
+
+    def get(self, key, load):
+        """
+        Get the cached value of a key, loading it on a miss.
+
+        Args:
+            key: Hashable key, e.g. the resolver name and its arguments.
+            load: Callable computing the value.
+
+        Returns:
+            The value.
+        """
+        version = self._check_version()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = load()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None and version == self.version:
+                    self._store(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def _store(self, key, value):
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Counters of the cache, with the share of lookups served without a query.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self.entries),
+                "hitRatio": (self.hits + self.coalesced) / lookups if lookups else 0.0
+            }
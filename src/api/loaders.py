@@ -0,0 +1,125 @@
+""" Per-request batching loaders for the GraphQL resolvers """
+import asyncio
+import threading
+
+
+class DataLoader:
+    """
+    Batches and caches key lookups for the lifetime of one GraphQL request.
+
+    Keys requested by load, or announced ahead of time with prime, are
+    collected and fetched together by a single batch_load call the next time
+    a value is needed, so resolving N nested objects costs a few batch
+    requests instead of N lookups. Each key is fetched at most once per
+    request; keys with no value resolve to None.
+
+    Async resolvers use load_async instead: the keys requested by the
+    resolvers scheduled together are collected until the event loop gets
+    to the dispatch, which fetches them with one batch_load call off the loop.
+    """
+
+    def __init__(self, batch_load):
+        """
+        Args:
+            batch_load: Callable taking a list of keys and returning a dict of the values found.
+        """
+        self.batch_load = batch_load
+        self.cache = {}
+        self.pending = {}
+        self.batches = 0
+        self._futures = {}
+        self._dispatch_scheduled = False
+        self._lock = threading.Lock()
+
+    def prime(self, keys):
+        """
+        Queue keys that are about to be loaded, so they are fetched in the same batch.
+        """
+        with self._lock:
+            for key in keys:
+                if key not in self.cache:
+                    self.pending[key] = None
+
+    def dispatch(self):
+        """
+        Fetch every queued key with one batch_load call.
+        """
+        with self._lock:
+            keys, self.pending = list(self.pending), {}
+        self._fetch(keys)
+
+    def _fetch(self, keys):
+        if not keys:
+            return
+        values = self.batch_load(keys)
+        with self._lock:
+            self.batches += 1
+            for key in keys:
+                self.cache[key] = values.get(key)
+
+    def load(self, key):
+        """
+        Get the value of a key, fetching it together with every queued key if needed.
+        """
+        if key not in self.cache:
+            self.prime([key])
+            self.dispatch()
+        return self.cache.get(key)
+
+    async def load_async(self, key, offload):
+        """
+        Get the value of a key, fetching it with the other keys requested in the same loop iteration.
+
+        Args:
+            key: The key to load.
+            offload: Coroutine function running a blocking callable off the event loop.
+        """
+        if key in self.cache:
+            return self.cache[key]
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            self.prime([key])
+            if not self._dispatch_scheduled:
+                self._dispatch_scheduled = True
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch_async(offload)))
+        return await future
+
+    async def _dispatch_async(self, offload):
+        self._dispatch_scheduled = False
+        with self._lock:
+            keys, self.pending = list(self.pending), {}
+        # The futures stay registered while in flight, so later loads of these keys wait for this fetch
+        futures = {key: self._futures[key] for key in keys if key in self._futures}
+        try:
+            await offload(self._fetch, keys)
+        except Exception as exc:  # pylint: disable=broad-except
+            for key, future in futures.items():
+                del self._futures[key]
+                future.set_exception(exc)
+            return
+        for key, future in futures.items():
+            del self._futures[key]
+            future.set_result(self.cache.get(key))
+
+    def load_many(self, keys):
+        """
+        Get the values of several keys with at most one batch_load call.
+        """
+        self.prime(keys)
+        self.dispatch()
+        return [self.cache.get(key) for key in keys]
+
+
+def context_loader(info, name, batch_load):
+    """
+    Get the loader called name of the current request, creating it on first use.
+
+    The loader lives in the request context, so nothing is shared between requests.
+    """
+    context = info.context
+    loader = context.get(name)
+    if loader is None:
+        loader = context.setdefault(name, DataLoader(batch_load))
+    return loader
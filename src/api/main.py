@@ -1,48 +1,236 @@
+import asyncio
 import os
 import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from ariadne.asgi import GraphQL
-from ariadne import QueryType, make_executable_schema, load_schema_from_path
+from ariadne import ObjectType, QueryType, make_executable_schema, load_schema_from_path
 from boto3.dynamodb.conditions import Attr, Key
-from dynamodb.dynamodb import DynamoDB, DynamoDBConfig
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from api.cache import ResolverCache
+from api.loaders import context_loader
+from api.pagination import paginate
+from dynamodb.dynamodb import DynamoDBConfig, open_table
+from dynamodb.metrics import METRICS
 # Initialize query
 query = QueryType()
+products_cve = ObjectType("ProductsCVE")
+product_cve = ObjectType("ProductCVE")
+# Sort keys of the items behind the nested fields of ProductCVE
+NESTED_SOURCES = {"details": "cve#details", "epss": "cve#epss"}
+# Item attributes behind the GraphQL fields that are not stored under their own name
+FIELD_ATTRIBUTES = {"cve": "hashKey", "name": "hashKey", "CVEList": "cve_list", "cves": "cve_list"}
+# Threads running the blocking storage calls, unless "apiWorkers" is configured
+DEFAULT_API_WORKERS = 32
+
+
+@lru_cache(maxsize=None)
+def get_table(config_name):
+    """
+    Table of a CONFIG environment on its configured storage backend, opened once per process.
+
+    Handles come from the process-wide connection registry and no schema
+    reconciliation is done here, so a resolver costs a single storage request.
+    """
+    return open_table(DynamoDBConfig(config_name).get_config(), "SampleTable")
+
+
+@lru_cache(maxsize=None)
+def get_cache(config_name):
+    """
+    Resolver cache of a CONFIG environment, configured under "apiCache", or None when disabled.
+
+    Its hit ratio is exported with the DynamoDB metrics.
+    """
+    general = DynamoDBConfig(config_name).get_config()['general']
+    cache = ResolverCache.from_config(general.get('apiCache'), get_table(config_name).dataset_version)
+    if cache is not None:
+        METRICS.configure(general).add_cache("graphql", cache)
+    return cache
+
+
+@lru_cache(maxsize=None)
+def get_executor(config_name):
+    """
+    Bounded thread pool of a CONFIG environment running the blocking storage calls of the resolvers.
+
+    It is sized by "apiWorkers" in the general DynamoDB config, which should not
+    exceed the connection pool of the shared DynamoDB client.
+    """
+    general = DynamoDBConfig(config_name).get_config()['general']
+    return ThreadPoolExecutor(max_workers=general.get('apiWorkers', DEFAULT_API_WORKERS),
+                              thread_name_prefix="graphql")
+
+
+async def offload(func, *args, **kwargs):
+    """
+    Run a blocking call in the resolver thread pool, so the event loop keeps serving other requests.
+    """
+    executor = get_executor(os.environ.get("CONFIG", "test"))
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+def cached(info, load, **arguments):
+    """
+    Result of load for the current field and arguments, served from the resolver cache when enabled.
+    """
+    cache = get_cache(os.environ.get("CONFIG", "test"))
+    if cache is None:
+        return load()
+    return cache.get((info.field_name, tuple(sorted(arguments.items()))), load)
+
+
+def _collect_fields(info, selection_sets, fields=None):
+    fields = {} if fields is None else fields
+    for selection_set in selection_sets:
+        for selection in selection_set.selections if selection_set else []:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection)
+            elif isinstance(selection, InlineFragmentNode):
+                _collect_fields(info, [selection.selection_set], fields)
+            elif isinstance(selection, FragmentSpreadNode):
+                _collect_fields(info, [info.fragments[selection.name.value].selection_set], fields)
+    return fields
+
+
+def selected_fields(info, *path):
+    """
+    Fields selected under the current field, or under the given path of field
+    names below it (e.g. "edges", "node"), by name and with fragments expanded.
+
+    A field selected more than once, directly, through fragments or under
+    aliases, maps to all of its nodes, and the selections below them are merged.
+    """
+    fields = _collect_fields(info, [node.selection_set for node in info.field_nodes])
+    for name in path:
+        if name not in fields:
+            return {}
+        fields = _collect_fields(info, [node.selection_set for node in fields[name]])
+    return fields
+
+
+def selected_attributes(info, *path):
+    """
+    Item attributes behind the fields selected under the current field (or the given path below it).
+
+    The hashKey is always included, as every type exposes it.
+    """
+    names = [name for name in selected_fields(info, *path) if not name.startswith("__")]
+    return tuple(sorted({FIELD_ATTRIBUTES.get(name, name) for name in names} | {"hashKey"}))
+
+
+def projection(attributes):
+    """
+    Options of the table reads fetching only the given attributes, or every attribute when None.
+    """
+    if not attributes:
+        return {}
+    names = {f"#p{idx}": attribute for idx, attribute in enumerate(attributes)}
+    return {"projection_expression": ", ".join(names), "expression_attribute_names": names}
+
+
+def item_loader(info, source, attributes):
+    """
+    Per-request loader of the items of a record type by (hashKey, sortKey), backed by batch_get
+    and reading only the given attributes.
+    """
+    return context_loader(info, f"item_loader:{source}:{','.join(attributes)}",
+                          lambda keys: get_table(os.environ.get("CONFIG", "test")).batch_get(
+                              keys, **projection(attributes)))
+
+
+def prime_product_cves(info, products, *path):
+    """
+    Queue the items of every nested CVE field selected for the products, so they
+    are fetched in a few batch requests when the first of them is resolved.
+
+    Args:
+        info: Resolve info of the listing field.
+        products: The products returned.
+        path: Field names leading from the listing field to the products, if any.
+    """
+    for name in selected_fields(info, *path, "cves"):
+        if name in NESTED_SOURCES:
+            source = NESTED_SOURCES[name]
+            attributes = selected_attributes(info, *path, "cves", name)
+            item_loader(info, source, attributes).prime(
+                (cve, source) for product in products for cve in product["CVEList"] or [])
+
 
 # Define resolvers
 
 
-@query.field("listProducts")
-def listProducts(_, info, productName=None):
-    config = DynamoDBConfig(os.environ.get("CONFIG", "test"))
-    cve_table = DynamoDB(config.get_config(), "SampleTable")
+def load_products(productName=None, attributes=None):
+    cve_table = get_table(os.environ.get("CONFIG", "test"))
     results = []
     if productName:
         condition = Key("hashKey").eq(productName) & Key("sortKey").eq("product#cve")
-        response = cve_table.query(condition)
+        response = cve_table.query(condition, **projection(attributes))
         results = [
-            {"name": item["hashKey"], "CVEList": item["cve_list"]}
+            {"name": item["hashKey"], "CVEList": item.get("cve_list")}
             for item in response
         ]
         
 
     else:
-        condition = Key("sortKey").eq("product#cve")
-        response = cve_table.query(condition, index_name="AssessmentBySourceIndex")
+        response = cve_table.query_source("product#cve", **projection(attributes))
         results = [
-            {"name": item["hashKey"], "CVEList": item["cve_list"]}
+            {"name": item["hashKey"], "CVEList": item.get("cve_list")}
             for item in response
         ]
     
     return results
+
+
+def load_page(source, to_node, attributes, first=None, after=None):
+    cve_table = get_table(os.environ.get("CONFIG", "test"))
+    return paginate(lambda **page: cve_table.iter_source(source, **page, **projection(attributes)),
+                    to_node, first, after)
+
+
+@query.field("listProducts")
+async def listProducts(_, info, productName=None):
+    attributes = selected_attributes(info)
+    results = await offload(cached, info, lambda: load_products(productName, attributes),
+                            productName=productName, attributes=attributes)
+    prime_product_cves(info, results)
+    return results
+
+
+@query.field("productsConnection")
+async def productsConnection(_, info, first=None, after=None):
+    attributes = selected_attributes(info, "edges", "node")
+    result = await offload(cached, info, lambda: load_page(
+        "product#cve", lambda item: {"name": item["hashKey"], "CVEList": item.get("cve_list")}, attributes,
+        first, after
+    ), first=first, after=after, attributes=attributes)
+    prime_product_cves(info, [edge["node"] for edge in result["edges"]], "edges", "node")
+    return result
+
+
+@products_cve.field("cves")
+def resolve_product_cves(product, info):
+    return [{"cve": cve} for cve in product["CVEList"] or []]
+
+
+def resolve_nested_item(source):
+    async def resolve(parent, info):
+        loader = item_loader(info, source, selected_attributes(info))
+        item = await loader.load_async((parent["cve"], source), offload)
+        return {"cve": item["hashKey"], **item} if item else None
+    return resolve
+
+
+for field_name, sort_key in NESTED_SOURCES.items():
+    product_cve.set_field(field_name, resolve_nested_item(sort_key))
         
 
-@query.field("listCVEDetails")
-def listCVEDetails(_, info, cve=None):
-    config = DynamoDBConfig(os.environ.get("CONFIG", "test"))
-    cve_table = DynamoDB(config.get_config(), "SampleTable")
+def load_cve_details(cve=None, attributes=None):
+    cve_table = get_table(os.environ.get("CONFIG", "test"))
     results = []
     if cve:
         condition = Key("hashKey").eq(cve) & Key("sortKey").eq("cve#details")
-        response = cve_table.query(condition)
+        response = cve_table.query(condition, **projection(attributes))
         results = [
             {"cve": item["hashKey"], **item}
             for item in response
@@ -50,8 +238,7 @@ def listCVEDetails(_, info, cve=None):
         
 
     else:
-        condition = Key("sortKey").eq("cve#details")
-        response = cve_table.query(condition, index_name="AssessmentBySourceIndex")
+        response = cve_table.query_source("cve#details", **projection(attributes))
         results = [
             {"cve": item["hashKey"], **item}
             for item in response
@@ -59,14 +246,27 @@ def listCVEDetails(_, info, cve=None):
     
     return results  
 
-@query.field("listEPSS")
-def listEPSS(_, info, cve=None):
-    config = DynamoDBConfig(os.environ.get("CONFIG", "test"))
-    cve_table = DynamoDB(config.get_config(), "SampleTable")
+
+@query.field("listCVEDetails")
+async def listCVEDetails(_, info, cve=None):
+    attributes = selected_attributes(info)
+    return await offload(cached, info, lambda: load_cve_details(cve, attributes), cve=cve, attributes=attributes)
+
+
+@query.field("cveDetailsConnection")
+async def cveDetailsConnection(_, info, first=None, after=None):
+    attributes = selected_attributes(info, "edges", "node")
+    return await offload(cached, info, lambda: load_page(
+        "cve#details", lambda item: {"cve": item["hashKey"], **item}, attributes, first, after
+    ), first=first, after=after, attributes=attributes)
+
+
+def load_epss(cve=None, attributes=None):
+    cve_table = get_table(os.environ.get("CONFIG", "test"))
     results = []
     if cve:
-        condition = Key("hashKey").eq(cve) & Key("sortKey").eq("epss#cve")
-        response = cve_table.query(condition)
+        condition = Key("hashKey").eq(cve) & Key("sortKey").eq(NESTED_SOURCES["epss"])
+        response = cve_table.query(condition, **projection(attributes))
         results = [
             {"cve": item["hashKey"], **item}
             for item in response
@@ -74,19 +274,32 @@ def listEPSS(_, info, cve=None):
         
 
     else:
-        condition = Key("sortKey").eq("cve#epss")
-        response = cve_table.query(condition, index_name="AssessmentBySourceIndex")
+        response = cve_table.query_source("cve#epss", **projection(attributes))
         results = [
             {"cve": item["hashKey"], **item}
             for item in response
         ]
     
     return results     
+
+
+@query.field("listEPSS")
+async def listEPSS(_, info, cve=None):
+    attributes = selected_attributes(info)
+    return await offload(cached, info, lambda: load_epss(cve, attributes), cve=cve, attributes=attributes)
+
+
+@query.field("epssConnection")
+async def epssConnection(_, info, first=None, after=None):
+    attributes = selected_attributes(info, "edges", "node")
+    return await offload(cached, info, lambda: load_page(
+        "cve#epss", lambda item: {"cve": item["hashKey"], **item}, attributes, first, after
+    ), first=first, after=after, attributes=attributes)
         
     
    
 
 # Create executable schema
 type_defs = load_schema_from_path(f"{pathlib.Path(__file__).parent.resolve()}/schemas")
-schema = make_executable_schema(type_defs, query)
+schema = make_executable_schema(type_defs, query, products_cve, product_cve)
 app = GraphQL(schema)
\ No newline at end of file
@@ -0,0 +1,96 @@
+""" Relay-style cursor connections over the resumable table iterators """
+import base64
+import json
+from graphql import GraphQLError
+from dynamodb.backend import InvalidStartKeyError
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Position after the last item of a query
+END = object()
+
+
+def encode_cursor(last_evaluated_key):
+    """
+    Opaque cursor of a position in a query, i.e. its last_evaluated_key.
+
+    The key of a plain query is a DynamoDB key; a sharded source listing has
+    one key per shard, which is encoded the same way. None, the position of
+    an exhausted query, gives a cursor after which there is nothing left.
+    """
+    payload = json.dumps(last_evaluated_key, sort_keys=True, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    The last_evaluated_key encoded by encode_cursor.
+
+    Returns:
+        None without a cursor, END for the cursor of an exhausted query, else the key.
+    """
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as exc:
+        raise GraphQLError(f"Invalid cursor: {cursor}") from exc
+    if key is None:
+        return END
+    if not isinstance(key, dict):
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+    return key
+
+
+def page_size(first):
+    """
+    Number of items of a page, defaulting to DEFAULT_PAGE_SIZE and capped to MAX_PAGE_SIZE.
+    """
+    if first is None:
+        return DEFAULT_PAGE_SIZE
+    if first < 0:
+        raise GraphQLError("first must not be negative")
+    return min(first, MAX_PAGE_SIZE)
+
+
+def paginate(open_iterator, to_node, first=None, after=None):
+    """
+    Read one page of a query and shape it as a Relay connection.
+
+    The iterator is opened with the page size as its limit, so a page costs one
+    bounded query (one per shard for a sharded source listing) and nothing past
+    the page is read or buffered. Each edge gets the cursor to resume right
+    after its item.
+
+    Args:
+        open_iterator: Callable taking limit and exclusive_start_key and returning a
+            QueryIterator, ShardedQueryIterator or SQLiteQuery.
+        to_node: Callable turning a table item into the node returned to clients.
+        first: Number of items wanted.
+        after: Cursor of the item to start after.
+
+    Returns:
+        A dict with the edges and pageInfo of the connection.
+
+    Raises:
+        GraphQLError: When the cursor was not returned by the same listing.
+    """
+    limit = page_size(first)
+    start_key = decode_cursor(after)
+    if start_key is END:
+        return {"edges": [], "pageInfo": {"hasNextPage": False, "endCursor": after}}
+    try:
+        iterator = open_iterator(limit=limit, exclusive_start_key=start_key)
+    except InvalidStartKeyError as exc:
+        raise GraphQLError(f"Invalid cursor: {after}") from exc
+    edges = []
+    for item in iterator:
+        position = iterator.last_evaluated_key
+        edges.append({"node": to_node(item), "cursor": encode_cursor(dict(position) if position else None)})
+    return {
+        "edges": edges,
+        "pageInfo": {
+            "hasNextPage": bool(iterator.last_evaluated_key),
+            "endCursor": edges[-1]["cursor"] if edges else after
+        }
+    }
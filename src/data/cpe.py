@@ -0,0 +1,84 @@
+""" Fast, memoized product extraction from CPE 2.3 formatted strings and CPE 2.2 URIs """
+from functools import lru_cache
+
+FORMAT_PREFIX = "cpe:2.3:"
+URI_PREFIX = "cpe:/"
+CPE_ATTRIBUTES = ["part", "vendor", "product", "version", "update", "edition",
+                  "language", "sw_edition", "target_sw", "target_hw", "other"]
+CPE_CACHE_SIZE = 1 << 16
+
+
+def split_formatted(value):
+    """
+    Split the body of a CPE 2.3 formatted string on unescaped colons.
+
+    A colon preceded by a backslash ("\\:") is part of the attribute value, and
+    the escape sequences are kept as-is in the returned values.
+    """
+    if "\\" not in value:
+        return value.split(":")
+    attributes = []
+    start = 0
+    idx = 0
+    length = len(value)
+    while idx < length:
+        char = value[idx]
+        if char == "\\":
+            idx += 2
+            continue
+        if char == ":":
+            attributes.append(value[start:idx])
+            start = idx + 1
+        idx += 1
+    attributes.append(value[start:])
+    return attributes
+
+
+def split_cpe(cpe_str):
+    """
+    Split a CPE string into its attribute values.
+
+    Args:
+        cpe_str: A CPE 2.3 formatted string or a CPE 2.2 URI.
+
+    Returns:
+        The list of attribute values, starting with "part".
+    """
+    full_cpe = cpe_str.strip().lower()
+    if full_cpe.startswith(FORMAT_PREFIX):
+        return split_formatted(full_cpe[len(FORMAT_PREFIX):])
+    if full_cpe.startswith(URI_PREFIX):
+        return full_cpe[len(URI_PREFIX):].split(":")
+    raise ValueError(f"given cpe {full_cpe} does not match cpe formats")
+
+
+def parse_cpe(cpe_str):
+    """
+    Parse a CPE string into the same attribute dict as CpeParser.parser.
+
+    Returns:
+        A dict keyed by the CPE attribute names.
+    """
+    return dict(zip(CPE_ATTRIBUTES, split_cpe(cpe_str)))
+
+
+@lru_cache(maxsize=CPE_CACHE_SIZE)
+def cpe_product(cpe_str):
+    """ Get the product attribute of a CPE string (memoized) """
+    attributes = split_cpe(cpe_str)
+    if len(attributes) < 3:
+        raise ValueError(f"given cpe {cpe_str} has no product attribute")
+    return attributes[2]
+
+
+def extract_products(product_cpes):
+    """
+    Get the distinct products of a list of CPE strings, in first-seen order.
+
+    Args:
+        product_cpes: CPE strings of a CVE.
+
+    Returns:
+        The list of product names.
+    """
+    return list(dict.fromkeys(map(cpe_product, product_cpes)))
@@ -5,7 +5,12 @@ import pathlib
 
 import click
 import requests
-from cpeparser import CpeParser
+
+try:
+    from data.cpe import extract_products
+except ModuleNotFoundError:
+    # Run as a script, src/data is on sys.path instead of src
+    from cpe import extract_products
 
 CURRENT_PATH = os.path.dirname(os.getcwd())
 
@@ -26,16 +31,6 @@ def load_vulnerabilities():
     return json.load(f)
 
 
-def products_found(product_cpes, cpe: CpeParser):
-    products_found = []
-    for cpe_str in product_cpes:
-        result = cpe.parser(cpe_str)
-        prod = result['product']
-        if prod not in products_found:
-            products_found.append(prod)
-    return products_found
-
-
 @click.command()
 def collect_vulnerabilities():
     """ Get vulnerabilites for each epss CVE in epss.json """
@@ -46,13 +41,12 @@ def collect_vulnerabilities():
     epss_data = load_epss()['data']
 
     vulns = []
-    cpe_parser = CpeParser()
 
     print("Collecting CVE metadata and product names for every cve id....")
     for epss in epss_data:
         cve_response = requests.get(f"https://cve.circl.lu/api/cve/{epss['cve']}").json()
         product_cpes = cve_response['vulnerable_product']
-        products = products_found(product_cpes, cpe_parser)
+        products = extract_products(product_cpes)
         if products:
             vulns.append({
                 "product": products,
@@ -1,28 +1,52 @@
 # /usr/bin/env python3
+import asyncio
 import json
 import os
 import pathlib
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from itertools import islice
+import aiohttp
 import requests
-from cpeparser import CpeParser
+from requests.adapters import HTTPAdapter
+from data.cpe import extract_products
+from data.epss_snapshot import iter_epss_snapshot
+from data.http_cache import ResponseCache, cached_get_json_async, cached_request_json
+from data.nvd_feed import load_nvd_lookup
+from data.pipeline import DEFAULT_QUEUE_SIZE, stream
+from data.ratelimit import RateController
 
 CURRENT_PATH = os.path.dirname(os.getcwd())
 
+# Defaults for the asyncio enrichment mode, overridable through the
+# "enrichment" block of config/<env>.json
+DEFAULT_CONCURRENCY = 64
+DEFAULT_KEEPALIVE_TIMEOUT = 30
+DEFAULT_REQUEST_TIMEOUT = 30
+# ThreadPoolExecutor's own default worker count
+DEFAULT_THREAD_WORKERS = min(32, (os.cpu_count() or 1) + 4)
 
-def products_found(product_cpes, cpe: CpeParser):
-    products_found = []
-    for cpe_str in product_cpes:
-        result = cpe.parser(cpe_str)
-        prod = result['product']
-        if prod not in products_found:
-            products_found.append(prod)
-    return products_found
+# Defaults for EPSS catalogue paging, overridable through the "epssPaging" block
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_PAGE_WORKERS = 8
+DEFAULT_MAX_PAGES = 6
 
+# End of the EPSS rows fed to the async enrichment workers
+_END = object()
 
-def process_epss(epss, endpoint, cpe_parser):
-    cve_response = requests.get(f"{endpoint}/{epss['cve']}").json()
+
+def normalize_epss_row(item):
+    """ Fill in missing or empty EPSS fields """
+    item['cve'] = item.get('cve', '')
+    item['epss'] = item.get('epss', '0.0') if item.get('epss', '0') != '' else 0.0
+    item['percentile'] = item.get('percentile', '0.0') if item.get('percentile', '0') != '' else 0.0
+    item['date'] = item.get('date', '')
+    return item
+
+
+def build_record(epss, cve_response):
+    """ Build the enriched vulnerability record for an EPSS row and its CVE details """
     product_cpes = cve_response['vulnerable_product']
-    products = products_found(product_cpes, cpe_parser)
+    products = extract_products(product_cpes)
     if products:
         return {
             "cve_id": cve_response['id'],
@@ -41,6 +65,171 @@ def process_epss(epss, endpoint, cpe_parser):
         }
     return None
 
+
+def process_epss(epss, endpoint, session=requests, cache=None, limiter=None, timeout=DEFAULT_REQUEST_TIMEOUT):
+    cve_response = cached_request_json(session, "GET", f"{endpoint}/{epss['cve']}", cache,
+                                       limiter=limiter, timeout=timeout)
+    return build_record(epss, cve_response)
+
+
+async def process_epss_async(session, epss, endpoint, cache=None, limiter=None):
+    """ Async counterpart of process_epss sharing a pooled aiohttp session """
+    cve_response = await cached_get_json_async(session, f"{endpoint}/{epss['cve']}", cache, limiter=limiter)
+    return build_record(epss, cve_response)
+
+
+async def enrich_async(epss_data, endpoint, concurrency=DEFAULT_CONCURRENCY,
+                       keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT, request_timeout=DEFAULT_REQUEST_TIMEOUT,
+                       cache=None, on_result=None, limiter=None, on_error=None):
+    """
+    Enrich every EPSS row with its CVE details over one keep-alive connection pool.
+
+    Args:
+        epss_data: EPSS rows to enrich.
+        endpoint: Base URL of the CVE details API.
+        concurrency: Maximum number of requests in flight (and pooled connections).
+        keepalive_timeout: Seconds an idle pooled connection is kept open.
+        request_timeout: Total timeout in seconds for a single CVE lookup.
+        cache: Optional ResponseCache consulted before each lookup.
+        on_result: Optional callback receiving each record as it completes,
+                   instead of collecting them.
+        limiter: Optional RateController pacing the lookups below the concurrency.
+        on_error: Optional callback receiving the EPSS row and the exception of a
+                  failed lookup; without it the first failure aborts the run.
+
+    Returns:
+        The list of enriched records, in completion order (empty with on_result).
+    """
+    vulns = []
+    rows = iter(epss_data)
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=keepalive_timeout)
+    timeout = aiohttp.ClientTimeout(total=request_timeout)
+    loop = asyncio.get_running_loop()
+    # The rows may come from a blocking queue and on_result may block on a full one,
+    # so both run on their own thread and the event loop only awaits them.
+    pending = asyncio.Queue(maxsize=concurrency)
+    reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="enrich-read")
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="enrich-write") if on_result else None
+
+    failure = []
+
+    async def feed():
+        try:
+            while True:
+                epss = await loop.run_in_executor(reader, next, rows, _END)
+                if epss is _END:
+                    break
+                await pending.put(epss)
+        except Exception as exc:  # pylint: disable=broad-except
+            failure.append(exc)
+        for _ in range(concurrency):
+            await pending.put(_END)
+
+    async def emit(result):
+        if writer is None:
+            vulns.append(result)
+        else:
+            await loop.run_in_executor(writer, on_result, result)
+
+    async def worker(session):
+        # A fixed set of workers pulls from the bounded queue, so memory stays
+        # bounded by the concurrency rather than by the number of CVEs.
+        while True:
+            epss = await pending.get()
+            if epss is _END:
+                return
+            try:
+                result = await process_epss_async(session, epss, endpoint, cache, limiter)
+            except Exception as exc:  # pylint: disable=broad-except
+                if on_error is None:
+                    raise
+                on_error(epss, exc)
+                continue
+            if result:
+                await emit(result)
+                print(f"Collected data for CVE_ID: {result['cve_id']}")
+
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers={'Accept': 'application/json'}) as session:
+            feeder = asyncio.ensure_future(feed())
+            try:
+                await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+            finally:
+                feeder.cancel()
+    finally:
+        reader.shutdown(wait=False)
+        if writer is not None:
+            writer.shutdown(wait=True)
+    if failure:
+        raise failure[0]
+    return vulns
+
+
+def enrich_threads(epss_rows, endpoint, cache=None, limiter=None, max_workers=None, timeout=DEFAULT_REQUEST_TIMEOUT,
+                   on_error=None):
+    """
+    Stream enriched records from a thread pool, keeping at most two lookups
+    per worker in flight so the EPSS rows are consumed lazily. A failed lookup
+    is handed to on_error, when given, instead of aborting the run.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        max_in_flight = 2 * (max_workers or DEFAULT_THREAD_WORKERS)
+        pending = {}
+        for epss in epss_rows:
+            future = executor.submit(process_epss, epss, endpoint, cache=cache, limiter=limiter, timeout=timeout)
+            pending[future] = epss
+            if len(pending) < max_in_flight:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from _completed(done, pending, on_error)
+        yield from _completed(as_completed(list(pending)), pending, on_error)
+
+
+def _completed(futures, pending, on_error):
+    for future in futures:
+        epss = pending.pop(future)
+        try:
+            result = future.result()
+        except Exception as exc:  # pylint: disable=broad-except
+            if on_error is None:
+                raise
+            on_error(epss, exc)
+            continue
+        if result:
+            print(f"Collected data for CVE_ID: {result['cve_id']}")
+            yield result
+
+
+def enrich_from_nvd(epss_data, feed_glob, lookup=None, on_error=None):
+    """ Enrich EPSS rows from local NVD feed files instead of one HTTP call per CVE """
+    if lookup is None:
+        lookup = load_nvd_lookup(feed_glob, wanted={epss['cve'] for epss in epss_data})
+    enriched = 0
+    missing = 0
+    for epss in epss_data:
+        cve_response = lookup.get(epss['cve'])
+        if cve_response is None:
+            missing += 1
+            continue
+        try:
+            result = build_record(epss, cve_response)
+        except Exception as exc:  # pylint: disable=broad-except
+            if on_error is None:
+                raise
+            on_error(epss, exc)
+            continue
+        if result:
+            enriched += 1
+            yield result
+    print(f"Enriched {enriched} CVEs from NVD feeds, {missing} not found in feeds")
+
+
+def report_failure(epss, exc):
+    """ Default per-CVE failure handler when no journal is configured: log and move on """
+    print(f"Failed to enrich {epss.get('cve')}: {exc!r}")
+
+
 class EPSS:
     def __init__(self, config):
         self.header = {
@@ -48,47 +237,101 @@ class EPSS:
             'Content-type': 'application/json'
         }
         self.config = config
-    
+        self.epss_endpoint = self.config['epssURL'] + "/data/v1/epss"
+        workers = self.config.get('epssPaging', {}).get('workers', DEFAULT_PAGE_WORKERS)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        self.cache = ResponseCache.from_config(self.config.get('httpCache'))
+        rate_limits = self.config.get('rateLimits', {})
+        self.epss_limiter = RateController.from_config(rate_limits.get('epss'))
+        self.cve_limiter = RateController.from_config(rate_limits.get('cve'))
+        self.nvd_lookup = None
+        # CVEs whose enrichment failed in this run
+        self.failed = 0
+        self.failed_cves = set()
+
     def load_epss(self):
         """ Load epss data"""
+        return list(self.iter_epss())
+
+    def fetch_epss_page(self, offset, limit):
+        """
+        Fetch a single page of the EPSS catalogue, paced and retried by the EPSS rate controller.
 
-        results = []
-        offset = 0
-        endpoint = self.config['epssURL'] + "/data/v1/epss"
+        Args:
+            offset: Index of the first row of the page.
+            limit: Number of rows requested for the page.
+
+        Returns:
+            The decoded JSON envelope for the page.
+        """
         querystring = {
             "envelope": True,
             "pretty": True,
-            "limit": 30,
+            "limit": limit,
             "offset": offset
         }
+        # Scores are republished daily, so pages get their own (shorter) TTL
+        ttl = self.config.get('httpCache', {}).get('epssTtl')
+        return cached_request_json(self.session, "POST", self.epss_endpoint, self.cache, ttl=ttl,
+                                   params=querystring, headers=self.header, limiter=self.epss_limiter, timeout=20)
+
+    def iter_epss(self):
+        """
+        Stream EPSS rows from the source configured under "epssSource": the
+        paged FIRST API ("api", the default) or a local daily snapshot
+        ("snapshot").
+        """
+        source = self.config.get('epssSource', {})
+        if source.get('type', 'api') == 'snapshot':
+            print(f"Reading EPSS snapshot from {source['path']}")
+            return iter_epss_snapshot(source['path'])
+        return self.iter_epss_api()
+
+    def iter_epss_api(self):
+        """
+        Stream EPSS rows, fetching the pages after the first one concurrently.
+
+        The first page gives the catalogue "total", from which every remaining
+        offset is computed. Rows are yielded as soon as their page arrives, so
+        they are not in offset order. At most two pages per worker are fetched
+        ahead of the consumer, so a slow consumer keeps memory bounded.
+        """
+        paging = self.config.get('epssPaging', {})
+        page_size = paging.get('pageSize', DEFAULT_PAGE_SIZE)
+        workers = paging.get('workers', DEFAULT_PAGE_WORKERS)
         try:
-            response = requests.post(endpoint, headers=self.header, params=querystring, timeout=20)
+            response_json = self.fetch_epss_page(0, page_size)
         except requests.exceptions.ReadTimeout as e:
-            raise ValueError(f"Request to {endpoint} timed out") from e
-        if response.status_code != 200:
-            raise ValueError(f"Error: received status code {response.status_code}")
-        response_json = response.json()
+            raise ValueError(f"Request to {self.epss_endpoint} timed out") from e
+        except requests.exceptions.HTTPError as e:
+            raise ValueError(f"Error: received status code {e.response.status_code}") from e
         if not response_json.get('data'):
             print("Error: received empty data object")
-            return results
-        total_items = response_json.get("total")
-        i = 0
-        while offset < total_items:
-            if i > 5:
-                break
-            i += 1
-            for item in response_json.get("data"):
-                item['cve'] = item.get('cve', '')
-                item['epss'] = item.get('epss', '0.0') if item.get('epss', '0') != '' else 0.0
-                item['percentile'] = item.get('percentile', '0.0') if item.get('percentile', '0') != '' else 0.0
-                item['date'] = item.get('date', '')
-                results.append(item)
-            offset += 30
-            querystring["offset"] = offset
-            response = requests.post(endpoint, headers=self.header, params=querystring, timeout=20)
-            response_json = response.json()
-        return results
+            return
+        # The API may cap the page size below what we asked for
+        page_size = int(response_json.get('limit') or page_size)
+        total_items = int(response_json.get('total') or 0)
+        if not paging.get('fullCatalogue', False):
+            total_items = min(total_items, paging.get('maxPages', DEFAULT_MAX_PAGES) * page_size)
 
+        yield from (normalize_epss_row(item) for item in response_json['data'])
+        offsets = range(page_size, total_items, page_size)
+        print(f"Fetching {len(offsets)} more EPSS pages of {page_size} rows ({total_items} rows)")
+        remaining = iter(offsets)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {executor.submit(self.fetch_epss_page, offset, page_size)
+                       for offset in islice(remaining, 2 * workers)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    offset = next(remaining, None)
+                    if offset is not None:
+                        pending.add(executor.submit(self.fetch_epss_page, offset, page_size))
+                    for item in future.result().get('data', []):
+                        yield normalize_epss_row(item)
+        print(f"EPSS API: {self.epss_limiter.stats}")
 
     def collect_vulnerabilities(self):
         """ Get vulnerabilites for each epss CVE in epss.json """
@@ -97,18 +340,95 @@ class EPSS:
         epss_data = self.load_epss()
         
         print(f"Collected {len(epss_data)} EPSS data")
+        return self.enrich(epss_data)
+
+    def modified_since(self, watermark, cve_ids):
+        """
+        Find the CVEs whose details changed after a lastModified watermark.
+
+        Only the NVD feed source can answer this without a lookup per CVE, so
+        delta ingestion requires the "nvd" enrichment mode; the HTTP modes
+        report no modified CVEs.
 
-        vulns = []
-        cpe_parser = CpeParser()
+        Args:
+            watermark: Highest lastModified timestamp seen by the previous run.
+            cve_ids: CVE ids to check.
+
+        Returns:
+            The set of modified CVE ids.
+        """
+        enrichment = self.config.get('enrichment', {})
+        if enrichment.get('mode', 'threads') != 'nvd' or not watermark:
+            return set()
+        self.nvd_lookup = load_nvd_lookup(enrichment['nvdFeeds'], wanted=set(cve_ids))
+        return {
+            cve_id for cve_id, details in self.nvd_lookup.items()
+            if (details['last-modified'] or '') > watermark
+        }
+
+    def enrich(self, epss_data, journal=None):
+        """ Enrich EPSS rows with CVE details using the configured enrichment mode """
+        return list(self.iter_enrich(epss_data, journal=journal))
+
+    def iter_enrich(self, epss_rows, queue_size=DEFAULT_QUEUE_SIZE, journal=None):
+        """
+        Stream enriched records as soon as each CVE lookup completes.
+
+        Args:
+            epss_rows: Iterable of EPSS rows, consumed lazily except by the NVD
+                       mode, which needs every CVE id up front to filter the feeds.
+            queue_size: Capacity of the queue between the async event loop and
+                        the caller in async mode.
+            journal: Optional IngestionJournal. Records checkpointed by a previous
+                     run are replayed first and their CVEs are not fetched again;
+                     new records are checkpointed and failed CVEs dead-lettered.
+
+        Yields:
+            Enriched records, in completion order.
+        """
+        handler = journal.dead_letter if journal is not None else report_failure
+
+        def on_error(epss, exc):
+            self.failed += 1
+            self.failed_cves.add(epss['cve'])
+            handler(epss, exc)
+
+        if journal is not None and journal.completed:
+            completed = set(journal.completed)
+            yield from journal.replay()
+            epss_rows = (epss for epss in epss_rows if epss['cve'] not in completed)
 
         print("Collecting CVE metadata and product names for every cve id....")
+        for record in self._enrich_stream(epss_rows, queue_size, on_error):
+            if journal is not None:
+                journal.record(record)
+            yield record
+        print(f"CVE API: {self.cve_limiter.stats}")
+
+        if self.cache is not None:
+            print(f"HTTP cache: {self.cache.stats}")
+
+    def _enrich_stream(self, epss_rows, queue_size, on_error):
         endpoint = self.config['cveURL']
-        with ThreadPoolExecutor() as executor:
-            futures = [executor.submit(process_epss, epss, endpoint, cpe_parser) for epss in epss_data]
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    vulns.append(result)
-                    print(f"Collected data for CVE_ID: {result['cve_id']}")
-    
-        return vulns
+        enrichment = self.config.get('enrichment', {})
+        if enrichment.get('mode', 'threads') == 'nvd':
+            yield from enrich_from_nvd(list(epss_rows), enrichment['nvdFeeds'], lookup=self.nvd_lookup,
+                                       on_error=on_error)
+        elif enrichment.get('mode', 'threads') == 'async':
+            yield from stream(lambda emit: asyncio.run(enrich_async(
+                epss_rows,
+                endpoint,
+                concurrency=enrichment.get('concurrency', DEFAULT_CONCURRENCY),
+                keepalive_timeout=enrichment.get('keepaliveTimeout', DEFAULT_KEEPALIVE_TIMEOUT),
+                request_timeout=enrichment.get('requestTimeout', DEFAULT_REQUEST_TIMEOUT),
+                cache=self.cache,
+                on_result=emit,
+                limiter=self.cve_limiter,
+                on_error=on_error
+            )), maxsize=queue_size, name="enrich-async")
+        else:
+            # Enough threads for the controller to open its window all the way
+            yield from enrich_threads(epss_rows, endpoint, cache=self.cache, limiter=self.cve_limiter,
+                                      max_workers=self.cve_limiter.max_concurrency,
+                                      timeout=enrichment.get('requestTimeout', DEFAULT_REQUEST_TIMEOUT),
+                                      on_error=on_error)
@@ -0,0 +1,71 @@
+""" Offline EPSS ingestion from the daily epss_scores-YYYY-MM-DD.csv.gz snapshot """
+import csv
+import glob
+import gzip
+import io
+import os
+import re
+
+SNAPSHOT_GLOB = "epss_scores-*.csv.gz"
+SNAPSHOT_DATE_REGEX = re.compile(r"epss_scores-(?P<date>\d{4}-\d{2}-\d{2})\.csv\.gz$")
+SCORE_DATE_REGEX = re.compile(r"score_date:(?P<date>\d{4}-\d{2}-\d{2})")
+
+
+def resolve_snapshot(path):
+    """
+    Resolve the snapshot file to read.
+
+    Args:
+        path: Either a snapshot file or a directory holding daily snapshots,
+              in which case the most recent one is used.
+
+    Returns:
+        The path of the snapshot file.
+    """
+    if not os.path.isdir(path):
+        return path
+    snapshots = sorted(glob.glob(os.path.join(path, SNAPSHOT_GLOB)))
+    if not snapshots:
+        raise ValueError(f"No {SNAPSHOT_GLOB} snapshot found in {path}")
+    return snapshots[-1]
+
+
+def iter_epss_snapshot(path):
+    """
+    Stream rows out of a gzipped EPSS snapshot without loading it into memory.
+
+    The file starts with a "#model_version:...,score_date:..." comment line
+    followed by a "cve,epss,percentile" header. The score date is taken from
+    the comment, falling back to the date in the file name.
+
+    Args:
+        path: Snapshot file or directory of snapshots.
+
+    Yields:
+        Dicts with the same cve, epss, percentile and date keys as the API rows.
+    """
+    snapshot = resolve_snapshot(path)
+    match = SNAPSHOT_DATE_REGEX.search(os.path.basename(snapshot))
+    score_date = match.group('date') if match else ''
+    with gzip.open(snapshot, "rb") as compressed:
+        # A large read buffer keeps the decompressor fed with few syscalls
+        stream = io.TextIOWrapper(io.BufferedReader(compressed, buffer_size=1 << 20), encoding="utf-8", newline="")
+        line = stream.readline()
+        while line.startswith("#"):
+            match = SCORE_DATE_REGEX.search(line)
+            if match:
+                score_date = match.group('date')
+            line = stream.readline()
+        header = next(csv.reader([line]))
+        cve_idx = header.index('cve')
+        epss_idx = header.index('epss')
+        percentile_idx = header.index('percentile')
+        for row in csv.reader(stream):
+            if not row:
+                continue
+            yield {
+                "cve": row[cve_idx],
+                "epss": row[epss_idx] or 0.0,
+                "percentile": row[percentile_idx] or 0.0,
+                "date": score_date
+            }
@@ -1,10 +1,40 @@
 from collections import defaultdict
 import os
 import dpath
-from dynamodb.dynamodb import DynamoDB, DynamoDBConfig
+import pyarrow as pa
+from dynamodb.dynamodb import DynamoDBConfig, open_table
+from dynamodb.metrics import METRICS
 from s3.s3 import S3Config, S3Uploader
 from config.config import Config
 from data.epss import EPSS
+from data.journal import IngestionJournal
+from data.manifest import WriteManifest
+from data.pipeline import DEFAULT_QUEUE_SIZE, DynamoDBSink, ParquetSink, buffered, fan_out
+from data.watermark import IngestionState
+
+
+# Columns of the modeled parquet data, covering every table item type
+ITEM_SCHEMA = pa.schema([
+    ("hashKey", pa.string()),
+    ("sortKey", pa.string()),
+    ("cve_list", pa.list_(pa.string())),
+    ("epss", pa.string()),
+    ("percentile", pa.string()),
+    ("date", pa.string()),
+    ("productList", pa.list_(pa.string())),
+    ("lastModified", pa.string()),
+    ("publishedDate", pa.string()),
+    ("assignedby", pa.string()),
+    ("summary", pa.string()),
+    ("vulnerabilityProduct", pa.list_(pa.string())),
+])
+
+
+class IncompleteLoadError(RuntimeError):
+    """
+    Some items of an ingestion run could not be enriched or written, so the
+    dataset version was left as it was.
+    """
 
 
 class DataLoaderS3Config(S3Config):
@@ -65,20 +95,256 @@ def store_in_s3(s3_uploader, vuln_data):
     s3_uploader.store_modeled_data(source, qualifier, filename, vuln_data)
 
 
-def store_in_dynamodb(vuln_data, metadata_table):
+def store_in_dynamodb(vuln_data, metadata_table, manifest=None):
     """
-    Store vulnerability data in DynamoDB
+    Store vulnerability data in DynamoDB, skipping items the manifest saw unchanged
     """
-    metadata_table.big_batch_put(vuln_data, batch_size=1000, max_workers=10)
+    if manifest is not None:
+        vuln_data = manifest.filter(vuln_data)
+    return metadata_table.big_batch_put(vuln_data, batch_size=1000, max_workers=10)
     
 
-def insert_vulnerability_data():
+def delete_from_dynamodb(keys, metadata_table, manifest=None):
+    """
+    Delete items from DynamoDB, forgetting them in the manifest so they are written again if they come back
+    """
+    if manifest is not None:
+        manifest.forget(keys)
+    return metadata_table.batch_delete(keys)
+
+
+def to_epss_item(epss_details):
+    """
+    Build the cve#epss item of a CVE
+    """
+    return {
+        "hashKey": epss_details.get('cve_id'),
+        "sortKey": "cve#epss",
+        **{k: v for k, v in epss_details.items() if k != 'cve_id'}
+    }
+
+
+def to_details_item(entry):
+    """
+    Build the cve#details item of an enriched CVE record
+    """
+    return {
+        "hashKey": entry.get('cve_id'),
+        "sortKey": "cve#details",
+        **{k: v for k, v in entry.items() if k != 'epss_details' and k != "cve_id"}
+    }
+
+
+def to_product_items(product_cve_map):
+    """
+    Build the product#cve items from a product -> CVE ids map
+    """
+    return [
+        {"hashKey": product, "sortKey": "product#cve", "cve_list": cve_list}
+        for product, cve_list in product_cve_map.items()
+    ]
+
+
+def transform(vuln_records, state=None):
+    """
+    Turn enriched CVE records into table items as they arrive.
+
+    The cve#epss and cve#details items of a record are yielded right away;
+    only the product -> CVE ids map is kept, and the product#cve items are
+    yielded once every record has been seen.
+
+    Args:
+        vuln_records: Iterable of enriched CVE records.
+        state: Optional IngestionState seeded along the way.
+
+    Yields:
+        Table items.
+    """
+    product_cve_map = defaultdict(list)  # Initialize a defaultdict with lists
+    for entry in vuln_records:
+        yield to_epss_item(entry['epss_details'])
+        yield to_details_item(entry)
+        for product in entry["productList"]:
+            product_cve_map[product].append(entry["cve_id"])
+        if state is not None:
+            record_state(state, [entry])
+    yield from to_product_items(product_cve_map)
+
+
+def run_pipeline(epss, sinks, pipeline_config, state=None, journal=None):
+    """
+    Stream a full load through fetch -> enrich -> transform -> sinks, with a
+    bounded queue between every stage so memory stays flat as the CVE count
+    grows and the first writes land while enrichment is still running.
+
+    Returns:
+        The number of items delivered to the sinks.
+    """
+    queue_size = pipeline_config.get('queueSize', DEFAULT_QUEUE_SIZE)
+    epss_rows = buffered(epss.iter_epss(), queue_size, name="fetch")
+    vuln_records = buffered(epss.iter_enrich(epss_rows, queue_size, journal=journal), queue_size, name="enrich")
+    return fan_out(transform(vuln_records, state), sinks, queue_size)
+
+
+def record_state(state, vuln_data):
+    """
+    Seed the delta state and watermarks from a full load
+    """
+    for entry in vuln_data:
+        state.record_epss({**entry['epss_details'], "cve": entry['cve_id']})
+        state.record_details(entry['cve_id'], entry['productList'])
+        state.advance("epss", entry['epss_details']['date'])
+        state.advance("cve", entry['lastModified'])
+
+
+def collect_delta(epss, state, journal=None):
+    """
+    Collect only the items affected since the previous run.
+
+    New CVEs and CVEs modified after the "cve" watermark are re-enriched, so
+    their cve#details items are rewritten. A cve#epss item is written only when
+    the scores changed. The product#cve items are rebuilt only for products
+    that gained or lost a CVE. The cve#details and cve#epss items of a CVE that
+    lost all of its products are deleted, as a full load would not write them.
+
+    Args:
+        epss: EPSS loader.
+        state: IngestionState of the previous run, updated in place.
+        journal: Optional IngestionJournal checkpointing the enrichment.
+
+    Returns:
+        The list of items to upsert and the list of keys to delete.
+    """
+    print("Loading EPSS data...")
+    epss_rows = [row for row in epss.load_epss() if row['date'] >= state.watermarks['epss']]
+    print(f"Collected {len(epss_rows)} EPSS data since {state.watermarks['epss'] or 'the beginning'}")
+
+    modified = epss.modified_since(state.watermarks['cve'], [row['cve'] for row in epss_rows])
+    to_enrich = [row for row in epss_rows if row['cve'] not in state.cves or row['cve'] in modified]
+    print(f"Re-enriching {len(to_enrich)} new or modified CVEs")
+    vuln_data = epss.enrich(to_enrich, journal=journal)
+
+    touched_products = set()
+    cve_details = []
+    for entry in vuln_data:
+        previous = state.record_details(entry['cve_id'], entry['productList'])
+        touched_products.update(previous, entry['productList'])
+        state.advance("cve", entry['lastModified'])
+        cve_details.append(to_details_item(entry))
+    # CVEs without any product are remembered too, so they are not fetched again.
+    # CVEs whose enrichment failed are not: leaving them out of the state gets
+    # them retried by the next run.
+    enriched = {entry['cve_id'] for entry in vuln_data}
+    removed = []
+    for row in to_enrich:
+        if row['cve'] not in enriched and row['cve'] not in epss.failed_cves:
+            previous = state.record_details(row['cve'], [])
+            if previous:
+                removed.extend({"hashKey": row['cve'], "sortKey": sort_key} for sort_key in ("cve#details", "cve#epss"))
+            touched_products.update(previous)
+    if epss.failed_cves:
+        print(f"{len(epss.failed_cves)} CVEs failed enrichment and will be retried by the next run")
+
+    cve_epss = []
+    for row in epss_rows:
+        if row['cve'] in epss.failed_cves and row['cve'] not in state.cves:
+            continue
+        if state.epss_changed(row) and state.cves.get(row['cve'], {}).get('productList'):
+            cve_epss.append(to_epss_item({
+                "cve_id": row['cve'],
+                "epss": row['epss'],
+                "percentile": row['percentile'],
+                "date": row['date']
+            }))
+        state.record_epss(row)
+        state.advance("epss", row['date'])
+
+    product_items = to_product_items(state.product_cves(touched_products))
+    print(f"Delta: {len(cve_details)} details, {len(cve_epss)} epss, {len(product_items)} products changed, "
+          f"{len(removed) // 2} CVEs without products removed")
+    return [*product_items, *cve_epss, *cve_details], removed
+
+
+def reconcile_schema():
+    """
+    Create the DynamoDB table and add missing indexes, without loading any data
+    """
+    dynamo_config = DynamoDBConfig(os.environ.get("CONFIG", "test"))
+    metadata_table = open_table(dynamo_config.get_config(), "SampleTable")
+    metadata_table.ensure_table()
+    print(f"Table {metadata_table.table_name} is up to date")
+
+
+def backfill_source_shards():
+    """
+    Give sourceShard to the items written before write sharding was configured
+    """
+    dynamo_config = DynamoDBConfig(os.environ.get("CONFIG", "test"))
+    metadata_table = open_table(dynamo_config.get_config(), "SampleTable")
+    metadata_table.ensure_table()
+    metadata_table.backfill_source_shards()
+
+
+def sync_manifest(manifest, metadata_table, full_load, failed_writes, failed_cves):
+    """
+    Delete the items removed since the previous run and save the write manifest.
+
+    The previous manifest is kept when writes failed, so those items are
+    written again next time. Nothing is deleted after a partial (delta) run or
+    when CVEs failed enrichment, as their items are missing from this run
+    without having been removed upstream; the manifest then keeps tracking them.
+    """
+    if failed_writes:
+        print(f"Keeping the previous write manifest, {failed_writes} DynamoDB writes failed")
+        return
+    deleted = False
+    if full_load and manifest.delete_removed:
+        if failed_cves:
+            print(f"Not deleting removed items, {failed_cves} CVEs failed enrichment")
+        else:
+            removed = manifest.removed()
+            result = metadata_table.batch_delete(removed)
+            manifest.deleted = result.written
+            deleted = not result.failed
+    if not deleted:
+        manifest.carry_over()
+    manifest.save()
+    print(f"Write manifest: {manifest}")
+
+
+def check_ingestion_config(config):
+    """
+    Reject ingestion settings that cannot work together.
+
+    Delta runs find the CVEs modified since the previous run in the NVD feeds;
+    the CVE API used by the other enrichment modes cannot list them, so their
+    cve#details items would never be refreshed.
+
+    Raises:
+        ValueError: When the settings are inconsistent.
+    """
+    ingestion = config.get('ingestion', {})
+    if ingestion.get('mode', 'full') != 'delta':
+        return
+    if not ingestion.get('statePath'):
+        raise ValueError("Delta ingestion needs ingestion.statePath to be configured")
+    mode = config.get('enrichment', {}).get('mode', 'threads')
+    if mode != 'nvd':
+        raise ValueError(f"Delta ingestion needs enrichment.mode \"nvd\" to find modified CVEs, not \"{mode}\"")
+
+
+def insert_vulnerability_data(resume=False):
     """
     Load vulnerabilities from EPSS
+
+    Args:
+        resume: Skip the CVEs checkpointed by a previous, interrupted run.
     """
     config = Config("EPSS", os.environ.get("CONFIG", "test")).get_config()
+    check_ingestion_config(config)
     dynamo_config = DynamoDBConfig(os.environ.get("CONFIG", "test"))
-    metadata_table = DynamoDB(dynamo_config.get_config(), "SampleTable")
+    metadata_table = open_table(dynamo_config.get_config(), "SampleTable")
+    metadata_table.ensure_table()
     s3_env = str(dpath.get(config, "/s3/env", default="default"))
     bucket = str(dpath.get(config, "/s3/Bucket", default="default"))
     locals3_url = str(dpath.get(config, "/s3/locals3_url", default="default"))
@@ -90,43 +356,43 @@ def insert_vulnerability_data():
 
 
     epss = EPSS(config)
-    vuln_data = epss.collect_vulnerabilities()
-    cve_epss = []
-    cve_details = []
-    for entry in vuln_data:
-        epss_details = {k: v for k, v in entry['epss_details'].items() if k != 'cve_id'}
-        cve_epss.append({
-            "hashKey": entry.get('epss_details').get('cve_id'),
-            "sortKey": "cve#epss",
-            **epss_details
-        })
-        product_item = {
-            k:v for k, v in entry.items() if k != 'epss_details' and k != "cve_id"
-        }
-        cve_details.append({
-            "hashKey": entry.get('cve_id'),
-            "sortKey": "cve#details",
-            **product_item
-        })
-    product_cve_map = defaultdict(list)  # Initialize a defaultdict with lists
-    
-    # Populate the product_cve_map
-    [product_cve_map[product].append(entry["cve_id"]) for entry in vuln_data for product in entry["productList"]]
-    
-    # Convert to the desired structure
-    result = [
-        {"hashKey": product, "sortKey": "product#cve", "cve_list": cve_list}
-        for product, cve_list in product_cve_map.items()
-    ]
-    result = [*result, *cve_epss, *cve_details]
-    
-     
-    
-    print(f"Storing {len(result)} records in S3")
-    store_in_s3(s3_uploader, result)
-    
-    print(f"Inserting {len(result)} records into DynamoDB")
-    store_in_dynamodb(result, metadata_table)
-    
+    ingestion = config.get('ingestion', {})
+    state = IngestionState(ingestion['statePath']) if ingestion.get('statePath') else None
+    journal = IngestionJournal.from_config(ingestion, resume=resume)
+    manifest = WriteManifest.from_config(ingestion.get('manifest'), s3_uploader, metadata_table)
+    if ingestion.get('mode', 'full') == 'delta':
+        result, removed = collect_delta(epss, state, journal)
+        print(f"Storing {len(result)} records in S3")
+        store_in_s3(s3_uploader, result)
 
-    
+        print(f"Inserting {len(result)} records into DynamoDB")
+        failed_writes = store_in_dynamodb(result, metadata_table, manifest).failed
+        if removed:
+            print(f"Deleting {len(removed)} records from DynamoDB")
+            failed_writes += delete_from_dynamodb(removed, metadata_table, manifest).failed
+    else:
+        pipeline_config = config.get('pipeline', {})
+        sinks = [
+            ParquetSink(s3_uploader.open_modeled_writer("EPSS", "findings", "vulnerability_data", ITEM_SCHEMA),
+                        ITEM_SCHEMA, batch_rows=pipeline_config.get('parquetBatchRows', 10000)),
+            DynamoDBSink(metadata_table, batch_size=pipeline_config.get('dynamoBatchSize', 1000),
+                         max_workers=pipeline_config.get('dynamoWorkers', 10), manifest=manifest)
+        ]
+        count = run_pipeline(epss, sinks, pipeline_config, state, journal)
+        print(f"Stored {count} records in S3 and DynamoDB")
+        failed_writes = sinks[1].failed
+
+    if manifest is not None:
+        sync_manifest(manifest, metadata_table, ingestion.get('mode', 'full') != 'delta', failed_writes, epss.failed)
+
+    if journal is not None:
+        journal.close()
+    if state is not None:
+        state.save()
+        print(f"Saved ingestion watermarks {state.watermarks}")
+    if failed_writes or epss.failed:
+        METRICS.flush()
+        raise IncompleteLoadError(f"Incomplete load: {failed_writes} failed writes, {epss.failed} failed lookups, "
+                                  f"dataset version left at {metadata_table.dataset_version()}")
+    print(f"Dataset version is now {metadata_table.bump_dataset_version()}")
+    METRICS.flush()
@@ -0,0 +1,285 @@
+""" Persistent on-disk HTTP response cache for the CVE and EPSS fetches """
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from dataclasses import asdict, dataclass
+from urllib.parse import urlencode
+
+import aiohttp
+import requests
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 1 << 30
+
+# Transport errors worth retrying through a RateController
+SYNC_RETRY_ON = (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+ASYNC_RETRY_ON = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+FetchedResponse = namedtuple("FetchedResponse", ["status", "headers", "body"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+@dataclass
+class CacheStats:
+    """ Hit/miss counters for a ResponseCache """
+    hits: int = 0
+    misses: int = 0
+    revalidated: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def __str__(self):
+        lookups = self.hits + self.revalidated + self.misses
+        ratio = (self.hits + self.revalidated) / lookups if lookups else 0.0
+        return f"{asdict(self)} hit ratio {ratio:.1%}"
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """ A response body stored in the cache with its validators """
+    body: bytes
+    etag: str
+    last_modified: str
+    fetched_at: float
+
+
+def cache_key(method, url, params=None):
+    """ Build the cache key of a request from its method, URL and sorted query parameters """
+    if params:
+        url = f"{url}?{urlencode(sorted(params.items()))}"
+    return f"{method} {url}"
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache keyed by request URL.
+
+    Entries younger than the TTL are served without any network call. Stale
+    entries are revalidated with If-None-Match / If-Modified-Since, and the
+    least recently used entries are evicted once the cache grows past
+    max_bytes. A single connection is shared by all threads behind a lock.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a cache from the "httpCache" config block.
+
+        Returns:
+            A ResponseCache, or None when the block is missing or disabled.
+        """
+        if not config or not config.get('enabled', True):
+            return None
+        return cls(config['path'],
+                   ttl=config.get('ttl', DEFAULT_TTL),
+                   max_bytes=config.get('maxBytes', DEFAULT_MAX_BYTES))
+
+    def lookup(self, key):
+        """
+        Get a cached response and mark it as recently used.
+
+        Returns:
+            A CachedResponse or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return CachedResponse(*row)
+
+    def is_fresh(self, entry, ttl=None):
+        """ Whether an entry can be served without revalidation """
+        return time.time() - entry.fetched_at < (self.ttl if ttl is None else ttl)
+
+    def store(self, key, body, etag=None, last_modified=None):
+        """ Insert or replace a response, evicting least recently used entries if needed """
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, body, etag, last_modified, now, now, len(body)))
+            self._size += len(body) - (old[0] if old else 0)
+            self.stats.stores += 1
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def refresh(self, key):
+        """ Restart the TTL of an entry after a 304 Not Modified """
+        with self._lock:
+            now = time.time()
+            self._conn.execute("UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+
+    def _evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its budget
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.stats.evictions += len(evicted)
+
+    def count(self, counter):
+        """ Increment one of the CacheStats counters """
+        with self._lock:
+            setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+
+    def close(self):
+        """ Close the underlying database """
+        with self._lock:
+            self._conn.close()
+
+
+class HTTPStatusError(Exception):
+    """ Raised by the async fetch path for error responses """
+
+    def __init__(self, url, status):
+        super().__init__(f"Error: received status code {status} from {url}")
+        self.url = url
+        self.status = status
+
+
+def _conditional_headers(entry):
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+def _fresh_entry(cache, key, ttl):
+    """
+    Look up a request in the cache.
+
+    Returns:
+        The body of a fresh entry (counted as a hit) or None, and the entry to revalidate, if any.
+    """
+    entry = cache.lookup(key) if cache is not None else None
+    if entry is not None and cache.is_fresh(entry, ttl):
+        cache.count('hits')
+        return entry.body, entry
+    return None, entry
+
+
+def _not_modified(cache, key, entry):
+    """ Serve a revalidated entry after a 304 Not Modified """
+    cache.count('revalidated')
+    cache.refresh(key)
+    return entry.body
+
+
+def _store(cache, key, body, headers):
+    """ Cache a fetched body with its validators """
+    cache.count('misses')
+    cache.store(key, body, headers.get('ETag'), headers.get('Last-Modified'))
+
+
+def _send(session, method, url, limiter, **kwargs):
+    def send():
+        return session.request(method, url, **kwargs)
+    if limiter is None:
+        return send()
+    return limiter.request(send, retry_on=SYNC_RETRY_ON)
+
+
+def cached_request_json(session, method, url, cache, ttl=None, params=None, headers=None, limiter=None, **kwargs):
+    """
+    Issue a requests call through the cache and decode its JSON body.
+
+    Args:
+        session: A requests.Session (or the requests module).
+        method: HTTP method.
+        url: Request URL.
+        cache: ResponseCache, or None to bypass caching.
+        ttl: Optional TTL overriding the cache default for this request.
+        params: Query parameters, part of the cache key.
+        headers: Extra request headers.
+        limiter: Optional RateController pacing and retrying the request.
+
+    Returns:
+        The decoded JSON body.
+    """
+    if cache is None:
+        response = _send(session, method, url, limiter, params=params, headers=headers, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    key = cache_key(method, url, params)
+    body, entry = _fresh_entry(cache, key, ttl)
+    if body is not None:
+        return json.loads(body)
+
+    response = _send(session, method, url, limiter, params=params,
+                     headers={**(headers or {}), **_conditional_headers(entry)}, **kwargs)
+    if response.status_code == 304 and entry is not None:
+        return json.loads(_not_modified(cache, key, entry))
+    response.raise_for_status()
+    _store(cache, key, response.content, response.headers)
+    return response.json()
+
+
+async def cached_get_json_async(session, url, cache, ttl=None, limiter=None):
+    """
+    aiohttp counterpart of cached_request_json for GET requests.
+
+    The SQLite cache calls block, so they run in the default executor rather
+    than on the event loop.
+    """
+    key = cache_key("GET", url)
+    body, entry = await asyncio.to_thread(_fresh_entry, cache, key, ttl)
+    if body is not None:
+        return json.loads(body)
+
+    async def send():
+        async with session.get(url, headers=_conditional_headers(entry)) as response:
+            return FetchedResponse(response.status, response.headers, await response.read())
+
+    if limiter is None:
+        response = await send()
+    else:
+        response = await limiter.request_async(send, retry_on=ASYNC_RETRY_ON)
+    if response.status == 304 and entry is not None:
+        return json.loads(await asyncio.to_thread(_not_modified, cache, key, entry))
+    if response.status >= 400:
+        raise HTTPStatusError(url, response.status)
+    if cache is not None:
+        await asyncio.to_thread(_store, cache, key, response.body, response.headers)
+    return json.loads(response.body)
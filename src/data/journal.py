@@ -0,0 +1,135 @@
+""" Append-only checkpoint journal and dead-letter file for long-running ingestion jobs """
+import json
+import os
+import threading
+import time
+import traceback
+
+COMPLETED_FILE = "completed.jsonl"
+DEAD_LETTER_FILE = "dead_letter.jsonl"
+DEFAULT_CHECKPOINT_EVERY = 100
+
+
+class IngestionJournal:
+    """
+    Checkpoints enriched CVE records so an interrupted run can resume.
+
+    Every enriched record is appended to completed.jsonl, and the file is
+    flushed and fsynced every checkpoint_every records. CVEs whose enrichment
+    failed go to dead_letter.jsonl with the error instead of failing the run.
+    A resumed run replays the completed records and retries everything else,
+    including the dead letters.
+    """
+
+    def __init__(self, directory, checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+        os.makedirs(directory, exist_ok=True)
+        self.completed_path = os.path.join(directory, COMPLETED_FILE)
+        self.dead_letter_path = os.path.join(directory, DEAD_LETTER_FILE)
+        self.checkpoint_every = checkpoint_every
+        self.completed = set()
+        self.failed = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._truncate_partial_line()
+        for record in self._read_completed():
+            self.completed.add(record['cve_id'])
+        self._completed_file = open(self.completed_path, "a", encoding="utf-8")
+        self._dead_letter_file = open(self.dead_letter_path, "a", encoding="utf-8")
+
+    @classmethod
+    def from_config(cls, config, resume=False):
+        """
+        Open the journal configured under "ingestion".
+
+        Args:
+            config: The "ingestion" config block.
+            resume: Keep the previous run's checkpoints instead of starting over.
+
+        Returns:
+            An IngestionJournal, or None when no journalDir is configured.
+        """
+        if not config.get('journalDir'):
+            return None
+        if not resume:
+            for name in (COMPLETED_FILE, DEAD_LETTER_FILE):
+                path = os.path.join(config['journalDir'], name)
+                if os.path.exists(path):
+                    os.remove(path)
+        journal = cls(config['journalDir'], config.get('checkpointEvery', DEFAULT_CHECKPOINT_EVERY))
+        if resume:
+            print(f"Resuming with {len(journal.completed)} CVEs already enriched")
+        return journal
+
+    def _truncate_partial_line(self):
+        """
+        Cut off the half-written last line left by a crash, so the records appended
+        by this run start on a line of their own.
+        """
+        if not os.path.exists(self.completed_path):
+            return
+        with open(self.completed_path, "rb+") as completed_file:
+            completed_file.seek(0, os.SEEK_END)
+            size = completed_file.tell()
+            if not size:
+                return
+            completed_file.seek(size - 1)
+            if completed_file.read(1) == b"\n":
+                return
+            completed_file.seek(0)
+            complete = completed_file.read().rfind(b"\n") + 1
+            completed_file.truncate(complete)
+        print(f"Dropped a partial record of {size - complete} bytes from {self.completed_path}")
+
+    def _read_completed(self):
+        if not os.path.exists(self.completed_path):
+            return
+        with open(self.completed_path, "r", encoding="utf-8") as completed_file:
+            for line in completed_file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A damaged line only loses its own record; the CVE is fetched again
+                    continue
+
+    def replay(self):
+        """ Yield the records checkpointed by previous runs """
+        yield from self._read_completed()
+
+    def record(self, record):
+        """ Append an enriched record, checkpointing every checkpoint_every records """
+        line = json.dumps(record)
+        with self._lock:
+            self._completed_file.write(line + "\n")
+            self.completed.add(record['cve_id'])
+            self._pending += 1
+            if self._pending >= self.checkpoint_every:
+                self._checkpoint()
+
+    def dead_letter(self, epss, exc):
+        """ Record a CVE whose enrichment failed, with its EPSS row and the error """
+        entry = {
+            "cve": epss.get('cve'),
+            "epss": epss,
+            "error": repr(exc),
+            "traceback": "".join(traceback.format_exception(type(exc), exc, exc.__traceback__)),
+            "failedAt": time.time()
+        }
+        with self._lock:
+            self._dead_letter_file.write(json.dumps(entry) + "\n")
+            self._dead_letter_file.flush()
+            self.failed += 1
+        print(f"Failed to enrich {epss.get('cve')}: {exc!r}")
+
+    def _checkpoint(self):
+        self._completed_file.flush()
+        os.fsync(self._completed_file.fileno())
+        self._pending = 0
+
+    def close(self):
+        """ Checkpoint outstanding records and close the files """
+        with self._lock:
+            self._checkpoint()
+            self._completed_file.close()
+            self._dead_letter_file.close()
+        if self.failed:
+            print(f"{self.failed} CVEs failed, see {self.dead_letter_path}")
@@ -0,0 +1,130 @@
+""" Content-hash manifest of the items written to DynamoDB, used to skip writes that change nothing """
+import gzip
+import hashlib
+import json
+import os
+
+KEY_SEPARATOR = "\x1f"
+
+
+def content_hash(item, salt=""):
+    """ Stable hash of an item, independent of attribute order """
+    payload = salt + json.dumps(item, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class WriteManifest:
+    """
+    Hashes of the items written by the previous run, keyed by primary key.
+
+    An item is written only when its key is new or its hash changed; the
+    hashes seen during this run become the next run's manifest. In a full
+    load every item is seen, so the keys of the previous manifest that were
+    not seen again are the items to delete.
+
+    The manifest is bound to one incarnation of the table: when the table was
+    created again since, e.g. a DynamoDB Local running in memory, the previous
+    hashes describe items that are gone and are discarded. The hashes also
+    cover the write encoding, so changing the sharding or compression settings
+    rewrites every item.
+    """
+
+    def __init__(self, path, key_names=("hashKey", "sortKey"), s3_key=None, s3_uploader=None,
+                 delete_removed=False, table_identity=None, encoding=None):
+        self.path = path
+        self.key_names = key_names
+        self.s3_key = s3_key
+        self.s3_uploader = s3_uploader
+        self.delete_removed = delete_removed
+        self.table_identity = table_identity
+        self.salt = content_hash(encoding) if encoding else ""
+        self.previous = {}
+        if path and os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as manifest_file:
+                self.previous = self._items_of(json.load(manifest_file))
+        self.current = {}
+        self.written = 0
+        self.skipped = 0
+        self.deleted = 0
+
+    def _items_of(self, saved):
+        """ Hashes of a saved manifest, or none when it was written for another table """
+        if self.table_identity is None:
+            return saved.get('items', {})
+        if saved.get('table') != self.table_identity:
+            print(f"Discarding the write manifest, it was not written for table {self.table_identity}")
+            return {}
+        return saved['items']
+
+    @classmethod
+    def from_config(cls, config, s3_uploader=None, table=None):
+        """
+        Open the manifest configured under "ingestion.manifest".
+
+        When s3Key is set, the manifest is downloaded from the bucket first and
+        uploaded back by save. Given the table written to, the manifest is bound
+        to it and to its write encoding.
+
+        Returns:
+            A WriteManifest, or None when no manifest path is configured.
+        """
+        if not config or not config.get('path'):
+            return None
+        if config.get('s3Key') and s3_uploader is not None:
+            if s3_uploader.download_file(config['s3Key'], config['path']):
+                print(f"Downloaded write manifest from {config['s3Key']}")
+        manifest = cls(config['path'], s3_key=config.get('s3Key'), s3_uploader=s3_uploader,
+                       delete_removed=config.get('deleteRemoved', False),
+                       table_identity=table.table_identity() if table is not None else None,
+                       encoding=table.write_encoding() if table is not None else None)
+        print(f"Loaded write manifest with {len(manifest.previous)} items")
+        return manifest
+
+    def key(self, item):
+        """ Manifest key of an item """
+        return KEY_SEPARATOR.join(str(item[name]) for name in self.key_names)
+
+    def changed(self, item):
+        """ Record an item of this run and tell whether it has to be written """
+        key = self.key(item)
+        digest = content_hash(item, self.salt)
+        self.current[key] = digest
+        if self.previous.get(key) == digest:
+            self.skipped += 1
+            return False
+        self.written += 1
+        return True
+
+    def filter(self, items):
+        """ Get the items that are new or changed """
+        return [item for item in items if self.changed(item)]
+
+    def removed(self):
+        """ Keys of the previous run that were not seen in this (full) run """
+        return [dict(zip(self.key_names, key.split(KEY_SEPARATOR)))
+                for key in self.previous if key not in self.current]
+
+    def forget(self, keys):
+        """ Drop deleted items, so they are written again if they come back """
+        for key in keys:
+            self.previous.pop(self.key(key), None)
+            self.current.pop(self.key(key), None)
+
+    def carry_over(self):
+        """ Keep the hashes of items not seen in this run, for partial (delta) runs """
+        self.current = {**self.previous, **self.current}
+
+    def save(self):
+        """ Atomically write the manifest of this run, uploading it when s3Key is configured """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as manifest_file:
+            json.dump({"table": self.table_identity, "items": self.current}, manifest_file, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        if self.s3_key and self.s3_uploader is not None:
+            self.s3_uploader.upload_file(self.path, self.s3_key)
+
+    def __str__(self):
+        return f"{self.written} written, {self.skipped} unchanged writes avoided, {self.deleted} deleted"
@@ -0,0 +1,153 @@
+""" Bulk CVE enrichment from local NVD JSON feed files (nvdcve-*.json.gz) """
+import glob
+import gzip
+import io
+import json
+
+# Top-level array holding the CVE entries, for the 1.1 and 2.0 feed schemas
+FEED_ITEM_KEYS = ("CVE_Items", "vulnerabilities")
+READ_CHUNK_SIZE = 1 << 20
+_WHITESPACE = " \t\n\r"
+
+
+def _open_feed(path):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_feed_items(stream):
+    """
+    Incrementally decode the entries of an NVD feed without materialising the
+    whole document: the stream is read in chunks and each array element is
+    decoded on its own with raw_decode as soon as it is complete.
+
+    Args:
+        stream: Text stream over a feed document.
+
+    Yields:
+        Each raw CVE entry of the feed.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    def fill():
+        nonlocal buffer, eof
+        chunk = stream.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+    # Seek to the opening bracket of the item array
+    start = -1
+    while start < 0:
+        for key in FEED_ITEM_KEYS:
+            idx = buffer.find(f'"{key}"')
+            if idx >= 0:
+                start = buffer.find("[", idx)
+                break
+        if start < 0:
+            if eof:
+                return
+            fill()
+    pos = start + 1
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE + ",":
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Truncated NVD feed: item array is not closed")
+            buffer, pos = "", 0
+            fill()
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The element straddles the chunk boundary
+            if eof:
+                raise
+            buffer, pos = buffer[pos:], 0
+            fill()
+            continue
+        yield item
+        pos = end
+
+
+def _timestamp(value):
+    """ Normalise NVD timestamps ("2023-10-10T01:15Z") to the cve.circl.lu format ("2023-10-10T01:15:00") """
+    if not value:
+        return value
+    value = value.rstrip("Z").split(".")[0]
+    return value + ":00" if value.count(":") == 1 else value
+
+
+def _vulnerable_cpes(nodes, cpes):
+    for node in nodes:
+        for match in node.get("cpe_match", []):
+            if match.get("vulnerable"):
+                cpes.setdefault(match["cpe23Uri"], None)
+        for match in node.get("cpeMatch", []):
+            if match.get("vulnerable"):
+                cpes.setdefault(match["criteria"], None)
+        _vulnerable_cpes(node.get("children", []), cpes)
+
+
+def to_cve_details(item):
+    """
+    Convert a 1.1 or 2.0 feed entry to the shape returned by the cve.circl.lu API,
+    so it can be fed straight into build_record.
+    """
+    cpes = {}
+    if "CVE_data_meta" in item.get("cve", {}):
+        cve = item["cve"]
+        descriptions = cve.get("description", {}).get("description_data", [])
+        _vulnerable_cpes(item.get("configurations", {}).get("nodes", []), cpes)
+        details = {
+            "id": cve["CVE_data_meta"]["ID"],
+            "assigner": cve["CVE_data_meta"].get("ASSIGNER"),
+            "Published": _timestamp(item.get("publishedDate")),
+            "last-modified": _timestamp(item.get("lastModifiedDate")),
+        }
+    else:
+        cve = item["cve"]
+        descriptions = cve.get("descriptions", [])
+        for configuration in cve.get("configurations", []):
+            _vulnerable_cpes(configuration.get("nodes", []), cpes)
+        details = {
+            "id": cve["id"],
+            "assigner": cve.get("sourceIdentifier"),
+            "Published": _timestamp(cve.get("published")),
+            "last-modified": _timestamp(cve.get("lastModified")),
+        }
+    summaries = [d["value"] for d in descriptions if d.get("lang") == "en"] or [d["value"] for d in descriptions]
+    details["summary"] = summaries[0] if summaries else ""
+    details["vulnerable_product"] = list(cpes)
+    return details
+
+
+def load_nvd_lookup(feed_glob, wanted=None):
+    """
+    Build a CVE id -> details lookup from local NVD feed files.
+
+    Args:
+        feed_glob: Glob matching the feed files, e.g. /var/lib/nvd/nvdcve-*.json.gz.
+        wanted: Optional set of CVE ids; other entries are skipped to bound memory.
+
+    Returns:
+        A dict of CVE id to cve.circl.lu-shaped details.
+    """
+    lookup = {}
+    paths = sorted(glob.glob(feed_glob))
+    if not paths:
+        raise ValueError(f"No NVD feed files match {feed_glob}")
+    for path in paths:
+        print(f"Reading NVD feed {path}")
+        with _open_feed(path) as stream:
+            for item in iter_feed_items(stream):
+                details = to_cve_details(item)
+                if wanted is None or details["id"] in wanted:
+                    lookup[details["id"]] = details
+    return lookup
@@ -0,0 +1,235 @@
+""" Bounded-memory streaming pipeline: fetch -> enrich -> transform -> fan-out to sinks """
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+
+DEFAULT_QUEUE_SIZE = 1000
+
+_DONE = object()
+# Sent to the sinks instead of _DONE when the items could not all be produced
+_ABORT = object()
+
+
+def stream(producer, maxsize=DEFAULT_QUEUE_SIZE, name="stage"):
+    """
+    Run a producer in a background thread and iterate over what it emits.
+
+    The producer is called with an "emit" callback. Items are handed over
+    through a bounded queue, so a producer that runs ahead of its consumer
+    blocks instead of buffering. An exception raised by the producer is
+    re-raised in the consumer once the items emitted before it are consumed.
+
+    Args:
+        producer: Callable taking the emit callback.
+        maxsize: Capacity of the queue between the two threads.
+        name: Name of the background thread.
+
+    Yields:
+        The emitted items.
+    """
+    channel = queue.Queue(maxsize=maxsize)
+    failure = []
+
+    def run():
+        try:
+            producer(channel.put)
+        except BaseException as exc:  # pylint: disable=broad-except
+            failure.append(exc)
+        finally:
+            channel.put(_DONE)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    while True:
+        item = channel.get()
+        if item is _DONE:
+            break
+        yield item
+    thread.join()
+    if failure:
+        raise failure[0]
+
+
+def buffered(iterable, maxsize=DEFAULT_QUEUE_SIZE, name="stage"):
+    """ Run an iterable in its own thread behind a bounded queue """
+    def producer(emit):
+        for item in iterable:
+            emit(item)
+    return stream(producer, maxsize, name)
+
+
+class DynamoDBSink:
+    """
+    Writes items to DynamoDB in fixed-size batches as soon as a batch is full.
+
+    At most max_workers batches are written concurrently, and at most as many
+    again are queued behind them. With a WriteManifest, items that did not
+    change since the previous run are not written.
+    """
+
+    def __init__(self, table, batch_size=1000, max_workers=10, manifest=None):
+        self.table = table
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.batch = []
+        self.written = 0
+        self.failed = 0
+        self.errors = []
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.slots = threading.BoundedSemaphore(max_workers * 2)
+
+    def write(self, item):
+        """ Add an item, submitting the batch once it is full """
+        if self.manifest is not None and not self.manifest.changed(item):
+            return
+        self.batch.append(item)
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        self.slots.acquire()
+        future = self.executor.submit(self.table.batch_put, batch)
+        future.add_done_callback(lambda f, size=len(batch): self._done(f, size))
+
+    def _done(self, future, size):
+        self.slots.release()
+        if future.exception() is not None:
+            self.errors.append(future.exception())
+            self.failed += size
+        else:
+            result = future.result()
+            self.written += result.written
+            self.failed += result.failed
+
+    def close(self):
+        """ Write the last partial batch and wait for every batch to land """
+        self._flush()
+        self.executor.shutdown(wait=True)
+        print(f"DynamoDB sink wrote {self.written} items, {self.failed} failed")
+        if self.errors:
+            raise self.errors[0]
+
+    def abort(self):
+        """ Drop the partial batch and the batches not started yet, waiting for those in flight """
+        self.batch = []
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        print(f"DynamoDB sink aborted after writing {self.written} items")
+
+
+class ParquetSink:
+    """
+    Writes items as Arrow record batches to a parquet object in S3.
+
+    Values of string columns are converted to str so that items carrying a
+    numeric fallback (e.g. an empty EPSS score) still fit the schema.
+    """
+
+    def __init__(self, writer, schema, batch_rows=10000):
+        self.writer = writer
+        self.schema = schema
+        self.batch_rows = batch_rows
+        self.rows = []
+        self.written = 0
+        self._string_fields = [field.name for field in schema if pa.types.is_string(field.type)]
+
+    def write(self, item):
+        """ Add an item, writing a record batch once enough rows are buffered """
+        row = dict(item)
+        for name in self._string_fields:
+            value = row.get(name)
+            if value is not None and not isinstance(value, str):
+                row[name] = str(value)
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            self.writer.write_batch(pa.RecordBatch.from_pylist(self.rows, schema=self.schema))
+            self.written += len(self.rows)
+            self.rows = []
+
+    def close(self):
+        """ Write the last record batch and upload the object """
+        self._flush()
+        self.writer.close()
+        print(f"S3 sink wrote {self.written} items")
+
+    def abort(self):
+        """ Discard the object without uploading it """
+        self.rows = []
+        self.writer.abort()
+        print(f"S3 sink discarded {self.written} items")
+
+
+def fan_out(items, sinks, maxsize=DEFAULT_QUEUE_SIZE):
+    """
+    Deliver every item to every sink, each sink draining its own bounded queue
+    in its own thread so a slow sink only stalls the others once its queue is full.
+
+    When iterating over the items fails, every sink is aborted instead of
+    closed, so a partial load is neither uploaded nor completed. A sink whose
+    write fails is aborted too.
+
+    Args:
+        items: Iterable of items.
+        sinks: Objects with write(item), close() and abort().
+        maxsize: Capacity of each sink queue.
+
+    Returns:
+        The number of items delivered.
+    """
+    channels = [queue.Queue(maxsize=maxsize) for _ in sinks]
+    failures = []
+
+    def drain(sink, channel):
+        item = None
+        try:
+            while True:
+                item = channel.get()
+                if item is _DONE or item is _ABORT:
+                    break
+                sink.write(item)
+            if item is _ABORT:
+                sink.abort()
+            else:
+                sink.close()
+        except BaseException as exc:  # pylint: disable=broad-except
+            failures.append(exc)
+            if item is _DONE or item is _ABORT:
+                return
+            # Keep consuming so the producer never blocks on a dead sink, then discard what it wrote
+            while item is not _DONE and item is not _ABORT:
+                item = channel.get()
+            try:
+                sink.abort()
+            except Exception as abort_exc:  # pylint: disable=broad-except
+                print(f"Failed to abort {type(sink).__name__}: {abort_exc!r}")
+
+    threads = [
+        threading.Thread(target=drain, args=(sink, channel), name=f"sink-{type(sink).__name__}", daemon=True)
+        for sink, channel in zip(sinks, channels)
+    ]
+    for thread in threads:
+        thread.start()
+    count = 0
+    end = _ABORT
+    try:
+        for item in items:
+            for channel in channels:
+                channel.put(item)
+            count += 1
+        end = _DONE
+    finally:
+        for channel in channels:
+            channel.put(end)
+        for thread in threads:
+            thread.join()
+    if failures:
+        raise failures[0]
+    return count
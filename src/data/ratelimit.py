@@ -0,0 +1,255 @@
+""" Adaptive rate limiting and AIMD concurrency control for the upstream CVE/EPSS APIs """
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+import backoff
+
+DEFAULT_RATE = 50.0
+DEFAULT_MAX_TRIES = 6
+DEFAULT_MAX_DELAY = 60.0
+# Poll interval while waiting for a concurrency slot to free up
+SLOT_POLL_INTERVAL = 0.01
+THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class LimiterStats:
+    """ Counters reported by a RateController """
+    requests: int = 0
+    throttled: int = 0
+    retries: int = 0
+    failures: int = 0
+    concurrency: float = 0.0
+    elapsed: float = 0.0
+
+    def __str__(self):
+        rate = self.requests / self.elapsed if self.elapsed else 0.0
+        return (f"{self.requests} requests at {rate:.1f} req/s, {self.throttled} throttled, "
+                f"{self.retries} retries, {self.failures} failures, concurrency {self.concurrency:.0f}")
+
+
+def _status(response):
+    """ Status code of a requests.Response or a FetchedResponse """
+    return response.status_code if hasattr(response, "status_code") else response.status
+
+
+def retry_after_seconds(headers):
+    """
+    Parse a Retry-After header given either as seconds or as an HTTP date.
+
+    Returns:
+        The number of seconds to wait, or None.
+    """
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateController:
+    """
+    Token bucket plus AIMD concurrency window shared by every call to one upstream.
+
+    Requests are admitted at no more than "rate" per second (with bursts of up
+    to "burst") and with no more than the current concurrency window in
+    flight. Every successful response grows the window by 1/window, i.e. by
+    one slot per window's worth of successes; a 429, a 5xx or a timeout
+    shrinks it multiplicatively, at most once per cooldown so one burst of
+    rejections counts once. A request interrupted before it got an answer
+    leaves the window unchanged. A Retry-After pauses every caller, not just the
+    one that received it. The state is guarded by a lock and is used from
+    threads and from the asyncio event loop alike.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=None, initial_concurrency=8, min_concurrency=1,
+                 max_concurrency=64, decrease_factor=0.5, cooldown=1.0, max_tries=DEFAULT_MAX_TRIES,
+                 max_delay=DEFAULT_MAX_DELAY):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.max_tries = max_tries
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._limit = float(initial_concurrency)
+        self._in_flight = 0
+        self._started_at = time.monotonic()
+        self._stats = LimiterStats()
+
+    @classmethod
+    def from_config(cls, config):
+        """ Build a controller from a "rateLimits" config entry """
+        config = config or {}
+        return cls(rate=config.get('rate', DEFAULT_RATE),
+                   burst=config.get('burst'),
+                   initial_concurrency=config.get('initialConcurrency', 8),
+                   min_concurrency=config.get('minConcurrency', 1),
+                   max_concurrency=config.get('maxConcurrency', 64),
+                   decrease_factor=config.get('decreaseFactor', 0.5),
+                   cooldown=config.get('cooldown', 1.0),
+                   max_tries=config.get('maxTries', DEFAULT_MAX_TRIES),
+                   max_delay=config.get('maxDelay', DEFAULT_MAX_DELAY))
+
+    @property
+    def stats(self):
+        """ Snapshot of the counters, with the achieved request rate """
+        with self._lock:
+            return LimiterStats(**{
+                **self._stats.__dict__,
+                "concurrency": self._limit,
+                "elapsed": time.monotonic() - self._started_at
+            })
+
+    def try_acquire(self):
+        """
+        Take a token and a concurrency slot if both are available.
+
+        Returns:
+            0 when admitted, otherwise the number of seconds to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._in_flight >= int(self._limit):
+                return SLOT_POLL_INTERVAL
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+            self._tokens -= 1
+            self._in_flight += 1
+            self._stats.requests += 1
+            return 0
+
+    def acquire(self):
+        """ Block the calling thread until the request is admitted """
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """ Wait on the event loop until the request is admitted """
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, throttled, retry_after=None):
+        """
+        Free the concurrency slot of a finished request and adapt the window.
+
+        Args:
+            throttled: Whether upstream pushed back (429, 5xx or timeout).
+            retry_after: Seconds every caller should wait, from a Retry-After header.
+        """
+        with self._lock:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if not throttled:
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+                return
+            self._stats.throttled += 1
+            if now - self._decreased_at >= self.cooldown:
+                self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+                self._decreased_at = now
+
+    def abandon(self):
+        """
+        Free the concurrency slot of a request that got no answer because it was
+        interrupted (e.g. cancelled), leaving the window as it is.
+        """
+        with self._lock:
+            self._in_flight -= 1
+
+    def _delays(self):
+        delays = backoff.expo(base=2, factor=0.5, max_value=self.max_delay)
+        next(delays)  # prime the generator, which yields None first
+        return delays
+
+    def _outcome(self, attempt, response, error):
+        """ Decide whether to retry an attempt and how long upstream asked us to wait """
+        throttled = error is not None or _status(response) in THROTTLE_STATUSES
+        retry_after = retry_after_seconds(getattr(response, "headers", None)) if response is not None else None
+        self.release(throttled, retry_after)
+        if not throttled:
+            return False, None
+        with self._lock:
+            if attempt + 1 >= self.max_tries:
+                self._stats.failures += 1
+                return False, None
+            self._stats.retries += 1
+        return True, retry_after
+
+    def request(self, send, retry_on=()):
+        """
+        Issue a request through the controller, retrying throttled attempts with
+        full-jitter exponential backoff (or at least Retry-After seconds).
+
+        Args:
+            send: Callable issuing the request and returning the response.
+            retry_on: Exception types (timeouts, connection errors) that are retried.
+
+        Returns:
+            The last response; after the final attempt it may still be a 429/5xx.
+        """
+        delays = self._delays()
+        for attempt in range(self.max_tries):
+            self.acquire()
+            response, error = None, None
+            try:
+                response = send()
+            except retry_on as exc:
+                error = exc
+            except BaseException:
+                self.abandon()
+                raise
+            retry, retry_after = self._outcome(attempt, response, error)
+            if not retry:
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(max(retry_after or 0, backoff.full_jitter(next(delays))))
+        return response
+
+    async def request_async(self, send, retry_on=()):
+        """ Async counterpart of request, where send is a coroutine function """
+        delays = self._delays()
+        for attempt in range(self.max_tries):
+            await self.acquire_async()
+            response, error = None, None
+            try:
+                response = await send()
+            except retry_on as exc:
+                error = exc
+            except BaseException:
+                self.abandon()
+                raise
+            retry, retry_after = self._outcome(attempt, response, error)
+            if not retry:
+                if error is not None:
+                    raise error
+                return response
+            await asyncio.sleep(max(retry_after or 0, backoff.full_jitter(next(delays))))
+        return response
@@ -0,0 +1,95 @@
+""" Watermarks and per-CVE state for incremental (delta) ingestion """
+import json
+import os
+
+EMPTY_STATE = {
+    "watermarks": {
+        "epss": "",
+        "cve": ""
+    },
+    "cves": {}
+}
+
+
+class IngestionState:
+    """
+    State persisted between ingestion runs.
+
+    It keeps a high-watermark per source (the EPSS score "date" and the CVE
+    "lastModified") and, for every known CVE, the EPSS values and product list
+    that were last written. This is enough to tell which CVEs are new or
+    changed and to rebuild the cve_list of a product without reading the table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as state_file:
+                self.state = json.load(state_file)
+        else:
+            self.state = json.loads(json.dumps(EMPTY_STATE))
+
+    @property
+    def watermarks(self):
+        """ Get the per-source high-watermarks """
+        return self.state['watermarks']
+
+    @property
+    def cves(self):
+        """ Get the per-CVE state """
+        return self.state['cves']
+
+    def epss_changed(self, epss):
+        """ Whether an EPSS row is new or carries different scores than the last run """
+        known = self.cves.get(epss['cve'])
+        return known is None or known.get('epss') != epss['epss'] or known.get('percentile') != epss['percentile']
+
+    def record_epss(self, epss):
+        """ Remember the scores written for a CVE """
+        known = self.cves.setdefault(epss['cve'], {"productList": []})
+        known['epss'] = epss['epss']
+        known['percentile'] = epss['percentile']
+
+    def record_details(self, cve_id, product_list):
+        """
+        Remember the products of a re-enriched CVE.
+
+        Returns:
+            The previous product list of the CVE.
+        """
+        known = self.cves.setdefault(cve_id, {})
+        previous = known.get('productList', [])
+        known['productList'] = product_list
+        return previous
+
+    def product_cves(self, products):
+        """
+        Rebuild the cve_list of the given products from the stored per-CVE state.
+
+        Args:
+            products: Names of the products to rebuild.
+
+        Returns:
+            A dict of product name to list of CVE ids; products with no CVE left map to an empty list.
+        """
+        product_cve_map = {product: [] for product in products}
+        for cve_id, known in self.cves.items():
+            for product in known.get('productList', []):
+                if product in product_cve_map:
+                    product_cve_map[product].append(cve_id)
+        return product_cve_map
+
+    def advance(self, source, value):
+        """ Move a source watermark forward, never backwards """
+        if value and value > self.watermarks.get(source, ""):
+            self.watermarks[source] = value
+
+    def save(self):
+        """ Atomically persist the state """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as state_file:
+            json.dump(self.state, state_file)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,222 @@
+""" Storage backend interface shared by the DynamoDB wrapper and the embedded SQLite engine """
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+# Record type of the item holding the dataset version, bumped by every ingestion run
+DATASET_VERSION = "dataset#version"
+
+
+class InvalidStartKeyError(ValueError):
+    """
+    An exclusive start key that the listing resumed from could not have returned,
+    e.g. a forged cursor or one of a listing read from another index.
+    """
+
+
+def check_start_key(key, key_names, **expected):
+    """
+    Check that an exclusive start key has exactly the given key attributes, with
+    scalar values, and the expected value for the attributes given as keywords.
+
+    Raises:
+        InvalidStartKeyError: When it does not.
+    """
+    if (not isinstance(key, dict) or set(key) != set(key_names)
+            or not all(isinstance(value, (str, int, float)) and not isinstance(value, bool)
+                       for value in key.values())
+            or any(key[name] != value for name, value in expected.items())):
+        raise InvalidStartKeyError(f"Invalid exclusive start key: {key!r}")
+
+
+@dataclass
+class BulkWriteResult:
+    """
+    Outcome of a bulk write.
+    """
+    written: int = 0
+    failed: int = 0
+    retries: int = 0
+    throttles: int = 0
+    elapsed: float = 0.0
+    errors: list = field(default_factory=list)
+
+    @property
+    def throughput(self):
+        """
+        Items written per second.
+        """
+        return self.written / self.elapsed if self.elapsed else 0.0
+
+    def merge(self, other):
+        """
+        Add the counters of another result (elapsed time is not summed).
+        """
+        self.written += other.written
+        self.failed += other.failed
+        self.retries += other.retries
+        self.throttles += other.throttles
+        self.errors.extend(other.errors[:10 - len(self.errors)])
+        return self
+
+    def __str__(self):
+        return (f"{self.written} written, {self.failed} failed, {self.retries} retries, "
+                f"{self.throttles} throttles in {self.elapsed:.1f}s ({self.throughput:.0f} items/s)")
+
+
+class StorageBackend(ABC):
+    """
+    Table API used by the ingestion job and the GraphQL API.
+
+    Backends implement the abstract primitive operations below; the
+    list-returning query, query_source and scan helpers are built on their
+    iterators. Keys are given as dicts or tuples in key schema order, and
+    conditions as boto3 Key/Attr conditions, whatever the backend.
+    """
+
+    table_name = None
+    key_names = ()
+
+    @abstractmethod
+    def ensure_table(self, full=None):
+        """
+        Create the table and its indexes if needed.
+        """
+
+    @abstractmethod
+    def put_item(self, item):
+        """
+        Put an item into the table.
+        """
+
+    @abstractmethod
+    def batch_put(self, items: list) -> BulkWriteResult:
+        """
+        Put a list of items.
+        """
+
+    @abstractmethod
+    def batch_delete(self, keys: list) -> BulkWriteResult:
+        """
+        Delete the items with the given keys.
+        """
+
+    @abstractmethod
+    def batch_get(self, keys, projection_expression=None, expression_attribute_names=None) -> dict:
+        """
+        Get many items by key, as a dict keyed by key tuples.
+        """
+
+    @abstractmethod
+    def iter_query(self, condition, filter_expression=None, index_name=None, **options):
+        """
+        Lazily get the items matching a key condition.
+        """
+
+    @abstractmethod
+    def iter_source(self, source: str, **options):
+        """
+        Lazily list the items of a record type, in hashKey order.
+        """
+
+    @abstractmethod
+    def iter_scan(self, **options):
+        """
+        Lazily scan the table, yielding pages of items.
+        """
+
+    @abstractmethod
+    def table_identity(self) -> str:
+        """
+        Identifier of this incarnation of the table, which changes when the table
+        is dropped and created again.
+        """
+
+    def write_encoding(self) -> dict:
+        """
+        Settings that change how items are stored, e.g. sharding and compression.
+        """
+        return {}
+
+    def backfill_source_shards(self, **options) -> BulkWriteResult:
+        """
+        Add the sharded index key to the items written without one. Nothing to do
+        for backends without a sharded index.
+        """
+        return BulkWriteResult()
+
+    def _dataset_version_key(self):
+        return dict(zip(self.key_names, (DATASET_VERSION, DATASET_VERSION)))
+
+    def dataset_version(self):
+        """
+        Version of the data in the table, or None if no load has completed yet.
+        """
+        key = self._dataset_version_key()
+        item = self.batch_get([key]).get(tuple(key.values()))
+        return item.get('version') if item else None
+
+    def bump_dataset_version(self) -> str:
+        """
+        Mark the data as changed, so the readers caching it drop their copies.
+
+        Returns:
+            The new version.
+        """
+        version = datetime.now(timezone.utc).isoformat()
+        self.put_item({**self._dataset_version_key(), 'version': version})
+        return version
+
+    def big_batch_put(self, items, batch_size: int, max_workers: int = 20) -> BulkWriteResult:
+        """
+        Bulk load items in batches of batch_size. max_workers is a hint for backends writing concurrently.
+        """
+        start = time.monotonic()
+        result = BulkWriteResult()
+        items = list(items)
+        for i in range(0, len(items), batch_size):
+            result.merge(self.batch_put(items[i:i + batch_size]))
+        result.elapsed = time.monotonic() - start
+        print(f"Bulk loaded data into table {self.table_name}: {result}")
+        return result
+
+    def query(self, condition, filter_expression=None, index_name=None, **options) -> list:
+        """
+        Get every item matching a key condition.
+
+        Args:
+            condition: boto3 key condition.
+            filter_expression: Optional boto3 condition applied server-side.
+            index_name: Optional index to query.
+            options: Options forwarded to iter_query (projection, limit, order, start key).
+
+        Returns:
+            A list of the matching items.
+        """
+        return list(self.iter_query(condition, filter_expression, index_name, **options))
+
+    def query_source(self, source: str, **options) -> list:
+        """
+        Get every item of a record type (e.g. "cve#details").
+
+        Args:
+            source: The record type, i.e. the sortKey value.
+            options: Options forwarded to iter_source.
+
+        Returns:
+            A list of the items.
+        """
+        return list(self.iter_source(source, **options))
+
+    def scan(self, **kwargs):
+        """
+        Get all items from the table.
+
+        Args:
+            kwargs: Options forwarded to iter_scan (segments, projection, filter, page limit).
+
+        Returns:
+            A list of the items from the table.
+        """
+        return [item for page in self.iter_scan(**kwargs) for item in page]
@@ -0,0 +1,150 @@
+import gzip
+import json
+import threading
+from dataclasses import dataclass
+
+from boto3.dynamodb.types import Binary
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+
+# Compressed values are stored as Binary: MAGIC, one codec byte, then the compressed JSON
+MAGIC = b"\xc0\xde"
+CODEC_IDS = {"gzip": b"g", "zstd": b"z"}
+DEFAULT_THRESHOLD = 1024
+
+
+@dataclass
+class CodecStats:
+    """
+    Bytes saved by compressing one attribute.
+    """
+    encoded: int = 0
+    decoded: int = 0
+    raw_bytes: int = 0
+    stored_bytes: int = 0
+
+    @property
+    def saved_bytes(self):
+        return self.raw_bytes - self.stored_bytes
+
+    @property
+    def ratio(self):
+        """
+        Stored size as a fraction of the raw size.
+        """
+        return self.stored_bytes / self.raw_bytes if self.raw_bytes else 1.0
+
+    def __str__(self):
+        return (f"{self.encoded} compressed, {self.decoded} decompressed, "
+                f"{self.raw_bytes} -> {self.stored_bytes} bytes ({self.saved_bytes} saved, ratio {self.ratio:.2f})")
+
+
+class AttributeCodec:
+    """
+    Stores configured large attributes as compressed binary and restores them on read.
+
+    A value is JSON encoded and compressed only when the encoding is at least
+    "threshold" bytes, so small values keep their native type and stay usable
+    in filter expressions. Decoding recognises compressed values by their
+    header, so items written before compression was enabled (or below the
+    threshold) are returned unchanged. A disabled codec writes every value
+    as-is but still restores the values compressed while it was enabled.
+    """
+
+    def __init__(self, attributes, codec="gzip", threshold=DEFAULT_THRESHOLD, level=None, enabled=True):
+        if codec == "zstd" and zstandard is None:
+            print("zstandard is not installed, compressing with gzip")
+            codec = "gzip"
+        if codec not in CODEC_IDS:
+            raise ValueError(f"Unknown compression codec: {codec}")
+        self.attributes = set(attributes)
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+        self.enabled = enabled
+        self.stats = {name: CodecStats() for name in self.attributes}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a codec from a table's "compression" config entry. Compression
+        is off unless the entry sets "enabled" to true.
+
+        Returns:
+            An AttributeCodec, or None when no attributes are configured.
+        """
+        if not config or not config.get('attributes'):
+            return None
+        return cls(config['attributes'],
+                   codec=config.get('codec', 'gzip'),
+                   threshold=config.get('threshold', DEFAULT_THRESHOLD),
+                   level=config.get('level'),
+                   enabled=config.get('enabled', False))
+
+    def _compress(self, data):
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level or 3).compress(data)
+        return gzip.compress(data, compresslevel=self.level or 6)
+
+    @staticmethod
+    def _decompress(codec_id, data):
+        if codec_id == CODEC_IDS["zstd"]:
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read zstd compressed attributes")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def encode(self, item):
+        """
+        Get a copy of an item with its large configured attributes compressed.
+        """
+        if not self.enabled:
+            return item
+        encoded = None
+        for name in self.attributes.intersection(item):
+            value = item[name]
+            try:
+                raw = json.dumps(value, separators=(",", ":")).encode("utf-8")
+            except TypeError:
+                continue
+            if len(raw) < self.threshold:
+                continue
+            stored = MAGIC + CODEC_IDS[self.codec] + self._compress(raw)
+            if len(stored) >= len(raw):
+                continue
+            if encoded is None:
+                encoded = dict(item)
+            encoded[name] = Binary(stored)
+            with self._lock:
+                stats = self.stats[name]
+                stats.encoded += 1
+                stats.raw_bytes += len(raw)
+                stats.stored_bytes += len(stored)
+        return item if encoded is None else encoded
+
+    def decode(self, item):
+        """
+        Restore the compressed attributes of an item read from the table, in place.
+        """
+        for name in self.attributes.intersection(item):
+            value = item[name]
+            data = value.value if isinstance(value, Binary) else value
+            if not isinstance(data, bytes) or not data.startswith(MAGIC):
+                continue
+            item[name] = json.loads(self._decompress(data[2:3], data[3:]))
+            with self._lock:
+                self.stats[name].decoded += 1
+        return item
+
+    def report(self):
+        """
+        Print the per-attribute stats.
+        """
+        for name, stats in sorted(self.stats.items()):
+            if stats.encoded or stats.decoded:
+                print(f"Attribute {name}: {stats}")
@@ -1,75 +1,239 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+import queue
+import random
+import threading
 import time
+import zlib
 import boto3
 import os
 import json
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
+from dynamodb.backend import BulkWriteResult, InvalidStartKeyError, StorageBackend, check_start_key
+from dynamodb.codec import AttributeCodec
+from dynamodb.metrics import METRICS
+from dynamodb.sqlite_backend import SQLiteBackend
+
 
 URL="http://localhost:8000"
+# Index queried by record type until sourceSharding.readFromShards is enabled
+SOURCE_INDEX = "AssessmentBySourceIndex"
+
+
+# BatchWriteItem accepts at most 25 requests per call
+BATCH_WRITE_LIMIT = 25
+# BatchGetItem accepts at most 100 keys per call
+BATCH_GET_LIMIT = 100
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_BASE_DELAY = 0.05
+DEFAULT_MAX_DELAY = 20.0
+DEFAULT_POOL_CONNECTIONS = 50
+THROTTLING_ERRORS = (
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "InternalServerError",
+)
+
+
+def _backoff_delay(attempt, base=DEFAULT_BASE_DELAY, cap=DEFAULT_MAX_DELAY):
+    """
+    Full-jitter exponential backoff delay for a retry attempt.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def with_key_projection(projection_expression, expression_attribute_names, key_names):
+    """
+    Extend a ProjectionExpression with the key attributes it does not already name.
+
+    DynamoDB rejects a projection naming the same attribute twice, so keys that
+    are already projected, directly or through a placeholder, are not added again.
+
+    Returns:
+        The ProjectionExpression and its ExpressionAttributeNames.
+    """
+    names = dict(expression_attribute_names or {})
+    projected = {names.get(path.strip(), path.strip()) for path in projection_expression.split(",")}
+    for idx, key_name in enumerate(key_names or []):
+        if key_name not in projected:
+            names[f"#key{idx}"] = key_name
+            projection_expression += f", #key{idx}"
+    return projection_expression, names
+
+
+class UnprocessedKeysError(Exception):
+    """
+    BatchGetItem left keys unprocessed after every retry, e.g. under sustained throttling.
+
+    The items that were read are kept in items, so a caller can use them and retry the keys.
+    """
 
+    def __init__(self, keys, items):
+        super().__init__(f"{len(keys)} keys still unprocessed after every BatchGetItem attempt")
+        self.keys = keys
+        self.items = items
 
-def _retry_batch_writer_put_item(writer, item, tablename, item_idx, total_items):
+
+def to_dynamo(value):
+    """
+    Convert Python values to types the DynamoDB serializer accepts (floats become Decimals).
+    """
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: to_dynamo(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_dynamo(v) for v in value]
+    return value
+
+
+class ConnectionRegistry:
+    """
+    Process-wide boto3 sessions, clients and Table handles, created once per
+    region and endpoint and then reused.
+
+    Low-level clients are thread-safe, so one client per endpoint is shared by
+    every thread. Sessions and resources are not, so each thread gets its own
+    session, resource and Table handles.
+    """
+
+    def __init__(self, max_pool_connections=DEFAULT_POOL_CONNECTIONS):
+        self.max_pool_connections = max_pool_connections
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._local = threading.local()
+
+    def client(self, region, endpoint_url):
+        """
+        Shared low-level client for a region and endpoint.
         """
-        Private Helper function to retry batch writer, so that Opus can retry writing to the DynamoDB table
-        if DynamoDB throttles the call because of some client error like resizing.
+        key = (region, endpoint_url)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    session = boto3.session.Session(region_name=region)
+                    client = session.client('dynamodb', endpoint_url=endpoint_url,
+                                            config=BotoConfig(max_pool_connections=self.max_pool_connections))
+                    self._clients[key] = client
+        return client
 
-        Args:
-            writer: Batch writer.
-            item: Item to be written.
-            tablename: Name of the DynamoDB table. (Unused argument, but useful for capturing state of the arguments).
-            item_idx: Index of the item in the current batch. (Unused argument,
-            but useful for capturing state of the arguments).
-            total_items: Total items in the batch. (Unused argument, but useful for capturing state of the arguments).
+    def resource(self, region, endpoint_url):
+        """
+        Resource owned by the calling thread.
+        """
+        resources = self._thread_cache('resources')
+        key = (region, endpoint_url)
+        if key not in resources:
+            session = boto3.session.Session(region_name=region)
+            resources[key] = session.resource('dynamodb', endpoint_url=endpoint_url)
+        return resources[key]
 
-        Returns:
-            Whatever put_item returns.
+    def table(self, region, endpoint_url, table_name):
         """
-        del tablename
-        del item_idx
-        del total_items
-        return writer.put_item(Item=item)
+        Table handle owned by the calling thread; creating it makes no request.
+        """
+        tables = self._thread_cache('tables')
+        key = (region, endpoint_url, table_name)
+        if key not in tables:
+            tables[key] = self.resource(region, endpoint_url).Table(table_name)
+        return tables[key]
 
+    def _thread_cache(self, name):
+        cache = getattr(self._local, name, None)
+        if cache is None:
+            cache = {}
+            setattr(self._local, name, cache)
+        return cache
 
-class DynamoDB:
-    def __init__(self, config, table_name, full=True):
+    def clear(self):
+        """
+        Drop the shared clients, e.g. after a fork. Thread-owned handles are dropped as their threads end.
+        """
+        with self._lock:
+            self._clients.clear()
+        self._local = threading.local()
+
+
+REGISTRY = ConnectionRegistry()
+
+
+class DynamoDB(StorageBackend):
+    def __init__(self, config, table_name, full=True, registry=None):
+        """
+        Bind to a table through the process-wide connection registry.
+
+        No request is made here; the table schema is created or updated by ensure_table.
+
+        Args:
+            config: The DynamoDB configuration (general and tables).
+            table_name: Name of the table.
+            full: A boolean for full db table configuration, used by ensure_table.
+            registry: ConnectionRegistry to take handles from; defaults to the process-wide one.
+        """
         self.config = config
         self.table_name = table_name
-        session = boto3.Session(region_name=config['general']['region'])
-        self.resource = session.resource('dynamodb', endpoint_url=self.config['general']['endpointURL'])
-        if self.resource is None:
-            print("Error connecting to DynamoDB resource!")
-        self.client = session.client('dynamodb', endpoint_url=self.config['general']['endpointURL'])
-        if self.client is None:
-            print("Error connecting to DynamoDB client!")
+        self.full = full
+        self.registry = registry or REGISTRY
+        self.region = config['general']['region']
+        self.endpoint_url = config['general']['endpointURL']
+        self.key_names = [key['AttributeName'] for key in self.config['tables'][self.table_name]['keySchema']]
+        self.sharding = self.config['tables'][self.table_name].get('sourceSharding')
+        # Writes add sourceShard as soon as sharding is configured; reads switch once the backfill is done
+        self.shard_reads = bool(self.sharding and self.sharding.get('readFromShards'))
+        self.codec = AttributeCodec.from_config(self.config['tables'][self.table_name].get('compression'))
+        self.metrics = METRICS.configure(config['general'])
+        self._serializer = TypeSerializer()
+        self._deserializer = TypeDeserializer()
+
+    @property
+    def client(self):
+        """
+        Shared low-level client.
+        """
+        return self.registry.client(self.region, self.endpoint_url)
 
-        self.table = self.initialize(full)
-        if self.table is None:
-            print("Error initializing the table!")
+    @property
+    def resource(self):
+        """
+        Resource owned by the calling thread.
+        """
+        return self.registry.resource(self.region, self.endpoint_url)
 
+    @property
+    def table(self):
+        """
+        Table handle owned by the calling thread.
+        """
+        return self.registry.table(self.region, self.endpoint_url, self.table_name)
 
-    def initialize(self, full):
+    def ensure_table(self, full=None):
         """
-        Initialize the table.
+        Create the table if it does not exist and add missing global secondary indexes.
+
+        This is an admin step, run by the ingestion job and the "schema" action,
+        never on the request path.
 
         Args:
-            full: A boolean for full db table configuration.
+            full: A boolean for full db table configuration; defaults to the constructor's.
 
         Returns:
-            The boto3 DynamoDB object or None.
+            The Table handle.
         """
+        full = self.full if full is None else full
         existing_tables = self.client.list_tables()['TableNames']
-        if self.table_name in existing_tables:
-            self.configure(full)
-            return self.resource.Table(self.table_name)
-
-        self.create_table()
-
-        if self.is_table_active():
-            self.configure(full)
-            return self.resource.Table(self.table_name)
-
-        return None
+        if self.table_name not in existing_tables:
+            self.create_table()
+            self.wait_until_active()
+        self.configure(full)
+        return self.table
 
 
     def configure(self, full):
@@ -83,20 +247,35 @@ class DynamoDB:
             self.update_global_indices()
 
 
-    def is_table_active(self):
+    def wait_until_active(self, delay=1, max_attempts=300):
         """
-        Checks if the table is active or if it's still being created.
+        Wait for a newly created table to become active, polling with the boto3 table_exists waiter.
 
         Returns:
             A boolean indicating table active status.
         """
-        while True:
-            time.sleep(5)
-            if self.client.describe_table(TableName=self.table_name)['Table']['TableStatus'] == "ACTIVE":
-                break
+        self.client.get_waiter('table_exists').wait(
+            TableName=self.table_name, WaiterConfig={'Delay': delay, 'MaxAttempts': max_attempts})
         return True
 
 
+    def table_identity(self) -> str:
+        """
+        ARN and creation time of the table, e.g. to tell a manifest of writes to
+        a table dropped since, or to another DynamoDB Local instance, from one of
+        this table.
+        """
+        table = self.client.describe_table(TableName=self.table_name)['Table']
+        return f"{table['TableArn']}@{table['CreationDateTime'].isoformat()}"
+
+    def write_encoding(self) -> dict:
+        """
+        The sourceSharding and compression settings applied by the writes.
+        """
+        sharding = {name: value for name, value in (self.sharding or {}).items() if name != 'readFromShards'}
+        return {"sourceSharding": sharding or None,
+                "compression": self.config['tables'][self.table_name].get('compression')}
+
     def update_global_indices(self):
         """
         Update the global secondary indexes on a DynamoDB table. This only adds a new GSI if its not present.
@@ -154,7 +333,7 @@ class DynamoDB:
 
         if 'globalSecondaryIndexes' in self.config['tables'][self.table_name]:
             args.update({"GlobalSecondaryIndexes": self.config['tables'][self.table_name]['globalSecondaryIndexes']})
-        self.resource.create_table(**args)
+        self.client.create_table(**args)
 
     def put_item(self, item):
         """
@@ -163,92 +342,686 @@ class DynamoDB:
         Args:
             item: The item to insert into the database.
         """
-        self.table.put_item(Item=item)
+        self._call("PutItem", lambda: self.table.put_item(Item=self._encode(item), ReturnConsumedCapacity='INDEXES'),
+                   items=lambda response: 1)
+
+    def _call(self, operation, send, index=None, items=None, retry=False):
+        """
+        Issue a DynamoDB call and record its latency, item count, throttling and consumed capacity.
 
-    def big_batch_put(self, items: list, batch_size: int, max_workers: int = 20):
+        Args:
+            operation: API name, e.g. "Query".
+            send: Callable issuing the call and returning the response.
+            index: Index queried, if any.
+            items: Callable counting the items of the response; defaults to len(response["Items"]).
+            retry: Whether the call resubmits a previous one.
+
+        Returns:
+            The response.
         """
-        Experimental, multithreaded batch put
+        start = time.monotonic()
+        try:
+            response = send()
+        except ClientError as exc:
+            throttled = exc.response['Error']['Code'] in THROTTLING_ERRORS
+            self.metrics.observe(operation, self.table_name, time.monotonic() - start, index=index,
+                                 retries=int(retry), throttles=int(throttled), error=not throttled)
+            raise
+        except Exception:
+            self.metrics.observe(operation, self.table_name, time.monotonic() - start, index=index,
+                                 retries=int(retry), error=True)
+            raise
+        count = items(response) if items else len(response.get('Items', []))
+        self.metrics.observe(operation, self.table_name, time.monotonic() - start, items=count,
+                             consumed=response.get('ConsumedCapacity'), index=index, retries=int(retry))
+        return response
+
+    def big_batch_put(self, items, batch_size: int, max_workers: int = 20) -> BulkWriteResult:
+        """
+        Multithreaded bulk load built on BatchWriteItem, sharing one pooled low-level client.
+
         Args:
             items: all items going to the table
             batch_size: size of each batch submitted to the batch_put function
             max_workers: maximum threads
 
         Returns:
-
+            A BulkWriteResult with written/failed counts and throughput.
         """
+        start = time.monotonic()
+        result = BulkWriteResult()
+        items = list(items)
         batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            executor.map(self.batch_put, batches)
+            futures = {executor.submit(self.batch_put, batch): len(batch) for batch in batches}
+            for future in as_completed(futures):
+                try:
+                    result.merge(future.result())
+                except Exception as exc:  # pylint: disable=broad-except
+                    result.failed += futures[future]
+                    result.errors.append(repr(exc))
+        result.elapsed = time.monotonic() - start
+        print(f"Bulk loaded data into table {self.table_name}: {result}")
+        if self.codec:
+            self.codec.report()
+        return result
 
-    def batch_put(self, items: list):
+    def batch_put(self, items: list, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> BulkWriteResult:
         """
-        Uses the batch writer to write items to table
+        Write items with BatchWriteItem in chunks of 25, resubmitting UnprocessedItems
+        and throttled requests with exponential backoff and jitter. Safe to call from
+        several threads at once.
+
         Args:
             items: List of items to insert into table
+            max_attempts: Attempts per chunk before its remaining items are counted as failed
 
         Returns:
+            A BulkWriteResult for these items.
+        """
+        start = time.monotonic()
+        result = BulkWriteResult()
+        for i in range(0, len(items), BATCH_WRITE_LIMIT):
+            chunk = self._dedupe(items[i:i + BATCH_WRITE_LIMIT])
+            requests = [{"PutRequest": {"Item": self._serialize(self._encode(item))}} for item in chunk]
+            result.merge(self._write_requests(requests, max_attempts))
+        result.elapsed = time.monotonic() - start
+        return result
+
+    def batch_delete(self, keys: list, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> BulkWriteResult:
+        """
+        Delete items with BatchWriteItem DeleteRequests in chunks of 25, retried like batch_put.
+
+        Args:
+            keys: Primary keys of the items to delete.
+            max_attempts: Attempts per chunk before its remaining keys are counted as failed
 
+        Returns:
+            A BulkWriteResult whose written count is the number of deleted items.
         """
-        with self.table.batch_writer() as writer:
-            for i, item in enumerate(items, 1):
-                _retry_batch_writer_put_item(writer, item, self.table_name, i, len(items))
-        print(f"Batch loaded data into table {self.table_name}")
-        
-    def query(self,
-              condition,
-              filter_expression=None,
-              index_name=None) -> list:
+        start = time.monotonic()
+        result = BulkWriteResult()
+        for i in range(0, len(keys), BATCH_WRITE_LIMIT):
+            chunk = self._dedupe(keys[i:i + BATCH_WRITE_LIMIT])
+            requests = [{"DeleteRequest": {"Key": self._serialize(key)}} for key in chunk]
+            result.merge(self._write_requests(requests, max_attempts))
+        result.elapsed = time.monotonic() - start
+        return result
+
+    def _write_requests(self, requests: list, max_attempts: int) -> BulkWriteResult:
+        result = BulkWriteResult()
+        client = self.client
+        for attempt in range(max_attempts):
+            if attempt:
+                result.retries += 1
+                time.sleep(_backoff_delay(attempt))
+            try:
+                response = self._call(
+                    "BatchWriteItem",
+                    lambda: client.batch_write_item(RequestItems={self.table_name: requests},
+                                                    ReturnConsumedCapacity='INDEXES'),
+                    items=lambda response: len(requests) - len(
+                        response.get('UnprocessedItems', {}).get(self.table_name, [])),
+                    retry=attempt > 0)
+            except ClientError as exc:
+                if exc.response['Error']['Code'] in THROTTLING_ERRORS:
+                    result.throttles += 1
+                    continue
+                result.failed += len(requests)
+                result.errors.append(repr(exc))
+                return result
+            unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            result.written += len(requests) - len(unprocessed)
+            requests = unprocessed
+            if not requests:
+                return result
+        result.failed += len(requests)
+        result.errors.append(f"{len(requests)} items still unprocessed after {max_attempts} attempts")
+        return result
 
-        results = []
+    def batch_get(self, keys, projection_expression=None, expression_attribute_names=None,
+                  max_workers: int = 8, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> dict:
+        """
+        Fetch many items by primary key with BatchGetItem, 100 keys per request and
+        several requests in parallel. UnprocessedKeys and throttled requests are
+        resubmitted with exponential backoff and jitter.
 
-        start_key = None
-        while True:
-            response, start_key = self.batch(condition, filter_expression,
-                                             index_name, start_key)
-            results.extend(response)
-            if not start_key:
-                break
+        Args:
+            keys: Keys as dicts ({"hashKey": ..., "sortKey": ...}) or as tuples in key schema order.
+            projection_expression: Optional ProjectionExpression; the key attributes are always returned.
+            expression_attribute_names: Placeholders used by the projection.
+            max_workers: Maximum concurrent BatchGetItem requests.
+            max_attempts: Attempts per chunk before its remaining keys are given up.
 
+        Returns:
+            A dict mapping (hashKey, sortKey) tuples to items. Missing items are absent.
+
+        Raises:
+            UnprocessedKeysError: Some keys were still unprocessed after max_attempts,
+                so their absence does not mean the items do not exist.
+        """
+        unique_keys = {}
+        for key in keys:
+            values = tuple(key[name] for name in self.key_names) if isinstance(key, dict) else tuple(key)
+            unique_keys[values] = dict(zip(self.key_names, values))
+        request = {}
+        if projection_expression:
+            projection_expression, names = with_key_projection(projection_expression, expression_attribute_names,
+                                                               self.key_names)
+            request.update({'ProjectionExpression': projection_expression, 'ExpressionAttributeNames': names})
+        key_list = [self._serialize(key) for key in unique_keys.values()]
+        chunks = [key_list[i:i + BATCH_GET_LIMIT] for i in range(0, len(key_list), BATCH_GET_LIMIT)]
+        results = {}
+        unprocessed = []
+        if not chunks:
+            return results
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            for items, keys_left in executor.map(lambda chunk: self._get_chunk(chunk, request, max_attempts), chunks):
+                for item in items:
+                    results[tuple(item[name] for name in self.key_names)] = item
+                unprocessed.extend(self._deserialize(key) for key in keys_left)
+        if unprocessed:
+            raise UnprocessedKeysError(unprocessed, results)
         return results
-    
-    def batch(self, condition, filter_expression=None, index_name = None, eval_key = None):
+
+    def _get_chunk(self, keys: list, request: dict, max_attempts: int) -> tuple:
+        items = []
+        client = self.client
+        for attempt in range(max_attempts):
+            if attempt:
+                time.sleep(_backoff_delay(attempt))
+            try:
+                response = self._call(
+                    "BatchGetItem",
+                    lambda: client.batch_get_item(RequestItems={self.table_name: {**request, 'Keys': keys}},
+                                                  ReturnConsumedCapacity='INDEXES'),
+                    items=lambda response: len(response.get('Responses', {}).get(self.table_name, [])),
+                    retry=attempt > 0)
+            except ClientError as exc:
+                if exc.response['Error']['Code'] in THROTTLING_ERRORS:
+                    continue
+                raise
+            items.extend(self._deserialize(item) for item in response.get('Responses', {}).get(self.table_name, []))
+            keys = response.get('UnprocessedKeys', {}).get(self.table_name, {}).get('Keys', [])
+            if not keys:
+                return items, []
+        return items, keys
+
+    def _serialize(self, item: dict) -> dict:
+        return {k: self._serializer.serialize(to_dynamo(v)) for k, v in item.items()}
+
+    def _deserialize(self, item: dict) -> dict:
+        return self._decode({k: self._deserializer.deserialize(v) for k, v in item.items()})
+
+    def _encode(self, item: dict) -> dict:
+        """
+        Prepare an item for writing: add its shard key and compress its large attributes.
+        """
+        item = self.with_shard(item)
+        return self.codec.encode(item) if self.codec else item
+
+    def _decode(self, item: dict) -> dict:
+        """
+        Decompress the compressed attributes of an item read from the table.
+        """
+        return self.codec.decode(item) if self.codec else item
+
+    def _dedupe(self, items: list) -> list:
+        """
+        Keep the last item per primary key; BatchWriteItem rejects duplicate keys in one request.
+        """
+        return list({tuple(item.get(k) for k in self.key_names): item for item in items}.values())
+
+    def iter_query(self, condition, filter_expression=None, index_name=None, projection_expression=None,
+                   expression_attribute_names=None, limit: int = None, page_size: int = None,
+                   scan_index_forward: bool = True, exclusive_start_key=None) -> "QueryIterator":
+        """
+        Query lazily, fetching a page only when the items before it have been consumed.
+
+        Args:
+            condition: boto3 key condition.
+            filter_expression: Optional boto3 condition applied server-side.
+            index_name: Optional index to query.
+            projection_expression: Optional ProjectionExpression, e.g. "hashKey, #n".
+            expression_attribute_names: Placeholders used by the projection or filter.
+            limit: Maximum number of items to return; pushed down as the Limit of each call.
+            page_size: Optional Limit of each Query call.
+            scan_index_forward: False to read the sort key in descending order.
+            exclusive_start_key: Key to resume from, e.g. a previous last_evaluated_key.
+
+        Returns:
+            A QueryIterator over the items that also reports where to resume.
+        """
+        key_names = self.index_key_names(index_name)
+        fields = self._query_fields(condition, filter_expression, index_name, projection_expression,
+                                    expression_attribute_names, scan_index_forward, key_names)
+        return QueryIterator(self, fields, key_names, limit, page_size, exclusive_start_key)
+
+    def batch(self, condition, filter_expression=None, index_name=None, eval_key=None, **options):
+        """
+        Get a single page of a query.
+
+        Args:
+            condition: boto3 key condition.
+            filter_expression: Optional boto3 condition applied server-side.
+            index_name: Optional index to query.
+            eval_key: ExclusiveStartKey of the page.
+            options: projection_expression, expression_attribute_names, limit and scan_index_forward.
+
+        Returns:
+            The items of the page and the LastEvaluatedKey (None on the last page).
+        """
+        limit = options.pop('limit', None)
+        query_fields = self._query_fields(condition, filter_expression, index_name, **options)
+        if limit:
+            query_fields['Limit'] = limit
+        if eval_key:
+            query_fields['ExclusiveStartKey'] = eval_key
+        response = self._call("Query", lambda: self.table.query(**query_fields), index=index_name)
+        return [self._decode(item) for item in response.get('Items', [])], response.get('LastEvaluatedKey', None)
+
+    def index_key_names(self, index_name=None) -> list:
+        """
+        Attributes making up a LastEvaluatedKey: the table keys, plus the index keys when querying an index.
+        """
+        key_names = list(self.key_names)
+        for gsi in self.config['tables'][self.table_name].get('globalSecondaryIndexes', []):
+            if gsi['IndexName'] == index_name:
+                key_names += [key['AttributeName'] for key in gsi['KeySchema'] if key['AttributeName'] not in key_names]
+        return key_names
+
+    def _query_fields(self, condition, filter_expression=None, index_name=None, projection_expression=None,
+                      expression_attribute_names=None, scan_index_forward=True, key_names=None) -> dict:
         query_fields = {
             'TableName': self.table_name,
-            'KeyConditionExpression': condition
+            'KeyConditionExpression': condition,
+            'ReturnConsumedCapacity': 'INDEXES'
         }
-        if filter_expression:
-            query_fields.update({"FilterExpression": filter_expression})
+        if filter_expression is not None:
+            query_fields['FilterExpression'] = filter_expression
         if index_name:
-            query_fields.update({"IndexName": index_name})
-        if eval_key:
-            query_fields.update({'ExclusiveStartKey': eval_key})
-        response = self.table.query(**query_fields)
-        results = response.get('Items', [])
-        eval_key = response.get('LastEvaluatedKey', None)
-        return results, eval_key
-    
-    def scan(self):
+            query_fields['IndexName'] = index_name
+        if not scan_index_forward:
+            query_fields['ScanIndexForward'] = False
+        names = dict(expression_attribute_names or {})
+        if projection_expression:
+            # Keep the key attributes so the position of a partially consumed query can be resumed
+            projection_expression, names = with_key_projection(projection_expression, names, key_names)
+            query_fields['ProjectionExpression'] = projection_expression
+        if names:
+            query_fields['ExpressionAttributeNames'] = names
+        return query_fields
+
+    def with_shard(self, item: dict) -> dict:
         """
-        Get all items from the table.
+        Add the write-sharded index key to an item, e.g. "cve#details#07".
+
+        The shard is derived from the item's hashKey, so rewriting an item keeps it
+        in the same shard. Items are returned unchanged when sharding is not configured.
+        """
+        if not self.sharding or self.sharding['sourceAttribute'] not in item:
+            return item
+        shard = zlib.crc32(str(item[self.key_names[0]]).encode("utf-8")) % self.sharding['shards']
+        return {**item, self.sharding['attributeName']: self.shard_key(item[self.sharding['sourceAttribute']], shard)}
+
+    @staticmethod
+    def shard_key(source: str, shard: int) -> str:
+        """
+        Sharded index key of a record type.
+        """
+        return f"{source}#{shard:02d}"
+
+    def iter_source(self, source: str, projection_expression=None, expression_attribute_names=None,
+                    filter_expression=None, limit: int = None, page_size: int = None,
+                    exclusive_start_key=None, max_workers: int = None):
+        """
+        Lazily list the items of a record type.
+
+        With sourceSharding.readFromShards enabled, every shard of the sharded index is
+        queried concurrently and the results are merged in hashKey order; otherwise this
+        is a plain query of AssessmentBySourceIndex.
+
+        Args:
+            source: The record type, i.e. the sortKey value.
+            projection_expression: Optional ProjectionExpression.
+            expression_attribute_names: Placeholders used by the projection or filter.
+            filter_expression: Optional boto3 condition applied server-side.
+            limit: Maximum number of items to return.
+            page_size: Optional Limit of each Query call.
+            exclusive_start_key: A previous last_evaluated_key to resume from.
+            max_workers: Threads querying shards; defaults to one per shard.
 
         Returns:
-            A list of the items from the table.
+            A QueryIterator, or a ShardedQueryIterator whose last_evaluated_key holds one key per shard.
+
+        Raises:
+            InvalidStartKeyError: When exclusive_start_key is not a position of this listing.
         """
-        results = []
-        query_fields = {
-            'TableName': self.table_name,
-        }
-        done = False
-        start_key = None
-        while not done:
-            if start_key:
-                query_fields.update({'ExclusiveStartKey': start_key})
-            response = self.table.scan(**query_fields)
-            results.extend(response.get('Items', []))
-            start_key = response.get('LastEvaluatedKey', None)
-            done = start_key is None
-        return results
-        
+        if not self.shard_reads:
+            if exclusive_start_key is not None:
+                check_start_key(exclusive_start_key, self.index_key_names(SOURCE_INDEX),
+                                **{self._source_attribute(): source})
+            return self.iter_query(Key(self._source_attribute()).eq(source),
+                                   filter_expression, SOURCE_INDEX,
+                                   projection_expression=projection_expression,
+                                   expression_attribute_names=expression_attribute_names,
+                                   limit=limit, page_size=page_size, exclusive_start_key=exclusive_start_key)
+        index_name = self.sharding['indexName']
+        key_names = self.index_key_names(index_name)
+        shard_fields = {}
+        for shard in range(self.sharding['shards']):
+            shard_value = self.shard_key(source, shard)
+            shard_fields[shard_value] = self._query_fields(
+                Key(self.sharding['attributeName']).eq(shard_value), filter_expression, index_name,
+                projection_expression, expression_attribute_names, True, key_names)
+        if exclusive_start_key is not None:
+            if not isinstance(exclusive_start_key, dict) or not set(exclusive_start_key) <= set(shard_fields):
+                raise InvalidStartKeyError(f"Invalid exclusive start key: {exclusive_start_key!r}")
+            for shard, position in exclusive_start_key.items():
+                if position is not None:
+                    check_start_key(position, key_names, **{self.sharding['attributeName']: shard,
+                                                            self.sharding['sourceAttribute']: source})
+        return ShardedQueryIterator(self, shard_fields, key_names, self._index_sort_key(index_name),
+                                    limit, page_size, exclusive_start_key, max_workers)
+
+    def backfill_source_shards(self, batch_size: int = 1000, total_segments: int = 4) -> BulkWriteResult:
+        """
+        Rewrite the items that have no sourceShard yet, e.g. those written before
+        sourceSharding was configured, so the sharded index lists them.
+
+        This is the migration step to run before enabling readFromShards. Run it
+        between ingestion runs, as an item rewritten concurrently could be reverted.
+
+        Args:
+            batch_size: Items per batch_put call.
+            total_segments: Parallel scan segments.
+
+        Returns:
+            A BulkWriteResult of the rewritten items.
+        """
+        start = time.monotonic()
+        result = BulkWriteResult()
+        if not self.sharding:
+            return result
+        missing = (Attr(self.sharding['attributeName']).not_exists()
+                   & Attr(self.sharding['sourceAttribute']).exists())
+        batch = []
+        for page in self.iter_scan(total_segments, filter_expression=missing):
+            batch.extend(page)
+            while len(batch) >= batch_size:
+                result.merge(self.batch_put(batch[:batch_size]))
+                batch = batch[batch_size:]
+        if batch:
+            result.merge(self.batch_put(batch))
+        result.elapsed = time.monotonic() - start
+        print(f"Backfilled {self.sharding['attributeName']} in table {self.table_name}: {result}")
+        return result
+
+    def _source_attribute(self) -> str:
+        """
+        Attribute holding the record type.
+        """
+        return self.sharding['sourceAttribute'] if self.sharding else self.key_names[-1]
+
+    def _index_sort_key(self, index_name: str):
+        for gsi in self.config['tables'][self.table_name].get('globalSecondaryIndexes', []):
+            if gsi['IndexName'] == index_name:
+                for key in gsi['KeySchema']:
+                    if key['KeyType'] == 'RANGE':
+                        return key['AttributeName']
+        return self.key_names[0]
+
+    def iter_scan(self, total_segments: int = 1, projection_expression=None, expression_attribute_names=None,
+                  filter_expression=None, limit: int = None, max_workers: int = None) -> "ScanIterator":
+        """
+        Scan the table as total_segments parallel segments, yielding pages as they arrive.
+
+        Args:
+            total_segments: Number of Segment/TotalSegments slices scanned concurrently.
+            projection_expression: Optional ProjectionExpression, e.g. "hashKey, #s".
+            expression_attribute_names: Placeholders used by the projection or filter.
+            filter_expression: Optional boto3 condition applied server-side.
+            limit: Optional page size (Limit) of each Scan call.
+            max_workers: Threads scanning segments; defaults to one per segment.
+
+        Returns:
+            A ScanIterator over pages (lists of items) that also reports consumed capacity.
+        """
+        fields = {'ReturnConsumedCapacity': 'INDEXES'}
+        if projection_expression:
+            fields['ProjectionExpression'] = projection_expression
+        if expression_attribute_names:
+            fields['ExpressionAttributeNames'] = expression_attribute_names
+        if filter_expression is not None:
+            fields['FilterExpression'] = filter_expression
+        if limit:
+            fields['Limit'] = limit
+        return ScanIterator(self, fields, total_segments, max_workers or total_segments)
+
+
+def open_table(config, table_name, full=True) -> StorageBackend:
+    """
+    Open a table on the storage backend selected by the "storage" entry of the general config.
+
+    Args:
+        config: The DynamoDB configuration (general and tables).
+        table_name: Name of the table.
+        full: A boolean for full db table configuration (DynamoDB only).
+
+    Returns:
+        A DynamoDB wrapper, or a SQLiteBackend when storage.backend is "sqlite".
+    """
+    storage = config['general'].get('storage', {})
+    if storage.get('backend', 'dynamodb') == 'sqlite':
+        return SQLiteBackend(config, table_name, storage.get('sqlitePath', f".cache/{table_name}.sqlite"))
+    return DynamoDB(config, table_name, full)
+
+
+class QueryIterator:
+    """
+    Lazy iterator over the items matched by a query.
+
+    A page is only requested once the items before it have been consumed, and
+    the Limit of each Query call never exceeds the number of items still
+    wanted, so a caller asking for 20 items reads (and pays for) about 20.
+    last_evaluated_key is the ExclusiveStartKey to resume from, also after
+    stopping early; it is None once the query is exhausted.
+    """
+
+    def __init__(self, db: DynamoDB, fields: dict, key_names: list, limit: int = None, page_size: int = None,
+                 exclusive_start_key=None):
+        self.db = db
+        self.fields = fields
+        self.key_names = key_names
+        self.limit = limit
+        self.page_size = page_size
+        self.last_evaluated_key = exclusive_start_key
+        self.consumed_capacity = 0.0
+        self.scanned_count = 0
+        self.count = 0
+        self.pages = 0
+
+    def _key_of(self, item: dict) -> dict:
+        return {name: item[name] for name in self.key_names if name in item}
+
+    def __iter__(self):
+        fields = dict(self.fields)
+        remaining = self.limit
+        while remaining is None or remaining > 0:
+            if self.last_evaluated_key:
+                fields['ExclusiveStartKey'] = self.last_evaluated_key
+            page_limits = [size for size in (remaining, self.page_size) if size]
+            if page_limits:
+                fields['Limit'] = min(page_limits)
+            response = self.db._call("Query", lambda: self.db.table.query(**fields), index=fields.get('IndexName'))
+            self.pages += 1
+            self.consumed_capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)
+            self.scanned_count += response.get('ScannedCount', 0)
+            for item in response.get('Items', []):
+                item = self.db._decode(item)
+                self.last_evaluated_key = self._key_of(item)
+                self.count += 1
+                if remaining is not None:
+                    remaining -= 1
+                yield item
+            self.last_evaluated_key = response.get('LastEvaluatedKey')
+            if self.last_evaluated_key is None:
+                return
+
+
+class ShardedQueryIterator:
+    """
+    Scatter-gather iterator over the shards of a write-sharded index.
+
+    One page of every shard that has run out of buffered items is fetched
+    concurrently, then the buffered items are merged in index sort key
+    order, so the output is ordered as if the index had a single partition.
+    last_evaluated_key maps every shard that is not exhausted to the key to
+    resume it from (None for a shard not read yet); it is None once all
+    shards are exhausted.
+    """
+
+    def __init__(self, db: DynamoDB, shard_fields: dict, key_names: list, sort_key: str, limit: int = None,
+                 page_size: int = None, exclusive_start_key: dict = None, max_workers: int = None):
+        self.db = db
+        self.shard_fields = shard_fields
+        self.key_names = key_names
+        self.sort_key = sort_key
+        self.limit = limit
+        self.page_size = page_size
+        self.max_workers = max_workers or len(shard_fields)
+        if exclusive_start_key is None:
+            exclusive_start_key = dict.fromkeys(shard_fields)
+        self.positions = dict(exclusive_start_key)
+        self.consumed_capacity = 0.0
+        self.scanned_count = 0
+        self.count = 0
+        self.pages = 0
+        self._lock = threading.Lock()
+
+    @property
+    def last_evaluated_key(self):
+        return self.positions or None
+
+    def _fetch(self, shard: str, start_key, remaining):
+        fields = dict(self.shard_fields[shard])
+        if start_key:
+            fields['ExclusiveStartKey'] = start_key
+        page_limits = [size for size in (remaining, self.page_size) if size]
+        if page_limits:
+            fields['Limit'] = min(page_limits)
+        response = self.db._call("Query", lambda: self.db.table.query(**fields), index=fields.get('IndexName'))
+        with self._lock:
+            self.pages += 1
+            self.consumed_capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)
+            self.scanned_count += response.get('ScannedCount', 0)
+        return [self.db._decode(item) for item in response.get('Items', [])], response.get('LastEvaluatedKey')
+
+    def __iter__(self):
+        remaining = self.limit
+        buffers = {shard: [] for shard in self.positions}
+        next_keys = dict(self.positions)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while remaining is None or remaining > 0:
+                # Refill every shard with an empty buffer that still has pages
+                empty = [shard for shard, items in buffers.items() if not items and shard in next_keys]
+                pages = executor.map(lambda shard: self._fetch(shard, next_keys[shard], remaining), empty)
+                for shard, (items, start_key) in zip(empty, pages):
+                    items.reverse()
+                    buffers[shard] = items
+                    if start_key is None:
+                        del next_keys[shard]
+                    else:
+                        next_keys[shard] = start_key
+                    if not items:
+                        self._drained(shard, next_keys)
+                ready = [shard for shard, items in buffers.items() if items]
+                if not ready:
+                    if not next_keys:
+                        return
+                    continue
+                if any(shard in next_keys and not buffers[shard] for shard in buffers):
+                    continue
+                shard = min(ready, key=lambda name: buffers[name][-1].get(self.sort_key))
+                item = buffers[shard].pop()
+                self.positions[shard] = {name: item[name] for name in self.key_names if name in item}
+                if not buffers[shard]:
+                    self._drained(shard, next_keys)
+                self.count += 1
+                if remaining is not None:
+                    remaining -= 1
+                yield item
+
+    def _drained(self, shard: str, next_keys: dict):
+        """
+        Move a shard with no buffered items to its next page, or drop it once exhausted.
+        """
+        if shard in next_keys:
+            self.positions[shard] = next_keys[shard]
+        else:
+            self.positions.pop(shard, None)
+
+
+class ScanIterator:
+    """
+    Iterator over the pages of a parallel segmented scan.
+
+    Each segment is scanned in its own worker thread and pages are handed over
+    through a bounded queue, so only a few pages are held in memory at once.
+    Stopping the iteration early stops the workers after their current page.
+    """
+
+    def __init__(self, db: DynamoDB, fields: dict, total_segments: int, max_workers: int, queue_size: int = 8):
+        self.db = db
+        self.fields = fields
+        self.total_segments = total_segments
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.consumed_capacity = 0.0
+        self.scanned_count = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _scan_segment(self, segment: int, pages: queue.Queue, stop: threading.Event):
+        table = self.db.table
+        fields = dict(self.fields)
+        if self.total_segments > 1:
+            fields.update({'Segment': segment, 'TotalSegments': self.total_segments})
+        while not stop.is_set():
+            response = self.db._call("Scan", lambda: table.scan(**fields))
+            with self._lock:
+                self.consumed_capacity += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)
+                self.scanned_count += response.get('ScannedCount', 0)
+                self.count += response.get('Count', 0)
+            page = [self.db._decode(item) for item in response.get('Items', [])]
+            while page and not stop.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            start_key = response.get('LastEvaluatedKey')
+            if start_key is None:
+                return
+            fields['ExclusiveStartKey'] = start_key
+
+    def __iter__(self):
+        pages = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._scan_segment, segment, pages, stop)
+                       for segment in range(self.total_segments)]
+            try:
+                while True:
+                    try:
+                        yield pages.get(timeout=0.1)
+                    except queue.Empty:
+                        if all(future.done() for future in futures) and pages.empty():
+                            break
+                for future in futures:
+                    future.result()
+            finally:
+                stop.set()
 
 
 class DynamoDBConfig:
@@ -0,0 +1,365 @@
+""" Latency, item, retry and consumed-capacity metrics of the DynamoDB calls, with pluggable exporters """
+import atexit
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_NAMESPACE = "EPSS/DynamoDB"
+READ_OPERATIONS = ("Query", "Scan", "GetItem", "BatchGetItem")
+CACHE_COUNTERS = {
+    "hits": "Lookups served from the cache.",
+    "misses": "Lookups that loaded the value.",
+    "coalesced": "Lookups that waited for a concurrent identical load.",
+    "evictions": "Entries dropped to stay within the size bound.",
+    "invalidations": "Flushes caused by a new dataset version.",
+}
+
+
+@dataclass
+class OperationStats:
+    """
+    Counters and latency histogram of one operation on one table or index.
+    """
+    calls: int = 0
+    items: int = 0
+    errors: int = 0
+    retries: int = 0
+    throttles: int = 0
+    latency_sum: float = 0.0
+    buckets: list = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def quantile(self, q):
+        """
+        Approximate latency quantile in seconds: the upper bound of the bucket holding it.
+        """
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return bound if bound != float("inf") else LATENCY_BUCKETS[-1]
+        return 0.0
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics of the DynamoDB wrapper.
+
+    Operations are keyed by (table, index, operation) and consumed capacity
+    by (table, index, "read" | "write"), with the base table reported as
+    index "". Caches registered with add_cache report their counters in the
+    same snapshots. flush hands a snapshot to every sink; a sink is any object
+    with an emit(snapshot) method.
+    """
+
+    def __init__(self):
+        self.operations = {}
+        self.capacity = {}
+        self.sinks = []
+        self.caches = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._configured = False
+        self._timer = None
+
+    def configure(self, config):
+        """
+        Set up the exporters from the general DynamoDB config, once per process.
+
+        The "metrics" entry lists the exporters ("json", "prometheus", "emf")
+        and where files go; useCloudWatchMetrics adds the CloudWatch EMF
+        exporter. Metrics are flushed at exit and every flushInterval seconds.
+
+        Returns:
+            The registry.
+        """
+        with self._lock:
+            if self._configured:
+                return self
+            self._configured = True
+        metrics_config = config.get('metrics', {})
+        exporters = list(metrics_config.get('exporters', []))
+        if config.get('useCloudWatchMetrics') and "emf" not in exporters:
+            exporters.append("emf")
+        directory = metrics_config.get('path', ".cache/metrics")
+        for exporter in exporters:
+            if exporter == "json":
+                self.add_sink(JSONFileSink(os.path.join(directory, "dynamodb_metrics.json")))
+            elif exporter == "prometheus":
+                self.add_sink(PrometheusFileSink(os.path.join(directory, "dynamodb_metrics.prom")))
+            elif exporter == "emf":
+                self.add_sink(EMFSink(metrics_config.get('namespace', DEFAULT_NAMESPACE)))
+            else:
+                print(f"Unknown metrics exporter: {exporter}")
+        if self.sinks:
+            atexit.register(self.flush)
+            if metrics_config.get('flushInterval'):
+                self._schedule(metrics_config['flushInterval'])
+        return self
+
+    def _schedule(self, interval):
+        def run():
+            self.flush()
+            self._schedule(interval)
+        self._timer = threading.Timer(interval, run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def add_sink(self, sink):
+        """
+        Register an exporter.
+        """
+        self.sinks.append(sink)
+
+    def add_cache(self, name, cache):
+        """
+        Report the counters of a cache, any object with a stats() method returning a dict.
+        """
+        with self._lock:
+            self.caches[name] = cache
+
+    def observe(self, operation, table, latency, items=0, consumed=None, index=None,
+                retries=0, throttles=0, error=False):
+        """
+        Record one DynamoDB call.
+
+        Args:
+            operation: API name, e.g. "Query" or "BatchWriteItem".
+            table: Table name.
+            latency: Seconds the call took.
+            items: Items read or written by the call.
+            consumed: The ConsumedCapacity of the response (a dict or a list of dicts).
+            index: Index queried, if any.
+            retries: Resubmissions of unprocessed items or throttled requests.
+            throttles: Throttling errors received.
+            error: Whether the call failed.
+        """
+        kind = "read" if operation in READ_OPERATIONS else "write"
+        with self._lock:
+            stats = self.operations.setdefault((table, index or "", operation), OperationStats())
+            stats.calls += 1
+            stats.items += items
+            stats.retries += retries
+            stats.throttles += throttles
+            stats.errors += int(error)
+            stats.latency_sum += latency
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            for entry in consumed if isinstance(consumed, list) else [consumed] if consumed else []:
+                self._add_capacity(entry, kind)
+
+    def _add_capacity(self, entry, kind):
+        table = entry.get('TableName', "")
+        if 'Table' not in entry and 'GlobalSecondaryIndexes' not in entry:
+            self._add_units(table, "", kind, entry.get('CapacityUnits', 0.0))
+            return
+        self._add_units(table, "", kind, entry.get('Table', {}).get('CapacityUnits', 0.0))
+        for index_type in ('GlobalSecondaryIndexes', 'LocalSecondaryIndexes'):
+            for index, units in entry.get(index_type, {}).items():
+                self._add_units(table, index, kind, units.get('CapacityUnits', 0.0))
+
+    def _add_units(self, table, index, kind, units):
+        key = (table, index, kind)
+        self.capacity[key] = self.capacity.get(key, 0.0) + float(units)
+
+    def snapshot(self):
+        """
+        Copy of the metrics as plain data.
+        """
+        with self._lock:
+            caches = dict(self.caches)
+        cache_stats = [{"name": name, **cache.stats()} for name, cache in sorted(caches.items())]
+        with self._lock:
+            return {
+                "startedAt": self.started_at,
+                "timestamp": time.time(),
+                "operations": [
+                    {"table": table, "index": index, "operation": operation, "calls": stats.calls,
+                     "items": stats.items, "errors": stats.errors, "retries": stats.retries,
+                     "throttles": stats.throttles, "latencySum": stats.latency_sum,
+                     "latencyP50": stats.quantile(0.5), "latencyP99": stats.quantile(0.99),
+                     "buckets": list(stats.buckets)}
+                    for (table, index, operation), stats in sorted(self.operations.items())
+                ],
+                "capacity": [
+                    {"table": table, "index": index, "kind": kind, "units": units}
+                    for (table, index, kind), units in sorted(self.capacity.items())
+                ],
+                "caches": cache_stats
+            }
+
+    def flush(self):
+        """
+        Hand the current metrics to every sink.
+        """
+        if not self.sinks:
+            return
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            try:
+                sink.emit(snapshot)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"Failed to export metrics with {type(sink).__name__}: {exc!r}")
+
+
+def _write_atomic(path, content):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as metrics_file:
+        metrics_file.write(content)
+    os.replace(tmp_path, path)
+
+
+class JSONFileSink:
+    """
+    Writes the snapshot as JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, snapshot):
+        _write_atomic(self.path, json.dumps(snapshot, indent=2))
+
+
+def to_prometheus(snapshot):
+    """
+    Render a snapshot in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP dynamodb_operation_latency_seconds Latency of DynamoDB calls.",
+        "# TYPE dynamodb_operation_latency_seconds histogram",
+    ]
+    counters = {
+        "items": "Items read or written.",
+        "errors": "Failed calls.",
+        "retries": "Resubmitted requests.",
+        "throttles": "Throttling errors.",
+    }
+    for op in snapshot['operations']:
+        labels = f'table="{op["table"]}",index="{op["index"]}",operation="{op["operation"]}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), op['buckets']):
+            cumulative += count
+            lines.append(f'dynamodb_operation_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"dynamodb_operation_latency_seconds_sum{{{labels}}} {op['latencySum']}")
+        lines.append(f"dynamodb_operation_latency_seconds_count{{{labels}}} {op['calls']}")
+    for name, help_text in counters.items():
+        lines.append(f"# HELP dynamodb_operation_{name}_total {help_text}")
+        lines.append(f"# TYPE dynamodb_operation_{name}_total counter")
+        for op in snapshot['operations']:
+            labels = f'table="{op["table"]}",index="{op["index"]}",operation="{op["operation"]}"'
+            lines.append(f"dynamodb_operation_{name}_total{{{labels}}} {op[name]}")
+    lines.append("# HELP dynamodb_consumed_capacity_units_total Consumed read and write capacity units.")
+    lines.append("# TYPE dynamodb_consumed_capacity_units_total counter")
+    for entry in snapshot['capacity']:
+        lines.append(f'dynamodb_consumed_capacity_units_total{{table="{entry["table"]}",index="{entry["index"]}",'
+                     f'kind="{entry["kind"]}"}} {entry["units"]}')
+    caches = snapshot.get('caches', [])
+    if caches:
+        for name in CACHE_COUNTERS:
+            lines.append(f"# HELP resolver_cache_{name}_total {CACHE_COUNTERS[name]}")
+            lines.append(f"# TYPE resolver_cache_{name}_total counter")
+            for cache in caches:
+                lines.append(f'resolver_cache_{name}_total{{cache="{cache["name"]}"}} {cache[name]}')
+        lines.append("# HELP resolver_cache_hit_ratio Share of lookups served from the cache.")
+        lines.append("# TYPE resolver_cache_hit_ratio gauge")
+        for cache in caches:
+            lines.append(f'resolver_cache_hit_ratio{{cache="{cache["name"]}"}} {cache["hitRatio"]}')
+        lines.append("# HELP resolver_cache_entries Entries held by the cache.")
+        lines.append("# TYPE resolver_cache_entries gauge")
+        for cache in caches:
+            lines.append(f'resolver_cache_entries{{cache="{cache["name"]}"}} {cache["entries"]}')
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusFileSink:
+    """
+    Writes the snapshot in the Prometheus text format, e.g. for the node exporter textfile collector.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, snapshot):
+        _write_atomic(self.path, to_prometheus(snapshot))
+
+
+class EMFSink:
+    """
+    Prints the snapshot as CloudWatch Embedded Metric Format records, which the
+    CloudWatch agent or Lambda turns into metrics. CloudWatch sums the values
+    it receives, so counters are emitted as their increase since the previous
+    emit, and latency quantiles and hit ratios cover that interval only.
+    Operations and capacity without any activity in the interval are left out.
+    """
+
+    def __init__(self, namespace=DEFAULT_NAMESPACE, stream=None):
+        self.namespace = namespace
+        self.stream = stream or sys.stdout
+        self._previous = {}
+
+    def _delta(self, key, value):
+        """
+        Increase of a cumulative counter since the previous emit; a counter lower
+        than before was reset and counts from zero.
+        """
+        previous = self._previous.get(key, 0)
+        self._previous[key] = value
+        return value - previous if value >= previous else value
+
+    def _record(self, timestamp, dimensions, values, units):
+        return json.dumps({
+            "_aws": {
+                "Timestamp": int(timestamp * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": units[name]} for name in values]
+                }]
+            },
+            **dimensions,
+            **values
+        })
+
+    def emit(self, snapshot):
+        timestamp = snapshot['timestamp']
+        for op in snapshot['operations']:
+            dimensions = {"Table": op['table'], "Index": op['index'] or "-", "Operation": op['operation']}
+            key = tuple(dimensions.values())
+            values = {name.capitalize(): self._delta(key + (name,), op[name])
+                      for name in ("calls", "items", "errors", "retries", "throttles")}
+            buckets = [self._delta(key + (bucket,), count) for bucket, count in enumerate(op['buckets'])]
+            if not any(values.values()):
+                continue
+            interval = OperationStats(calls=values['Calls'], buckets=buckets)
+            values.update({"LatencyP50": interval.quantile(0.5) * 1000, "LatencyP99": interval.quantile(0.99) * 1000})
+            units = {name: "Count" for name in values}
+            units.update({"LatencyP50": "Milliseconds", "LatencyP99": "Milliseconds"})
+            print(self._record(timestamp, dimensions, values, units), file=self.stream)
+        for entry in snapshot['capacity']:
+            dimensions = {"Table": entry['table'], "Index": entry['index'] or "-"}
+            name = "ConsumedReadCapacityUnits" if entry['kind'] == "read" else "ConsumedWriteCapacityUnits"
+            units = self._delta(tuple(dimensions.values()) + (name,), entry['units'])
+            if units:
+                print(self._record(timestamp, dimensions, {name: units}, {name: "Count"}), file=self.stream)
+        for cache in snapshot.get('caches', []):
+            values = {name.capitalize(): self._delta(("cache", cache['name'], name), cache[name])
+                      for name in CACHE_COUNTERS}
+            lookups = values['Hits'] + values['Misses'] + values['Coalesced']
+            hit_ratio = (values['Hits'] + values['Coalesced']) / lookups if lookups else 0.0
+            values.update({"Entries": cache['entries'], "HitRatio": hit_ratio * 100})
+            units = {name: "Count" for name in values}
+            units["HitRatio"] = "Percent"
+            print(self._record(timestamp, {"Cache": cache['name']}, values, units), file=self.stream)
+        self.stream.flush()
+
+
+METRICS = MetricsRegistry()
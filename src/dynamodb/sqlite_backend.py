@@ -0,0 +1,365 @@
+""" Embedded SQLite storage backend, e.g. for local runs and read replicas without DynamoDB """
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from dynamodb.backend import BulkWriteResult, StorageBackend, check_start_key
+
+DEFAULT_PAGE_SIZE = 1000
+# SQLite allows at most 999 bound parameters per statement in older builds
+BATCH_GET_LIMIT = 400
+# Upper bound used to turn begins_with into a range scan
+PREFIX_END = "\U0010ffff"
+COMPARISONS = ("=", "<>", "<", "<=", ">", ">=")
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"{type(value).__name__} values cannot be stored in SQLite")
+
+
+def _sql_value(value):
+    return _json_default(value) if isinstance(value, Decimal) else value
+
+
+def _load(data):
+    """ Decode a stored item, with numbers as Decimal like the DynamoDB deserializer """
+    return json.loads(data, parse_float=Decimal, parse_int=Decimal)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores a table in a SQLite database, one row per item.
+
+    The key attributes are real columns forming the primary key, with a
+    second index on (sortKey, hashKey) serving the by-record-type listings
+    that DynamoDB serves from its global secondary index; all other
+    attributes live in a JSON document. Every thread gets its own connection
+    and the database runs in WAL mode, so reads never wait for each other or
+    for a writer.
+    """
+
+    def __init__(self, config, table_name, path):
+        self.config = config
+        self.table_name = table_name
+        self.path = path
+        self.key_names = [key['AttributeName'] for key in self.config['tables'][self.table_name]['keySchema']]
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self, conn):
+        hash_key, sort_key = (f'"{name}"' for name in self.key_names)
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table_name}" ('
+                     f'{hash_key} TEXT NOT NULL, {sort_key} TEXT NOT NULL, item TEXT NOT NULL, '
+                     f'PRIMARY KEY ({hash_key}, {sort_key})) WITHOUT ROWID')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{self.table_name}_by_source" '
+                     f'ON "{self.table_name}" ({sort_key}, {hash_key})')
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table_name}_meta" '
+                     f'(name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        conn.execute(f'INSERT OR IGNORE INTO "{self.table_name}_meta" VALUES (?, ?)',
+                     ("createdAt", datetime.now(timezone.utc).isoformat()))
+
+    def ensure_table(self, full=None):
+        """
+        Create the table and its indexes if needed.
+        """
+        self._connection()
+        return self
+
+    def table_identity(self) -> str:
+        """
+        Database path and creation time of the table.
+        """
+        row = self._connection().execute(f'SELECT value FROM "{self.table_name}_meta" WHERE name = ?',
+                                         ("createdAt",)).fetchone()
+        return f"sqlite:{os.path.abspath(self.path)}:{self.table_name}@{row[0]}"
+
+    def _column(self, name):
+        """
+        SQL expression reading an attribute.
+        """
+        if name in self.key_names:
+            return f'"{name}"'
+        return f"json_extract(item, '$.\"{name}\"')"
+
+    def _where(self, condition, params):
+        """
+        Translate a boto3 condition into a SQL expression, appending its parameters.
+        """
+        expression = condition.get_expression()
+        operator, values = expression['operator'], expression['values']
+        if operator in ("AND", "OR"):
+            return f"({self._where(values[0], params)} {operator} {self._where(values[1], params)})"
+        if operator == "NOT":
+            return f"(NOT {self._where(values[0], params)})"
+        name = values[0].name
+        column = self._column(name)
+        if operator in COMPARISONS:
+            params.append(_sql_value(values[1]))
+            return f"{column} {operator} ?"
+        if operator == "BETWEEN":
+            params.extend([_sql_value(values[1]), _sql_value(values[2])])
+            return f"{column} BETWEEN ? AND ?"
+        if operator == "IN":
+            params.extend(_sql_value(value) for value in values[1])
+            return f"{column} IN ({', '.join('?' * len(values[1]))})"
+        if operator == "begins_with":
+            params.extend([values[1], values[1] + PREFIX_END])
+            return f"({column} >= ? AND {column} < ?)"
+        if operator == "contains":
+            params.extend([_sql_value(values[1]), values[1]])
+            return (f"(CASE json_type(item, '$.\"{name}\"') WHEN 'array' THEN "
+                    f"EXISTS (SELECT 1 FROM json_each(item, '$.\"{name}\"') WHERE value = ?) "
+                    f"ELSE instr({column}, ?) > 0 END)")
+        if operator in ("attribute_exists", "attribute_not_exists"):
+            if name in self.key_names:
+                return "1" if operator == "attribute_exists" else "0"
+            check = "IS NOT NULL" if operator == "attribute_exists" else "IS NULL"
+            return f"json_type(item, '$.\"{name}\"') {check}"
+        raise ValueError(f"Condition {operator} is not supported by the SQLite backend")
+
+    def _encode(self, item):
+        return [str(item[name]) for name in self.key_names] + [
+            json.dumps(item, default=_json_default, separators=(",", ":"))]
+
+    def _key_values(self, key):
+        return tuple(key[name] for name in self.key_names) if isinstance(key, dict) else tuple(key)
+
+    def _write(self, statement, rows):
+        start = time.monotonic()
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(statement, rows)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return BulkWriteResult(written=len(rows), elapsed=time.monotonic() - start)
+
+    def put_item(self, item):
+        """
+        Put an item into the table.
+        """
+        self.batch_put([item])
+
+    def batch_put(self, items: list, max_attempts: int = None) -> BulkWriteResult:
+        """
+        Upsert items in one transaction.
+
+        Returns:
+            A BulkWriteResult for these items.
+        """
+        rows = list({tuple(row[:2]): row for row in map(self._encode, items)}.values())
+        return self._write(f'INSERT OR REPLACE INTO "{self.table_name}" VALUES (?, ?, ?)', rows)
+
+    def batch_delete(self, keys: list, max_attempts: int = None) -> BulkWriteResult:
+        """
+        Delete items in one transaction.
+
+        Returns:
+            A BulkWriteResult whose written count is the number of keys deleted.
+        """
+        hash_key, sort_key = self.key_names
+        rows = [tuple(map(str, self._key_values(key))) for key in keys]
+        return self._write(f'DELETE FROM "{self.table_name}" WHERE "{hash_key}" = ? AND "{sort_key}" = ?', rows)
+
+    def batch_get(self, keys, projection_expression=None, expression_attribute_names=None, **_) -> dict:
+        """
+        Get many items by key.
+
+        Returns:
+            A dict mapping (hashKey, sortKey) tuples to items. Missing items are absent.
+        """
+        hash_key, sort_key = self.key_names
+        unique_keys = list(dict.fromkeys(self._key_values(key) for key in keys))
+        projection = self._projection(projection_expression, expression_attribute_names)
+        results = {}
+        conn = self._connection()
+        for i in range(0, len(unique_keys), BATCH_GET_LIMIT):
+            chunk = unique_keys[i:i + BATCH_GET_LIMIT]
+            rows = conn.execute(f'SELECT item FROM "{self.table_name}" WHERE ("{hash_key}", "{sort_key}") '
+                                f'IN (VALUES {", ".join(["(?, ?)"] * len(chunk))})',
+                                [str(value) for key in chunk for value in key])
+            for (data,) in rows:
+                item = self._project(_load(data), projection)
+                results[self._key_values(item)] = item
+        return results
+
+    def _projection(self, projection_expression, expression_attribute_names=None):
+        """
+        Top-level attributes named by a ProjectionExpression, plus the keys.
+        """
+        if not projection_expression:
+            return None
+        names = expression_attribute_names or {}
+        attributes = set(self.key_names)
+        for path in projection_expression.split(","):
+            top = path.strip().split(".")[0].split("[")[0]
+            attributes.add(names.get(top, top))
+        return attributes
+
+    @staticmethod
+    def _project(item, projection):
+        if projection is None:
+            return item
+        return {name: value for name, value in item.items() if name in projection}
+
+    def _index_order(self, index_name):
+        """
+        Attributes giving the order of a query, the first being the index sort key.
+        """
+        order = []
+        if index_name:
+            for gsi in self.config['tables'][self.table_name].get('globalSecondaryIndexes', []):
+                if gsi['IndexName'] == index_name:
+                    order += [key['AttributeName'] for key in gsi['KeySchema'] if key['KeyType'] == 'RANGE']
+        else:
+            order.append(self.key_names[1])
+        return order + [name for name in self.key_names if name not in order]
+
+    def iter_query(self, condition, filter_expression=None, index_name=None, projection_expression=None,
+                   expression_attribute_names=None, limit: int = None, page_size: int = None,
+                   scan_index_forward: bool = True, exclusive_start_key=None) -> "SQLiteQuery":
+        """
+        Lazily get the items matching a key condition, in the index or table sort key order.
+
+        Returns:
+            A SQLiteQuery over the items, with last_evaluated_key to resume from.
+        """
+        params = []
+        where = [self._where(condition, params)]
+        if filter_expression is not None:
+            where.append(self._where(filter_expression, params))
+        return SQLiteQuery(self, where, params, self._index_order(index_name), limit, page_size,
+                           exclusive_start_key, self._projection(projection_expression, expression_attribute_names),
+                           descending=not scan_index_forward)
+
+    def iter_source(self, source: str, projection_expression=None, expression_attribute_names=None,
+                    filter_expression=None, limit: int = None, page_size: int = None,
+                    exclusive_start_key=None, max_workers: int = None) -> "SQLiteQuery":
+        """
+        Lazily list the items of a record type in hashKey order, using the (sortKey, hashKey) index.
+
+        Returns:
+            A SQLiteQuery over the items, with last_evaluated_key to resume from.
+
+        Raises:
+            InvalidStartKeyError: When exclusive_start_key is not a position of this listing.
+        """
+        hash_key, sort_key = self.key_names
+        if exclusive_start_key is not None:
+            check_start_key(exclusive_start_key, self.key_names, **{sort_key: source})
+        params = [source]
+        where = [f'"{sort_key}" = ?']
+        if filter_expression is not None:
+            where.append(self._where(filter_expression, params))
+        return SQLiteQuery(self, where, params, [hash_key, sort_key], limit, page_size, exclusive_start_key,
+                           self._projection(projection_expression, expression_attribute_names))
+
+    def iter_scan(self, total_segments: int = 1, projection_expression=None, expression_attribute_names=None,
+                  filter_expression=None, limit: int = None, max_workers: int = None) -> "SQLiteQuery":
+        """
+        Scan the table in primary key order, yielding pages of items. Segments are not needed here.
+
+        Returns:
+            A SQLiteQuery over pages (lists of items).
+        """
+        params = []
+        where = [] if filter_expression is None else [self._where(filter_expression, params)]
+        return SQLiteQuery(self, where, params, list(self.key_names), None, limit, None,
+                           self._projection(projection_expression, expression_attribute_names), by_page=True)
+
+
+class SQLiteQuery:
+    """
+    Lazy, resumable iterator over the rows matching a SQLite query.
+
+    Rows are read a page at a time with a keyset condition on the ordering
+    attributes, so resuming from last_evaluated_key costs an index seek
+    rather than skipping rows. It mirrors the QueryIterator counters, with
+    no capacity consumed.
+    """
+
+    def __init__(self, backend, where, params, order, limit=None, page_size=None, exclusive_start_key=None,
+                 projection=None, descending=False, by_page=False):
+        self.backend = backend
+        self.where = where
+        self.params = params
+        self.order = order
+        self.limit = limit
+        self.page_size = page_size or DEFAULT_PAGE_SIZE
+        self.last_evaluated_key = exclusive_start_key
+        self.projection = projection
+        self.descending = descending
+        self.by_page = by_page
+        self.consumed_capacity = 0.0
+        self.scanned_count = 0
+        self.count = 0
+        self.pages = 0
+
+    def _key_of(self, item):
+        return {name: item[name] for name in self.order if name in item}
+
+    def _pages(self):
+        columns = [self.backend._column(name) for name in self.order]
+        direction = "DESC" if self.descending else "ASC"
+        order_by = ", ".join(f"{column} {direction}" for column in columns)
+        remaining = self.limit
+        conn = self.backend._connection()
+        while remaining is None or remaining > 0:
+            where, params = list(self.where), list(self.params)
+            if self.last_evaluated_key:
+                where.append(f"({', '.join(columns)}) {'<' if self.descending else '>'} "
+                             f"({', '.join('?' * len(columns))})")
+                params.extend(_sql_value(self.last_evaluated_key.get(name)) for name in self.order)
+            page_limit = min(self.page_size, remaining) if remaining is not None else self.page_size
+            statement = f'SELECT item FROM "{self.backend.table_name}"'
+            if where:
+                statement += f" WHERE {' AND '.join(where)}"
+            rows = conn.execute(f"{statement} ORDER BY {order_by} LIMIT ?", params + [page_limit]).fetchall()
+            self.pages += 1
+            self.scanned_count += len(rows)
+            page = [_load(data) for (data,) in rows]
+            if remaining is not None:
+                remaining -= len(page)
+            yield page, len(page) < page_limit
+            if len(page) < page_limit:
+                return
+
+    def __iter__(self):
+        for page, exhausted in self._pages():
+            projected = [self.backend._project(item, self.projection) for item in page]
+            if self.by_page:
+                self.count += len(page)
+                self.last_evaluated_key = None if exhausted or not page else self._key_of(page[-1])
+                if projected:
+                    yield projected
+                continue
+            for item, full_item in zip(projected, page):
+                self.last_evaluated_key = self._key_of(full_item)
+                self.count += 1
+                yield item
+            if exhausted:
+                self.last_evaluated_key = None
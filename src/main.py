@@ -1,22 +1,45 @@
 import os
-# import click
 
-from data import generate
+import click
 
-# @click.group()
-# def entry_point():
-#     pass
+from data import generate
 
 
-if __name__ == "__main__":
-    options = {
-        "vuln": {
-            "function": generate.insert_vulnerability_data
-        }
+OPTIONS = {
+    "vuln": {
+        "function": generate.insert_vulnerability_data,
+        "options": ["resume"]
+    },
+    "schema": {
+        "function": generate.reconcile_schema,
+        "options": []
+    },
+    "shards": {
+        "function": generate.backfill_source_shards,
+        "options": []
     }
-    func_name = os.environ.get("ACTION", "")
-    job = options.get(func_name, {}).get("function", None)
+}
+
+
+@click.command()
+@click.argument("action", required=False)
+@click.argument("config", required=False)
+@click.option("--resume", is_flag=True, help="Skip the CVEs checkpointed by a previous, interrupted run.")
+def entry_point(action, config, resume):
+    """ Run the ingestion job ACTION against the CONFIG environment """
+    func_name = action or os.environ.get("ACTION", "")
+    if config:
+        os.environ["CONFIG"] = config
+    job = OPTIONS.get(func_name, {}).get("function", None)
     if job is None:
         print(f"No job found for function key: {func_name}")
     else:
-        job()
\ No newline at end of file
+        options = {"resume": resume}
+        try:
+            job(**{name: options[name] for name in OPTIONS[func_name]["options"]})
+        except generate.IncompleteLoadError as exc:
+            raise click.ClickException(str(exc)) from exc
+
+
+if __name__ == "__main__":
+    entry_point()
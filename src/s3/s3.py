@@ -3,7 +3,9 @@
 import gzip
 import io
 import json
+import os
 import re
+import tempfile
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum, auto
@@ -70,6 +72,36 @@ class ENVIRONMENT(Enum):
     AWS = "aws"
 
 
+class ParquetUpload:
+    """ Streams record batches into a local parquet file that is uploaded on close, or discarded on abort """
+
+    def __init__(self, uploader, destination: str, schema: pa.Schema):
+        self.uploader = uploader
+        self.destination = destination
+        with tempfile.NamedTemporaryFile(suffix=".parquet", delete=False) as tmp:
+            self.path = tmp.name
+        self.writer = pq.ParquetWriter(self.path, schema)
+
+    def write_batch(self, batch: pa.RecordBatch):
+        """ Append a record batch to the parquet file """
+        self.writer.write_batch(batch)
+
+    def close(self):
+        """ Finish the parquet file and upload it """
+        self.writer.close()
+        try:
+            self.uploader.upload_file(self.path, self.destination)
+        finally:
+            os.remove(self.path)
+
+    def abort(self):
+        """ Discard the parquet file without uploading it """
+        try:
+            self.writer.close()
+        finally:
+            os.remove(self.path)
+
+
 class S3Uploader:  # pylint: disable=too-few-public-methods
     """ Class for processing Trust raw data """
 
@@ -118,6 +150,46 @@ class S3Uploader:  # pylint: disable=too-few-public-methods
                 path=f"s3://{self.config.bucket}/{destination}",
             )
     
+    def open_modeled_writer(self, source: str, qualifier: str, filename: str, schema: pa.Schema) -> ParquetUpload:
+        """ Open a streaming parquet writer for modeled data, uploaded when closed """
+        destination = f"{generate_s3_path(source, qualifier, filename)}.parquet"
+        return ParquetUpload(self, destination, schema)
+
+    def upload_file(self, path: str, destination: str):
+        """ Upload a local file to the bucket """
+        if self.env == ENVIRONMENT.LOCALSTACK.value:
+            try:
+                if not self.s3_client.bucket_exists(self.config.bucket):
+                    self.s3_client.make_bucket(self.config.bucket)
+                    print(f"Bucket {self.config.bucket} created.")
+                self.s3_client.fput_object(self.config.bucket, destination, path,
+                                           content_type='application/octet-stream')
+            except S3Error as exc:
+                print(f"Error occurred: {exc}")
+        else:
+            self.s3_client.upload_file(path, self.config.bucket, destination)
+
+    def download_file(self, destination: str, path: str) -> bool:
+        """ Download an object of the bucket to a local file, returning False when it does not exist """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.env == ENVIRONMENT.LOCALSTACK.value:
+            try:
+                self.s3_client.fget_object(self.config.bucket, destination, path)
+            except S3Error as exc:
+                if exc.code in ("NoSuchKey", "NoSuchBucket"):
+                    return False
+                raise
+        else:
+            try:
+                self.s3_client.download_file(self.config.bucket, destination, path)
+            except ClientError as exc:
+                if exc.response['Error']['Code'] in ("404", "NoSuchKey"):
+                    return False
+                raise
+        return True
+
     def _store_locally(self, findings: list, destination: str):
         """ Store data locally """
         df = pd.DataFrame(findings)
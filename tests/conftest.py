@@ -0,0 +1,39 @@
+""" Shared fixtures; the modules under test are imported from src like the entry points do """
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+@pytest.fixture
+def aws_env(monkeypatch):
+    """ Dummy credentials so boto3 never reaches a real account """
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1"), ("CONFIG", "test")):
+        monkeypatch.setenv(name, value)
+
+
+@pytest.fixture
+def table_config(aws_env, tmp_path):
+    """ The test DynamoDB config, pointed at moto and with its local files under tmp_path """
+    from dynamodb.dynamodb import DynamoDBConfig
+    config = DynamoDBConfig("test").get_config()
+    config['general']['endpointURL'] = None
+    config['general']['metrics'] = {"exporters": []}
+    config['general']['storage'] = {"backend": "dynamodb", "sqlitePath": str(tmp_path / "table.sqlite")}
+    return config
+
+
+@pytest.fixture
+def dynamo_table(table_config):
+    """ A freshly created SampleTable on moto """
+    from moto import mock_dynamodb
+    from dynamodb.dynamodb import REGISTRY, open_table
+    with mock_dynamodb():
+        REGISTRY.clear()
+        table = open_table(table_config, "SampleTable")
+        table.ensure_table()
+        yield table
+    REGISTRY.clear()
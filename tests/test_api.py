@@ -0,0 +1,66 @@
+""" Projection pushdown of the GraphQL resolvers """
+import asyncio
+
+import pytest
+from ariadne import graphql
+
+from api import main
+
+CVES = [{"hashKey": f"CVE-{index}", "sortKey": "cve#details", "summary": f"summary {index}", "assignedby": "nvd"}
+        for index in range(2)]
+
+
+@pytest.fixture
+def api_table(dynamo_table, monkeypatch):
+    dynamo_table.batch_put([{"hashKey": "product", "sortKey": "product#cve", "cve_list": ["CVE-0", "CVE-1"]},
+                            *CVES])
+    monkeypatch.setattr(main, "get_table", lambda config_name: dynamo_table)
+    monkeypatch.setattr(main, "get_cache", lambda config_name: None)
+    return dynamo_table
+
+
+def execute(query):
+    success, result = asyncio.run(graphql(main.schema, {"query": query}, context_value={}))
+    assert success and "errors" not in result, result
+    return result["data"]
+
+
+def test_selections_of_a_field_requested_twice_are_merged(api_table):
+    data = execute("{ listProducts { name } listProducts { CVEList } "
+                   "  more: listProducts { cves { details { cve } } cves { details { summary } } } }")
+
+    assert data["listProducts"] == [{"name": "product", "CVEList": ["CVE-0", "CVE-1"]}]
+    assert [cve["details"] for cve in data["more"][0]["cves"]] == [
+        {"cve": "CVE-0", "summary": "summary 0"}, {"cve": "CVE-1", "summary": "summary 1"}]
+
+
+def test_nested_lookups_project_each_path_once(api_table):
+    requests = []
+    api_table.client.meta.events.register(
+        "provide-client-params.dynamodb.BatchGetItem",
+        lambda params, **_: requests.append(params['RequestItems'][api_table.table_name]))
+
+    execute("{ listProducts { cves { details { cve summary } } } }")
+
+    assert requests
+    for request in requests:
+        names = request['ExpressionAttributeNames']
+        paths = [names.get(path.strip(), path.strip()) for path in request['ProjectionExpression'].split(",")]
+        assert len(paths) == len(set(paths))
+        assert set(paths) == {"hashKey", "sortKey", "summary"}
+
+
+def test_epss_of_a_cve_is_found_under_its_record_type(api_table):
+    api_table.batch_put([{"hashKey": "CVE-0", "sortKey": "cve#epss", "epss": "0.5", "percentile": "0.9"}])
+
+    data = execute('{ listEPSS(cve: "CVE-0") { cve epss } }')
+
+    assert data["listEPSS"] == [{"cve": "CVE-0", "epss": "0.5"}]
+
+
+def test_products_without_cves_resolve_to_an_empty_list(api_table):
+    api_table.batch_put([{"hashKey": "bare", "sortKey": "product#cve"}])
+
+    data = execute("{ listProducts(productName: \"bare\") { name cves { cve details { summary } } } }")
+
+    assert data["listProducts"] == [{"name": "bare", "cves": []}]
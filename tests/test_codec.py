@@ -0,0 +1,65 @@
+""" Optional compression of large attributes """
+from boto3.dynamodb.types import Binary
+
+from dynamodb.codec import MAGIC, AttributeCodec
+
+SUMMARY = "A heap overflow in the parser allows remote code execution. " * 40
+CPES = [f"cpe:2.3:a:vendor:product:{version}:*:*:*:*:*:*:*" for version in range(60)]
+
+
+def item(**attributes):
+    return {"hashKey": "CVE-1", "sortKey": "cve#details", **attributes}
+
+
+def test_large_values_round_trip_through_compressed_binary():
+    codec = AttributeCodec(["summary", "vulnerabilityProduct"], threshold=256)
+    original = item(summary=SUMMARY, vulnerabilityProduct=CPES)
+
+    stored = codec.encode(original)
+
+    assert stored is not original and original["summary"] == SUMMARY
+    assert all(isinstance(stored[name], Binary) and stored[name].value.startswith(MAGIC)
+               for name in ("summary", "vulnerabilityProduct"))
+    assert codec.decode(dict(stored)) == original
+    assert codec.decode({**stored, "summary": stored["summary"].value})["summary"] == SUMMARY
+
+
+def test_values_below_the_threshold_keep_their_type():
+    codec = AttributeCodec(["summary", "cve_list"], threshold=1024)
+    small = item(summary="short", cve_list=["CVE-1"])
+
+    assert codec.encode(small) is small
+    assert codec.stats["summary"].encoded == 0
+
+
+def test_legacy_uncompressed_items_are_returned_unchanged():
+    codec = AttributeCodec(["summary", "vulnerabilityProduct"], threshold=16)
+    legacy = item(summary=SUMMARY, vulnerabilityProduct=CPES, other=Binary(b"\x00raw"))
+
+    assert codec.decode(dict(legacy)) == legacy
+    assert codec.stats["summary"].decoded == 0
+
+
+def test_stats_report_the_bytes_saved():
+    codec = AttributeCodec(["summary"], threshold=256)
+
+    codec.decode(codec.encode(item(summary=SUMMARY)))
+
+    stats = codec.stats["summary"]
+    assert (stats.encoded, stats.decoded) == (1, 1)
+    assert stats.raw_bytes == len(SUMMARY) + 2
+    assert 0 < stats.stored_bytes < stats.raw_bytes
+    assert stats.saved_bytes == stats.raw_bytes - stats.stored_bytes
+    assert stats.ratio < 0.2
+
+
+def test_compression_is_off_unless_enabled_but_still_decoded():
+    config = {"attributes": ["summary"], "threshold": 256}
+    enabled = AttributeCodec.from_config({**config, "enabled": True})
+    disabled = AttributeCodec.from_config(config)
+
+    stored = enabled.encode(item(summary=SUMMARY))
+
+    assert disabled.encode(item(summary=SUMMARY)) == item(summary=SUMMARY)
+    assert disabled.decode(dict(stored))["summary"] == SUMMARY
+    assert AttributeCodec.from_config({"enabled": True}) is None
@@ -0,0 +1,33 @@
+""" Product extraction from CPE strings """
+import pytest
+
+from data.cpe import extract_products, parse_cpe, split_formatted
+
+
+def test_split_keeps_escaped_colons_in_the_value():
+    assert split_formatted(r"a:vendor:prod\:uct:1.0") == ["a", "vendor", r"prod\:uct", "1.0"]
+
+
+def test_split_keeps_escaped_backslashes_and_splits_after_them():
+    assert split_formatted("a:ven\\\\:dor:1.0") == ["a", "ven\\\\", "dor", "1.0"]
+    assert split_formatted("a:ven\\\\\\:dor:1.0") == ["a", "ven\\\\\\:dor", "1.0"]
+
+
+def test_formatted_and_uri_cpes_give_the_same_attributes():
+    formatted = parse_cpe("cpe:2.3:a:Apache:HTTP_Server:2.4.1:*:*:*:*:*:*:*")
+    uri = parse_cpe("cpe:/a:apache:http_server:2.4.1")
+
+    assert formatted["vendor"] == uri["vendor"] == "apache"
+    assert formatted["product"] == uri["product"] == "http_server"
+    assert formatted["version"] == uri["version"] == "2.4.1"
+
+
+def test_products_are_distinct_in_first_seen_order():
+    cpes = ["cpe:2.3:a:v:b\\:x:1:*:*:*:*:*:*:*", "cpe:/a:v:a:1", "cpe:2.3:a:v:b\\:x:2:*:*:*:*:*:*:*"]
+
+    assert extract_products(cpes) == ["b\\:x", "a"]
+
+
+def test_cpe_strings_of_another_format_are_rejected():
+    with pytest.raises(ValueError):
+        extract_products(["not-a-cpe"])
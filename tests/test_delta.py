@@ -0,0 +1,87 @@
+""" Delta ingestion must retry the CVEs whose enrichment failed and drop the CVEs left without products """
+import pytest
+
+from data.epss import EPSS
+from data.generate import check_ingestion_config, collect_delta
+from data.watermark import IngestionState
+
+ROWS = [
+    {"cve": "CVE-1", "epss": "0.1", "percentile": "0.5", "date": "2024-01-01"},
+    {"cve": "CVE-2", "epss": "0.2", "percentile": "0.6", "date": "2024-01-01"},
+]
+
+
+class FakeEPSS(EPSS):
+    """
+    EPSS loader serving fixed rows, failing the lookup of the CVEs listed in
+    broken and finding no product for those listed in unaffected
+    """
+
+    def __init__(self, broken, unaffected=(), modified=()):
+        super().__init__({"epssURL": "http://epss", "cveURL": "http://cve"})
+        self.broken = broken
+        self.unaffected = set(unaffected)
+        self.modified = set(modified)
+        self.looked_up = []
+
+    def modified_since(self, watermark, cve_ids):
+        return self.modified & set(cve_ids)
+
+    def load_epss(self):
+        return [dict(row) for row in ROWS]
+
+    def _enrich_stream(self, epss_rows, queue_size, on_error):
+        for epss in epss_rows:
+            self.looked_up.append(epss['cve'])
+            if epss['cve'] in self.broken:
+                on_error(epss, RuntimeError("lookup failed"))
+                continue
+            if epss['cve'] in self.unaffected:
+                continue
+            yield {
+                "cve_id": epss['cve'], "productList": ["product"], "lastModified": "2024-01-01",
+                "publishedDate": "2023-12-01", "assignedby": None, "summary": "s",
+                "vulnerabilityProduct": ["cpe:/a:vendor:product"],
+                "epss_details": {**epss, "cve_id": epss['cve']}
+            }
+
+
+def test_failed_cves_are_retried_by_the_next_run(tmp_path):
+    state = IngestionState(str(tmp_path / "state.json"))
+    collect_delta(FakeEPSS(broken={"CVE-2"}), state)
+    state.save()
+    assert "CVE-1" in state.cves
+    assert "CVE-2" not in state.cves
+
+    retry = FakeEPSS(broken=set())
+    items, removed = collect_delta(retry, IngestionState(str(tmp_path / "state.json")))
+    assert retry.looked_up == ["CVE-2"]
+    assert {"hashKey": "CVE-2", "sortKey": "cve#details"}.items() <= next(
+        item for item in items if item['sortKey'] == "cve#details").items()
+    assert removed == []
+
+
+def test_cves_losing_all_products_are_deleted(tmp_path):
+    state = IngestionState(str(tmp_path / "state.json"))
+    collect_delta(FakeEPSS(broken=set()), state)
+
+    items, removed = collect_delta(FakeEPSS(broken=set(), unaffected={"CVE-1"}, modified={"CVE-1"}), state)
+
+    assert removed == [{"hashKey": "CVE-1", "sortKey": "cve#details"}, {"hashKey": "CVE-1", "sortKey": "cve#epss"}]
+    assert not any(item['hashKey'] == "CVE-1" for item in items)
+    assert {"hashKey": "product", "sortKey": "product#cve", "cve_list": ["CVE-2"]} in items
+
+
+@pytest.mark.parametrize("ingestion, enrichment, error", [
+    ({"mode": "delta"}, {"mode": "nvd"}, "statePath"),
+    ({"mode": "delta", "statePath": "state.json"}, {"mode": "async"}, "enrichment.mode"),
+    ({"mode": "delta", "statePath": "state.json"}, {}, "enrichment.mode"),
+])
+def test_delta_ingestion_config_is_checked(ingestion, enrichment, error):
+    with pytest.raises(ValueError, match=error):
+        check_ingestion_config({"ingestion": ingestion, "enrichment": enrichment})
+
+
+def test_full_ingestion_config_accepts_any_enrichment_mode():
+    check_ingestion_config({"ingestion": {"mode": "full"}, "enrichment": {"mode": "async"}})
+    check_ingestion_config({"ingestion": {"mode": "delta", "statePath": "state.json"}, "enrichment": {"mode": "nvd"}})
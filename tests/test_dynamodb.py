@@ -0,0 +1,60 @@
+""" BatchGetItem projections and unprocessed keys of the DynamoDB wrapper """
+import pytest
+
+from dynamodb import dynamodb as dynamodb_module
+from dynamodb.dynamodb import UnprocessedKeysError, with_key_projection
+
+
+def projected_paths(request):
+    names = request.get('ExpressionAttributeNames', {})
+    return [names.get(path.strip(), path.strip()) for path in request['ProjectionExpression'].split(",")]
+
+
+def test_key_projection_does_not_repeat_projected_keys():
+    expression, names = with_key_projection("#p0, #p1", {"#p0": "hashKey", "#p1": "summary"},
+                                            ["hashKey", "sortKey"])
+    assert projected_paths({'ProjectionExpression': expression, 'ExpressionAttributeNames': names}) == [
+        "hashKey", "summary", "sortKey"]
+
+
+def test_batch_get_projection_has_no_duplicate_paths(dynamo_table):
+    dynamo_table.batch_put([{"hashKey": "CVE-1", "sortKey": "cve#details", "summary": "s", "assignedby": "a"}])
+    requests = []
+    dynamo_table.client.meta.events.register(
+        "provide-client-params.dynamodb.BatchGetItem",
+        lambda params, **_: requests.append(params['RequestItems'][dynamo_table.table_name]))
+
+    items = dynamo_table.batch_get([("CVE-1", "cve#details")], projection_expression="#p0, #p1",
+                                   expression_attribute_names={"#p0": "hashKey", "#p1": "summary"})
+
+    paths = projected_paths(requests[0])
+    assert len(paths) == len(set(paths))
+    assert items[("CVE-1", "cve#details")] == {"hashKey": "CVE-1", "sortKey": "cve#details", "summary": "s"}
+
+
+class ThrottledClient:
+    """ BatchGetItem client that only ever processes the first key of a request """
+
+    def __init__(self, table, real_client):
+        self.table = table
+        self.real_client = real_client
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        request = RequestItems[self.table]
+        response = self.real_client.batch_get_item(RequestItems={self.table: {**request, 'Keys': request['Keys'][:1]}},
+                                                   **kwargs)
+        response['UnprocessedKeys'] = {self.table: {'Keys': request['Keys'][1:]}} if request['Keys'][1:] else {}
+        return response
+
+
+def test_batch_get_raises_on_keys_left_unprocessed(dynamo_table, monkeypatch):
+    dynamo_table.batch_put([{"hashKey": f"CVE-{idx}", "sortKey": "cve#details"} for idx in range(5)])
+    client = ThrottledClient(dynamo_table.table_name, dynamo_table.client)
+    monkeypatch.setattr(type(dynamo_table), "client", property(lambda self: client))
+    monkeypatch.setattr(dynamodb_module, "_backoff_delay", lambda attempt: 0)
+
+    with pytest.raises(UnprocessedKeysError) as error:
+        dynamo_table.batch_get([(f"CVE-{idx}", "cve#details") for idx in range(5)], max_attempts=2)
+
+    assert len(error.value.items) == 2
+    assert sorted(key['hashKey'] for key in error.value.keys) == ["CVE-2", "CVE-3", "CVE-4"]
@@ -0,0 +1,59 @@
+""" The async enrichment must not block its event loop on the blocking queues around it """
+import asyncio
+import time
+
+from data import epss as epss_module
+
+
+def slow_rows(count, delay):
+    """ EPSS rows arriving like from an upstream queue that is often empty """
+    for idx in range(count):
+        time.sleep(delay)
+        yield {"cve": f"CVE-{idx}", "epss": "0.1", "percentile": "0.5", "date": "2024-01-01"}
+
+
+async def fake_lookup(session, epss, endpoint, cache=None, limiter=None):
+    await asyncio.sleep(0.01)
+    if epss['cve'] == "CVE-3":
+        raise RuntimeError("lookup failed")
+    return {"cve_id": epss['cve']}
+
+
+async def run_with_heartbeat(**kwargs):
+    gaps = []
+
+    async def heartbeat():
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.monotonic()
+            gaps.append(now - last)
+            last = now
+
+    beat = asyncio.ensure_future(heartbeat())
+    try:
+        result = await epss_module.enrich_async(slow_rows(6, 0.1), "http://cve", concurrency=4, **kwargs)
+    finally:
+        beat.cancel()
+    return result, max(gaps)
+
+
+def test_slow_producer_and_consumer_do_not_stall_the_loop(monkeypatch):
+    monkeypatch.setattr(epss_module, "process_epss_async", fake_lookup)
+    received, failed = [], []
+
+    def slow_consumer(record):
+        time.sleep(0.1)
+        received.append(record['cve_id'])
+
+    _, max_gap = asyncio.run(run_with_heartbeat(on_result=slow_consumer,
+                                                on_error=lambda epss, exc: failed.append(epss['cve'])))
+    assert sorted(received) == ["CVE-0", "CVE-1", "CVE-2", "CVE-4", "CVE-5"]
+    assert failed == ["CVE-3"]
+    assert max_gap < 0.08
+
+
+def test_records_are_collected_without_on_result(monkeypatch):
+    monkeypatch.setattr(epss_module, "process_epss_async", fake_lookup)
+    records, _ = asyncio.run(run_with_heartbeat(on_error=lambda epss, exc: None))
+    assert len(records) == 5
@@ -0,0 +1,39 @@
+""" Concurrent paging of the EPSS API """
+import threading
+import time
+from itertools import islice
+
+from data.epss import EPSS
+
+PAGE_SIZE = 10
+TOTAL = 1000
+WORKERS = 2
+
+
+class PagedEPSS(EPSS):
+    """ EPSS loader whose API pages are generated locally """
+
+    def __init__(self):
+        super().__init__({"epssURL": "http://epss", "cveURL": "http://cve",
+                          "epssPaging": {"pageSize": PAGE_SIZE, "workers": WORKERS, "fullCatalogue": True}})
+        self.fetched = []
+        self._fetched_lock = threading.Lock()
+
+    def fetch_epss_page(self, offset, limit):
+        with self._fetched_lock:
+            self.fetched.append(offset)
+        return {"total": TOTAL, "limit": limit, "data": [
+            {"cve": f"CVE-{index}", "epss": "0.1", "percentile": "0.5", "date": "2024-01-01"}
+            for index in range(offset, min(offset + limit, TOTAL))]}
+
+
+def test_pages_are_fetched_a_bounded_window_ahead_of_the_consumer():
+    epss = PagedEPSS()
+    rows = epss.iter_epss_api()
+
+    list(islice(rows, 3 * PAGE_SIZE))
+    time.sleep(0.2)
+
+    assert len(epss.fetched) <= 3 + 2 * WORKERS
+    assert len({row["cve"] for row in rows}) == TOTAL - 3 * PAGE_SIZE
+    assert sorted(epss.fetched) == list(range(0, TOTAL, PAGE_SIZE))
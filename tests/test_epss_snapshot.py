@@ -0,0 +1,45 @@
+""" Streaming reader of the daily EPSS snapshot """
+import gzip
+
+import pytest
+
+from data.epss_snapshot import iter_epss_snapshot, resolve_snapshot
+
+ROWS = "cve,epss,percentile\nCVE-2023-0001,0.00043,0.0812\n\nCVE-2023-0002,,\n"
+SNAPSHOT = "#model_version:v2023.03.01,score_date:2024-01-15T00:00:00+0000\n" + ROWS
+
+
+def write_snapshot(path, content=SNAPSHOT):
+    with gzip.open(path, "wt", encoding="utf-8") as snapshot:
+        snapshot.write(content)
+    return path
+
+
+@pytest.mark.parametrize("comment", [
+    "#model_version:v2023.03.01,score_date:2024-01-15T00:00:00+0000\n",
+    "#score_date:2024-01-15T00:00:00+0000,model_version:v2025.03.14\n",
+])
+def test_rows_skip_the_comment_and_header_and_take_the_score_date(tmp_path, comment):
+    snapshot = write_snapshot(tmp_path / "epss_scores-2024-01-16.csv.gz", comment + ROWS)
+
+    rows = list(iter_epss_snapshot(str(snapshot)))
+
+    assert rows == [
+        {"cve": "CVE-2023-0001", "epss": "0.00043", "percentile": "0.0812", "date": "2024-01-15"},
+        {"cve": "CVE-2023-0002", "epss": 0.0, "percentile": 0.0, "date": "2024-01-15"},
+    ]
+
+
+def test_score_date_falls_back_to_the_file_name(tmp_path):
+    content = "#model_version:v2023.03.01\npercentile,cve,epss\n0.5,CVE-2023-0003,0.1\n"
+
+    rows = list(iter_epss_snapshot(str(write_snapshot(tmp_path / "epss_scores-2024-01-16.csv.gz", content))))
+
+    assert rows == [{"cve": "CVE-2023-0003", "epss": "0.1", "percentile": "0.5", "date": "2024-01-16"}]
+
+
+def test_a_directory_resolves_to_its_latest_snapshot(tmp_path):
+    for day in ("2024-01-14", "2024-01-16", "2024-01-15"):
+        write_snapshot(tmp_path / f"epss_scores-{day}.csv.gz")
+
+    assert resolve_snapshot(str(tmp_path)).endswith("epss_scores-2024-01-16.csv.gz")
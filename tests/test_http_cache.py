@@ -0,0 +1,145 @@
+""" On-disk HTTP response cache: TTL, revalidation and LRU eviction """
+import asyncio
+import json
+import threading
+
+import pytest
+
+from data import http_cache
+from data.http_cache import ResponseCache, cache_key, cached_get_json_async, cached_request_json
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class Response:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+class Session:
+    """ requests-like session replaying queued responses and recording the request headers """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.headers = []
+
+    def request(self, method, url, headers=None, **_):
+        self.headers.append(headers or {})
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(http_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "http.sqlite"), ttl=60)
+    yield cache
+    cache.close()
+
+
+def test_fresh_entries_are_served_until_the_ttl_expires(cache, clock):
+    session = Session(Response(200, {"v": 1}), Response(200, {"v": 2}))
+
+    assert cached_request_json(session, "GET", "https://x/cve/1", cache) == {"v": 1}
+    clock.now += 59
+    assert cached_request_json(session, "GET", "https://x/cve/1", cache) == {"v": 1}
+    clock.now += 1
+    assert cached_request_json(session, "GET", "https://x/cve/1", cache) == {"v": 2}
+    assert (cache.stats.misses, cache.stats.hits) == (2, 1)
+
+
+def test_stale_entries_are_revalidated_with_their_validators(cache, clock):
+    headers = {"ETag": '"abc"', "Last-Modified": "Tue, 10 Oct 2023 01:15:00 GMT"}
+    session = Session(Response(200, {"v": 1}, headers), Response(304))
+
+    cached_request_json(session, "GET", "https://x/cve/1", cache)
+    clock.now += 120
+    assert cached_request_json(session, "GET", "https://x/cve/1", cache) == {"v": 1}
+
+    assert session.headers[1] == {"If-None-Match": '"abc"', "If-Modified-Since": "Tue, 10 Oct 2023 01:15:00 GMT"}
+    assert cache.stats.revalidated == 1
+    clock.now += 30
+    assert cache.is_fresh(cache.lookup(cache_key("GET", "https://x/cve/1")))
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "http.sqlite"), max_bytes=300)
+    for name in ("a", "b", "c"):
+        clock.now += 1
+        cache.store(name, b"x" * 80)
+    clock.now += 1
+    cache.lookup("a")
+    clock.now += 1
+
+    cache.store("d", b"x" * 80)
+
+    assert [name for name in "abcd" if cache.lookup(name)] == ["a", "c", "d"]
+    assert cache.stats.evictions == 1
+    cache.close()
+
+
+class AsyncResponse:
+    def __init__(self, status, body=b"", headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self):
+        return self.body
+
+
+class AsyncSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    def get(self, url, headers=None):
+        return self.responses.pop(0)
+
+
+def test_async_lookups_run_off_the_event_loop(cache, clock, monkeypatch):
+    threads = []
+    lookup = cache.lookup
+
+    def recording_lookup(key):
+        threads.append(threading.get_ident())
+        return lookup(key)
+    monkeypatch.setattr(cache, "lookup", recording_lookup)
+    session = AsyncSession(AsyncResponse(200, b'{"v": 1}', {"ETag": '"abc"'}), AsyncResponse(304))
+
+    async def main():
+        first = await cached_get_json_async(session, "https://x/cve/1", cache)
+        clock.now += 120
+        second = await cached_get_json_async(session, "https://x/cve/1", cache)
+        return threading.get_ident(), first, second
+
+    loop_thread, first, second = asyncio.run(main())
+
+    assert first == second == {"v": 1}
+    assert cache.stats.revalidated == 1
+    assert threads and loop_thread not in threads
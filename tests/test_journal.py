@@ -0,0 +1,41 @@
+""" The checkpoint journal must survive crashes in the middle of a write """
+from data.journal import IngestionJournal
+
+
+def record(cve_id):
+    return {"cve_id": cve_id, "productList": ["product"]}
+
+
+def crash_mid_write(journal, partial):
+    """ Simulate a crash: flush what was written, then leave a half-written line """
+    journal.close()
+    with open(journal.completed_path, "a", encoding="utf-8") as completed_file:
+        completed_file.write(partial)
+
+
+def test_records_after_a_partial_line_survive_later_resumes(tmp_path):
+    journal = IngestionJournal(str(tmp_path))
+    journal.record(record("CVE-1"))
+    crash_mid_write(journal, '{"cve_id": "CVE-2", "prod')
+
+    resumed = IngestionJournal(str(tmp_path))
+    assert resumed.completed == {"CVE-1"}
+    resumed.record(record("CVE-3"))
+    resumed.close()
+
+    again = IngestionJournal(str(tmp_path))
+    assert again.completed == {"CVE-1", "CVE-3"}
+    assert [entry['cve_id'] for entry in again.replay()] == ["CVE-1", "CVE-3"]
+    again.close()
+
+
+def test_damaged_lines_are_skipped(tmp_path):
+    journal = IngestionJournal(str(tmp_path))
+    journal.record(record("CVE-1"))
+    crash_mid_write(journal, "not json\n")
+    with open(journal.completed_path, "a", encoding="utf-8") as completed_file:
+        completed_file.write('{"cve_id": "CVE-2"}\n')
+
+    resumed = IngestionJournal(str(tmp_path))
+    assert resumed.completed == {"CVE-1", "CVE-2"}
+    resumed.close()
@@ -0,0 +1,22 @@
+""" Exit status of the ingestion entry point """
+from click.testing import CliRunner
+
+import main
+from data import generate
+
+
+def test_an_incomplete_load_exits_non_zero(monkeypatch):
+    def job(resume=False):
+        raise generate.IncompleteLoadError("Incomplete load: 3 failed writes, 0 failed lookups")
+
+    monkeypatch.setitem(main.OPTIONS["vuln"], "function", job)
+    result = CliRunner().invoke(main.entry_point, ["vuln", "test"])
+
+    assert result.exit_code != 0
+    assert "3 failed writes" in result.output
+
+
+def test_a_clean_load_exits_zero(monkeypatch):
+    monkeypatch.setitem(main.OPTIONS["vuln"], "function", lambda resume=False: None)
+
+    assert CliRunner().invoke(main.entry_point, ["vuln", "test"]).exit_code == 0
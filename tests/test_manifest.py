@@ -0,0 +1,63 @@
+""" Write manifest bound to the table it was written for """
+import copy
+
+from moto import mock_dynamodb
+
+from data.manifest import WriteManifest
+from dynamodb.dynamodb import REGISTRY, DynamoDB, open_table
+
+ITEM = {"hashKey": "CVE-1", "sortKey": "cve#details", "summary": "s"}
+
+
+def save_manifest(path, table, items):
+    manifest = WriteManifest.from_config({"path": str(path)}, table=table)
+    manifest.filter(items)
+    manifest.save()
+
+
+def test_unchanged_items_are_skipped_on_the_same_table(dynamo_table, tmp_path):
+    save_manifest(tmp_path / "manifest.json.gz", dynamo_table, [ITEM])
+
+    manifest = WriteManifest.from_config({"path": str(tmp_path / "manifest.json.gz")}, table=dynamo_table)
+
+    assert manifest.filter([ITEM]) == []
+
+
+def test_manifest_is_discarded_for_a_recreated_table(table_config, tmp_path):
+    path = tmp_path / "manifest.json.gz"
+    with mock_dynamodb():
+        REGISTRY.clear()
+        table = open_table(table_config, "SampleTable")
+        table.ensure_table()
+        save_manifest(path, table, [ITEM])
+    with mock_dynamodb():
+        REGISTRY.clear()
+        table = open_table(table_config, "SampleTable")
+        table.ensure_table()
+        manifest = WriteManifest.from_config({"path": str(path)}, table=table)
+    REGISTRY.clear()
+
+    assert manifest.previous == {}
+    assert manifest.filter([ITEM]) == [ITEM]
+
+
+def test_changing_the_write_encoding_rewrites_items(dynamo_table, table_config, tmp_path):
+    path = tmp_path / "manifest.json.gz"
+    save_manifest(path, dynamo_table, [ITEM])
+    config = copy.deepcopy(table_config)
+    config['tables']['SampleTable']['sourceSharding']['shards'] = 4
+
+    manifest = WriteManifest.from_config({"path": str(path)}, table=DynamoDB(config, "SampleTable"))
+
+    assert manifest.filter([ITEM]) == [ITEM]
+    assert manifest.removed() == []
+
+
+def test_deleted_items_are_written_again_when_they_come_back(dynamo_table, tmp_path):
+    save_manifest(tmp_path / "manifest.json.gz", dynamo_table, [ITEM])
+
+    manifest = WriteManifest.from_config({"path": str(tmp_path / "manifest.json.gz")}, table=dynamo_table)
+    manifest.forget([{"hashKey": "CVE-1", "sortKey": "cve#details"}])
+    manifest.carry_over()
+
+    assert manifest.filter([ITEM]) == [ITEM]
@@ -0,0 +1,50 @@
+""" CloudWatch EMF export of the DynamoDB metrics """
+import io
+import json
+
+import pytest
+
+from dynamodb.metrics import EMFSink, MetricsRegistry
+
+
+class Stats:
+    def __init__(self, **stats):
+        self.values = stats
+
+    def stats(self):
+        return dict(self.values)
+
+
+def flush(registry, stream):
+    stream.seek(0)
+    stream.truncate()
+    registry.flush()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_emf_emits_the_increase_since_the_previous_flush():
+    registry = MetricsRegistry()
+    stream = io.StringIO()
+    registry.add_sink(EMFSink(stream=stream))
+    cache = Stats(hits=3, misses=1, coalesced=0, evictions=0, invalidations=0, entries=1, hitRatio=0.75)
+    registry.add_cache("api", cache)
+    for _ in range(3):
+        registry.observe("Query", "SampleTable", 0.002, items=10,
+                         consumed={"TableName": "SampleTable", "CapacityUnits": 1.5})
+
+    first = flush(registry, stream)
+    registry.observe("Query", "SampleTable", 0.4, items=2, consumed={"TableName": "SampleTable", "CapacityUnits": 0.5})
+    cache.values.update(hits=4, misses=3, entries=3)
+    second = flush(registry, stream)
+    third = flush(registry, stream)
+
+    query, capacity, api = first
+    assert (query["Calls"], query["Items"], capacity["ConsumedReadCapacityUnits"]) == (3, 30, 4.5)
+    assert api["HitRatio"] == 75
+    query, capacity, api = second
+    assert (query["Calls"], query["Items"], capacity["ConsumedReadCapacityUnits"]) == (1, 2, 0.5)
+    assert query["LatencyP50"] > 100
+    assert (api["Hits"], api["Misses"], api["Entries"]) == (1, 2, 3)
+    assert api["HitRatio"] == pytest.approx(100 / 3)
+    assert [record.get("Cache") for record in third] == ["api"]
+    assert third[0]["Hits"] == 0
@@ -0,0 +1,63 @@
+""" Incremental parsing of the NVD JSON feeds """
+import gzip
+import io
+import json
+
+import pytest
+
+from data import nvd_feed
+from data.nvd_feed import iter_feed_items, load_nvd_lookup
+
+
+def feed_item(cve_id, cpe):
+    return {
+        "cve": {
+            "id": cve_id,
+            "sourceIdentifier": "nvd@nist.gov",
+            "published": "2023-10-10T01:15:00.000",
+            "lastModified": "2023-10-12T08:00:00.000",
+            "descriptions": [{"lang": "es", "value": "resumen"}, {"lang": "en", "value": f"summary of {cve_id}"}],
+            "configurations": [{"nodes": [{"cpeMatch": [
+                {"vulnerable": True, "criteria": cpe},
+                {"vulnerable": False, "criteria": "cpe:2.3:o:linux:linux_kernel:-:*:*:*:*:*:*:*"}]}]}]
+        }
+    }
+
+
+FEED = {"resultsPerPage": 3, "format": "NVD_CVE", "vulnerabilities": [
+    feed_item("CVE-2023-0001", "cpe:2.3:a:apache:http_server:2.4.1:*:*:*:*:*:*:*"),
+    feed_item("CVE-2023-0002", "cpe:2.3:a:openbsd:openssh:9.0:*:*:*:*:*:*:*"),
+    feed_item("CVE-2023-0003", "cpe:2.3:a:gnu:glibc:2.38:*:*:*:*:*:*:*"),
+]}
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1 << 20])
+def test_items_straddling_chunk_boundaries_are_decoded(monkeypatch, chunk_size):
+    monkeypatch.setattr(nvd_feed, "READ_CHUNK_SIZE", chunk_size)
+
+    items = list(iter_feed_items(io.StringIO(json.dumps(FEED, indent=2))))
+
+    assert items == FEED["vulnerabilities"]
+
+
+def test_a_truncated_feed_is_an_error(monkeypatch):
+    monkeypatch.setattr(nvd_feed, "READ_CHUNK_SIZE", 16)
+
+    with pytest.raises(ValueError):
+        list(iter_feed_items(io.StringIO(json.dumps(FEED)[:-40])))
+
+
+def test_lookup_keeps_only_the_wanted_cves(tmp_path):
+    with gzip.open(tmp_path / "nvdcve-2.0-2023.json.gz", "wt", encoding="utf-8") as feed:
+        json.dump(FEED, feed)
+
+    lookup = load_nvd_lookup(str(tmp_path / "nvdcve-*.json.gz"), wanted={"CVE-2023-0002", "CVE-2099-0001"})
+
+    assert lookup == {"CVE-2023-0002": {
+        "id": "CVE-2023-0002",
+        "assigner": "nvd@nist.gov",
+        "Published": "2023-10-10T01:15:00",
+        "last-modified": "2023-10-12T08:00:00",
+        "summary": "summary of CVE-2023-0002",
+        "vulnerable_product": ["cpe:2.3:a:openbsd:openssh:9.0:*:*:*:*:*:*:*"],
+    }}
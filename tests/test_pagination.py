@@ -0,0 +1,80 @@
+""" Cursors of the connections, which clients hand back as opaque strings """
+import copy
+
+import pytest
+from graphql import GraphQLError
+
+from api.pagination import encode_cursor, paginate
+from dynamodb.dynamodb import DynamoDB
+from dynamodb.sqlite_backend import SQLiteBackend
+
+FORGED = "eyJ4Ijp7fX0="  # {"x": {}}
+
+
+def page(table, first=None, after=None, source="cve#epss"):
+    return paginate(lambda **options: table.iter_source(source, **options), lambda item: item["hashKey"],
+                    first, after)
+
+
+def nodes(connection):
+    return [edge["node"] for edge in connection["edges"]]
+
+
+@pytest.fixture
+def sharded_table(dynamo_table, table_config):
+    config = copy.deepcopy(table_config)
+    config['tables']['SampleTable']['sourceSharding']['readFromShards'] = True
+    table = DynamoDB(config, "SampleTable")
+    table.batch_put([{"hashKey": f"CVE-{index}", "sortKey": "cve#epss"} for index in range(6)])
+    return table
+
+
+@pytest.fixture
+def sqlite_table(table_config, tmp_path):
+    table = SQLiteBackend(table_config, "SampleTable", str(tmp_path / "table.sqlite"))
+    table.batch_put([{"hashKey": f"CVE-{index}", "sortKey": "cve#epss"} for index in range(6)])
+    return table
+
+
+@pytest.mark.parametrize("cursor", [
+    FORGED,
+    encode_cursor({"hashKey": "CVE-1"}),
+    encode_cursor({"hashKey": "CVE-1", "sortKey": "cve#details"}),
+    encode_cursor({"hashKey": {"S": "CVE-1"}, "sortKey": "cve#epss"}),
+])
+def test_sqlite_rejects_cursors_of_other_listings(sqlite_table, cursor):
+    with pytest.raises(GraphQLError, match="Invalid cursor"):
+        page(sqlite_table, after=cursor)
+
+
+def test_sqlite_resumes_from_its_own_cursor(sqlite_table):
+    first = page(sqlite_table, first=2)
+
+    assert nodes(page(sqlite_table, after=first["pageInfo"]["endCursor"])) == ["CVE-2", "CVE-3", "CVE-4", "CVE-5"]
+
+
+def test_sharded_listing_rejects_forged_cursors(sharded_table):
+    shard = sharded_table.shard_key("cve#epss", 0)
+    position = {"hashKey": "CVE-1", "sortKey": "cve#epss", "sourceShard": shard}
+    other_shard = {sharded_table.shard_key("cve#epss", 1): position}
+
+    for cursor in (FORGED, encode_cursor({shard: {}}), encode_cursor(other_shard),
+                   encode_cursor({"hashKey": "CVE-1", "sortKey": "cve#epss"})):
+        with pytest.raises(GraphQLError, match="Invalid cursor"):
+            page(sharded_table, after=cursor)
+
+
+def test_sharded_listing_resumes_from_its_own_cursor(sharded_table):
+    first = page(sharded_table, first=2)
+    rest = page(sharded_table, after=first["pageInfo"]["endCursor"])
+
+    assert sorted(nodes(first) + nodes(rest)) == [f"CVE-{index}" for index in range(6)]
+
+
+def test_legacy_listing_rejects_cursors_of_the_sharded_listing(sharded_table, dynamo_table):
+    cursor = page(sharded_table, first=2)["pageInfo"]["endCursor"]
+
+    with pytest.raises(GraphQLError, match="Invalid cursor"):
+        page(dynamo_table, after=cursor)
+    with pytest.raises(GraphQLError, match="Invalid cursor"):
+        page(dynamo_table, after=FORGED)
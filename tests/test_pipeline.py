@@ -0,0 +1,85 @@
+""" Fan-out of the full load to the S3 and DynamoDB sinks """
+import os
+
+import pyarrow as pa
+import pytest
+
+from data.pipeline import DynamoDBSink, ParquetSink, fan_out
+from dynamodb.backend import BulkWriteResult
+from s3.s3 import ParquetUpload
+
+SCHEMA = pa.schema([("hashKey", pa.string()), ("sortKey", pa.string())])
+
+
+class Uploader:
+    def __init__(self):
+        self.uploads = []
+
+    def upload_file(self, path, destination):
+        self.uploads.append((destination, os.path.getsize(path)))
+
+
+class Table:
+    def __init__(self):
+        self.batches = []
+
+    def batch_put(self, items):
+        self.batches.append(items)
+        return BulkWriteResult(written=len(items))
+
+
+def items(count, fail_at=None):
+    for index in range(count):
+        if index == fail_at:
+            raise RuntimeError("enrichment failed")
+        yield {"hashKey": f"CVE-{index}", "sortKey": "cve#details"}
+
+
+def sinks(uploader, table):
+    upload = ParquetUpload(uploader, "EPSS/findings/vulnerability_data.parquet", SCHEMA)
+    return upload, [ParquetSink(upload, SCHEMA, batch_rows=4), DynamoDBSink(table, batch_size=4, max_workers=1)]
+
+
+def test_a_complete_load_is_uploaded_and_written():
+    uploader, table = Uploader(), Table()
+    upload, load_sinks = sinks(uploader, table)
+
+    assert fan_out(items(10), load_sinks, maxsize=2) == 10
+
+    assert [destination for destination, _ in uploader.uploads] == [upload.destination]
+    assert sum(len(batch) for batch in table.batches) == 10
+    assert not os.path.exists(upload.path)
+
+
+def test_a_failing_producer_aborts_the_sinks():
+    uploader, table = Uploader(), Table()
+    upload, load_sinks = sinks(uploader, table)
+
+    with pytest.raises(RuntimeError, match="enrichment failed"):
+        fan_out(items(10, fail_at=6), load_sinks, maxsize=2)
+
+    assert uploader.uploads == []
+    assert not os.path.exists(upload.path)
+    assert sum(len(batch) for batch in table.batches) == 4
+
+
+def test_a_failing_sink_is_aborted_without_blocking_the_others():
+    class BrokenSink:
+        aborted = False
+
+        def write(self, item):
+            raise ValueError("disk full")
+
+        def close(self):
+            raise AssertionError("a failed sink must not be closed")
+
+        def abort(self):
+            self.aborted = True
+
+    broken, table = BrokenSink(), Table()
+
+    with pytest.raises(ValueError, match="disk full"):
+        fan_out(items(10), [broken, DynamoDBSink(table, batch_size=4, max_workers=1)], maxsize=2)
+
+    assert broken.aborted
+    assert sum(len(batch) for batch in table.batches) == 10
@@ -0,0 +1,173 @@
+""" AIMD window, Retry-After and backoff of the upstream rate controller """
+import asyncio
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+import backoff
+import pytest
+
+from data import ratelimit
+from data.ratelimit import SLOT_POLL_INTERVAL, RateController, retry_after_seconds
+
+
+class FakeClock:
+    """ Stands in for the time module; sleeping advances the clock """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def controller(**options):
+    return RateController(**{"rate": 1000, "initial_concurrency": 8, "cooldown": 1.0, **options})
+
+
+def test_window_limits_the_requests_in_flight(clock):
+    limiter = controller(initial_concurrency=2)
+
+    assert [limiter.try_acquire() for _ in range(3)] == [0, 0, SLOT_POLL_INTERVAL]
+    limiter.release(throttled=False)
+    assert limiter.try_acquire() == 0
+
+
+def test_successes_grow_the_window_by_one_slot_per_window(clock):
+    limiter = controller(initial_concurrency=4)
+
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release(throttled=False)
+
+    assert 4.9 < limiter.stats.concurrency < 5
+
+
+def test_throttles_shrink_the_window_once_per_cooldown(clock):
+    limiter = controller(initial_concurrency=8, min_concurrency=3)
+
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(throttled=True)
+    assert limiter.stats.concurrency == 4
+    clock.now += 1.0
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.stats.concurrency == 3
+    assert limiter.stats.throttled == 4
+
+
+def test_token_bucket_paces_requests_past_the_burst(clock):
+    limiter = controller(rate=10, burst=2)
+
+    assert [limiter.try_acquire() for _ in range(3)] == [0, 0, pytest.approx(0.1)]
+    clock.now += 0.1
+    assert limiter.try_acquire() == 0
+
+
+def test_retry_after_pauses_every_caller(clock):
+    limiter = controller()
+    limiter.acquire()
+
+    limiter.release(throttled=True, retry_after=3)
+
+    assert limiter.try_acquire() == pytest.approx(3)
+    clock.now += 3
+    assert limiter.try_acquire() == 0
+
+
+def test_retry_after_is_read_as_seconds_or_http_date(clock):
+    date = format_datetime(datetime.fromtimestamp(clock.now + 30, timezone.utc), usegmt=True)
+
+    assert retry_after_seconds({"Retry-After": "12"}) == 12
+    assert retry_after_seconds({"Retry-After": date}) == pytest.approx(30)
+    assert retry_after_seconds({"Retry-After": "soon"}) is None
+    assert retry_after_seconds({}) is None
+
+
+def test_throttled_attempts_are_retried_with_jittered_exponential_backoff(clock, monkeypatch):
+    monkeypatch.setattr(backoff, "full_jitter", lambda value: value / 2)
+    responses = iter([Response(503), Response(429), Response(429, {"Retry-After": "5"}), Response(200)])
+    limiter = controller(max_tries=5)
+
+    response = limiter.request(lambda: next(responses))
+
+    assert response.status_code == 200
+    assert clock.sleeps == [0.25, 0.5, 5]
+    assert limiter.stats.retries == 3
+
+
+def test_full_jitter_stays_below_the_exponential_delay(clock):
+    limiter = controller(max_tries=6)
+
+    limiter.request(lambda: Response(500))
+
+    assert len(clock.sleeps) == 5
+    assert all(0 <= delay <= 0.5 * 2 ** attempt for attempt, delay in enumerate(clock.sleeps))
+    assert limiter.stats.failures == 1
+
+
+def test_timeouts_are_retried_and_raised_after_the_last_attempt(clock):
+    limiter = controller(max_tries=2)
+
+    def send():
+        raise TimeoutError()
+
+    with pytest.raises(TimeoutError):
+        limiter.request(send, retry_on=(TimeoutError,))
+    assert limiter.stats.retries == 1
+
+
+def test_interrupted_requests_do_not_count_as_successes(clock):
+    limiter = controller(initial_concurrency=4)
+
+    def send():
+        raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        limiter.request(send)
+
+    assert limiter.stats.concurrency == 4
+    assert [limiter.try_acquire() for _ in range(5)] == [0, 0, 0, 0, SLOT_POLL_INTERVAL]
+
+
+def test_cancelled_async_requests_do_not_count_as_successes(clock):
+    limiter = controller(initial_concurrency=4)
+
+    async def main():
+        started = asyncio.Event()
+
+        async def send():
+            started.set()
+            await asyncio.Event().wait()
+
+        task = asyncio.ensure_future(limiter.request_async(send))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    assert limiter.stats.concurrency == 4
+    assert limiter.try_acquire() == 0
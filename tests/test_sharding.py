@@ -0,0 +1,37 @@
+""" Source listings of a table loaded before write sharding was configured """
+import copy
+
+from dynamodb.dynamodb import DynamoDB
+
+
+def put_legacy_items(table, count):
+    """ Items as the loader wrote them before sourceSharding, i.e. without sourceShard """
+    for index in range(count):
+        table.client.put_item(TableName=table.table_name, Item={
+            "hashKey": {"S": f"CVE-{index:03d}"}, "sortKey": {"S": "cve#epss"}, "epss": {"S": "0.1"}})
+
+
+def listed_keys(table):
+    return sorted(item["hashKey"] for item in table.iter_source("cve#epss"))
+
+
+def test_legacy_items_are_listed_until_shard_reads_are_enabled(dynamo_table):
+    put_legacy_items(dynamo_table, 20)
+
+    assert not dynamo_table.shard_reads
+    assert len(listed_keys(dynamo_table)) == 20
+
+
+def test_backfill_moves_legacy_items_into_the_shards(dynamo_table, table_config):
+    # moto ignores Segment, so a single segment keeps the written count exact
+    put_legacy_items(dynamo_table, 20)
+
+    result = dynamo_table.backfill_source_shards(batch_size=7, total_segments=1)
+
+    assert result.written == 20
+    config = copy.deepcopy(table_config)
+    config['tables']['SampleTable']['sourceSharding']['readFromShards'] = True
+    sharded = DynamoDB(config, "SampleTable")
+    assert sharded.shard_reads
+    assert listed_keys(sharded) == [f"CVE-{index:03d}" for index in range(20)]
+    assert sharded.backfill_source_shards(total_segments=1).written == 0
@@ -0,0 +1,103 @@
+""" Condition translation and keyset paging of the embedded SQLite backend """
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.conditions import Attr, Key
+
+from dynamodb.backend import StorageBackend
+from dynamodb.dynamodb import SOURCE_INDEX
+from dynamodb.sqlite_backend import SQLiteBackend
+
+SHARD_INDEX = "AssessmentBySourceShardIndex"
+
+
+def details(cve, shard, **attributes):
+    return {"hashKey": cve, "sortKey": "cve#details", "sourceShard": f"cve#details#{shard:02d}", **attributes}
+
+
+@pytest.fixture
+def table(table_config, tmp_path):
+    table = SQLiteBackend(table_config, "SampleTable", str(tmp_path / "table.sqlite"))
+    table.ensure_table()
+    table.batch_put([
+        details("CVE-2023-0001", 1, summary="heap overflow in libfoo", score=Decimal("7.5"), cpes=["a", "b"]),
+        details("CVE-2023-0002", 2, summary="use after free", score=Decimal("9"), cpes=["c"]),
+        details("CVE-2023-0003", 1, summary="overflow in bar", cpes=["b"]),
+        details("CVE-2024-0001", 1, summary="path traversal"),
+        {"hashKey": "CVE-2023-0001", "sortKey": "cve#epss", "epss": "0.1"},
+        {"hashKey": "libfoo", "sortKey": "product#cve", "cve_list": ["CVE-2023-0001"]},
+    ])
+    return table
+
+
+def keys(items):
+    return [item["hashKey"] for item in items]
+
+
+def test_put_and_batch_get_with_projection(table):
+    table.put_item(details("CVE-2023-0002", 2, summary="replaced"))
+
+    items = table.batch_get([("CVE-2023-0002", "cve#details"), {"hashKey": "CVE-2023-0001", "sortKey": "cve#details"},
+                             ("CVE-2023-0002", "cve#details"), ("CVE-1999-0001", "cve#details")],
+                            projection_expression="#s, score", expression_attribute_names={"#s": "summary"})
+
+    assert items == {
+        ("CVE-2023-0002", "cve#details"): {"hashKey": "CVE-2023-0002", "sortKey": "cve#details", "summary": "replaced"},
+        ("CVE-2023-0001", "cve#details"): {"hashKey": "CVE-2023-0001", "sortKey": "cve#details",
+                                          "summary": "heap overflow in libfoo", "score": Decimal("7.5")},
+    }
+
+
+def test_query_by_key_with_begins_with_in_both_orders(table):
+    condition = Key("hashKey").eq("CVE-2023-0001") & Key("sortKey").begins_with("cve#")
+
+    assert [item["sortKey"] for item in table.query(condition)] == ["cve#details", "cve#epss"]
+    assert [item["sortKey"] for item in table.query(condition, scan_index_forward=False)] == ["cve#epss", "cve#details"]
+
+
+def test_query_by_index_with_begins_with_and_contains_filters(table):
+    shard = Key("sourceShard").eq("cve#details#01")
+
+    assert keys(table.query(shard, index_name=SHARD_INDEX)) == ["CVE-2023-0001", "CVE-2023-0003", "CVE-2024-0001"]
+    assert keys(table.query(shard & Key("hashKey").begins_with("CVE-2023"), index_name=SHARD_INDEX)) == [
+        "CVE-2023-0001", "CVE-2023-0003"]
+    assert keys(table.query(shard, Attr("cpes").contains("b"), index_name=SHARD_INDEX)) == [
+        "CVE-2023-0001", "CVE-2023-0003"]
+    assert keys(table.query(shard, Attr("summary").contains("overflow") & Attr("score").gte(Decimal("7")),
+                            index_name=SHARD_INDEX)) == ["CVE-2023-0001"]
+    assert keys(table.query(Key("sortKey").eq("cve#details"), Attr("score").not_exists(),
+                            index_name=SOURCE_INDEX)) == ["CVE-2023-0003", "CVE-2024-0001"]
+
+
+def test_scan_yields_pages_matching_the_filter(table):
+    pages = list(table.iter_scan(filter_expression=Attr("sortKey").is_in(["cve#epss", "product#cve"])
+                                 | Attr("score").between(Decimal("8"), Decimal("10")), limit=2))
+
+    assert [keys(page) for page in pages] == [["CVE-2023-0001", "CVE-2023-0002"], ["libfoo"]]
+    assert len(table.scan()) == 6
+
+
+def test_source_listing_resumes_from_its_last_evaluated_key(table):
+    first = table.iter_source("cve#details", limit=2, page_size=1, projection_expression="summary")
+    first_items = list(first)
+    rest = table.iter_source("cve#details", exclusive_start_key=first.last_evaluated_key, page_size=1)
+
+    assert first_items[0] == {"hashKey": "CVE-2023-0001", "sortKey": "cve#details",
+                              "summary": "heap overflow in libfoo"}
+    assert first.last_evaluated_key == {"hashKey": "CVE-2023-0002", "sortKey": "cve#details"}
+    assert keys(first_items) + keys(rest) == ["CVE-2023-0001", "CVE-2023-0002", "CVE-2023-0003", "CVE-2024-0001"]
+    assert rest.last_evaluated_key is None
+
+
+def test_unsupported_conditions_name_the_operator(table):
+    with pytest.raises(ValueError, match="attribute_type"):
+        table.query(Key("hashKey").eq("CVE-2023-0001"), Attr("summary").attribute_type("S"))
+
+
+def test_a_backend_missing_an_operation_cannot_be_created():
+    class PartialBackend(StorageBackend):
+        def ensure_table(self, full=None):
+            return self
+
+    with pytest.raises(TypeError, match="batch_get"):
+        PartialBackend()